@@ -0,0 +1,383 @@
+"""
+Benchmark suite for dyspyosis.
+
+Runs every stage of the pipeline on synthetic count tables of different shapes and writes the results as JSON.
+A second run can be compared against a stored baseline to flag regressions.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output current.json
+    python benchmark.py compare baseline.json current.json
+
+Use --cpu to hide GPUs from TensorFlow and --quick for a fast smoke test with small tables.
+
+Every case also times two references on the same table: a per-read loop rarefying one sample at a time (the
+implementation the vectorized rarefy replaced) and the expanded dataset built from a dense and from a sparse copy.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+
+# name: (samples, features, density, depth, sparse)
+CASES = {
+    "small": (100, 40, 1.0, 5000, False),
+    "tall": (10000, 100, 1.0, 5000, False),
+    "wide": (1000, 2000, 0.05, 5000, False),
+    "wide_sparse": (1000, 2000, 0.05, 5000, True),
+    "deep": (1000, 200, 1.0, 100000, False),
+}
+
+QUICK_CASES = {
+    "small": (100, 40, 1.0, 5000, False),
+    "wide_sparse": (200, 400, 0.05, 5000, True),
+}
+
+# Whether a higher value of a metric is better, metrics not listed here are not compared
+HIGHER_IS_BETTER = {
+    "rarefy_s": False,
+    "build_dataset_s": False,
+    "build_dataset_peak_mb": False,
+    "setup_s": False,
+    "setup_peak_mb": False,
+    "train_rows_per_s": True,
+    "train_graph_rows_per_s": True,
+    "train_xla_rows_per_s": True,
+    "compute_loss_s": False,
+    "get_latent_s": False,
+    "training_data_mb": False,
+    "rarefy_loop_speedup": True,
+    "expand_dense_s": False,
+    "expand_dense_mb": False,
+    "expand_sparse_s": False,
+    "expand_sparse_mb": False,
+}
+
+
+def synthetic_counts(samples, features, density=1.0, depth=5000, sparse=False, seed=0):
+    """
+    Generates a count table resembling microbiome data.
+
+    Per sample feature proportions are drawn from a gamma distribution (a few abundant, many rare features), a
+    fraction of 1 - density of the entries is set to zero and the library sizes are log-normal around twice the
+    rarefication depth, but never below it.
+
+    Parameters:
+    -----------
+    samples, features : int
+        Shape of the table.
+    density : float
+        Fraction of nonzero entries, before sampling.
+    depth : int
+        The rarefication depth the table is meant for.
+    sparse : bool
+        Return a scipy.sparse CSR matrix instead of a dense array.
+    seed : int
+        Seed for the random number generator.
+
+    Returns:
+    --------
+    counts : numpy.ndarray or scipy.sparse.csr_matrix
+        An integer array of shape (samples, features).
+    """
+    prng = np.random.default_rng(seed)
+
+    proportions = prng.gamma(0.3, size=(samples, features))
+    if density < 1:
+        proportions[prng.random(proportions.shape) > density] = 0
+    proportions[:, 0] += 1e-3
+    proportions /= proportions.sum(axis=1, keepdims=True)
+
+    library_sizes = np.round(prng.lognormal(np.log(2 * depth), 0.3, samples))
+    library_sizes = np.maximum(library_sizes, depth)
+    counts = prng.multinomial(library_sizes.astype(np.int64), proportions)
+
+    return sp.csr_matrix(counts) if sparse else counts
+
+
+def rarefy_loop(data, depth, seed=0):
+    """
+    Reference rarefaction drawing every read individually, one sample at a time.
+    """
+    prng = np.random.default_rng(seed)
+    noccur = np.sum(data, axis=1)
+    rarefied = np.empty(data.shape)
+    for i in range(data.shape[0]):
+        choice = prng.choice(data.shape[1], depth, p=data[i] / float(noccur[i]))
+        rarefied[i] = np.bincount(choice, minlength=data.shape[1])
+
+    return rarefied
+
+
+def nbytes(matrix):
+    if sp.issparse(matrix):
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return matrix.nbytes
+
+
+def timed(fn, repeats=1):
+    """
+    Runs fn repeats times, returning the last result and the fastest time in seconds.
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    return result, best
+
+
+def traced(fn):
+    """
+    Runs fn once, returning its result, the time in seconds and the peak memory allocated by Python and NumPy in MB.
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, elapsed, peak / 2**20
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def run_case(spec, iterations=10, epochs=3, batch_size=64, repeats=3):
+    """
+    Benchmarks the stages of the pipeline on one synthetic table.
+
+    Returns:
+    --------
+    results : dict
+        Seconds per stage (fastest of repeats), peak memory in MB, training throughput in rows per second, the
+        size of the training data and the reference timings.
+    """
+    from dyspyosis import Dyspyosis
+    from dyspyosis.utils import build_dataset, rarefy, scale_data
+
+    samples, features, density, depth, sparse = spec
+    data = synthetic_counts(samples, features, density, depth, sparse)
+    results = {}
+
+    _, results["rarefy_s"] = timed(lambda: rarefy(data, depth), repeats)
+
+    dense = data.toarray() if sparse else data
+    _, results["rarefy_loop_s"] = timed(lambda: rarefy_loop(dense, depth))
+    results["rarefy_loop_speedup"] = results["rarefy_loop_s"] / results["rarefy_s"]
+
+    # The scaled training data of the same table, stored dense and sparse
+    for layout, table in (("dense", dense), ("sparse", sp.csr_matrix(dense))):
+        output, results[f"expand_{layout}_s"] = timed(
+            lambda table=table: scale_data(
+                build_dataset(table, depth, iterations), depth
+            )
+        )
+        results[f"expand_{layout}_mb"] = nbytes(output) / 2**20
+        del output
+
+    _, results["build_dataset_s"], results["build_dataset_peak_mb"] = traced(
+        lambda: build_dataset(data, depth, iterations)
+    )
+
+    dyspyosis, results["setup_s"], results["setup_peak_mb"] = traced(
+        lambda: Dyspyosis(
+            data,
+            rarefication_depth=depth,
+            rarefication_count=iterations,
+        )
+    )
+    results["training_data_mb"] = (
+        dyspyosis.memory_usage()[["x_train", "x_test"]].sum() / 2**20
+    )
+
+    # The first epoch includes tracing and compiling the model, it isn't counted. The compiled engines only
+    # support dense data.
+    for engine, metric in (
+        ("fit", "train_rows_per_s"),
+        ("graph", "train_graph_rows_per_s"),
+        ("xla", "train_xla_rows_per_s"),
+    ):
+        results[metric] = None
+        if engine != "fit" and sparse:
+            continue
+        dyspyosis.run_training(epochs=1, batch_size=batch_size, engine=engine)
+        report = dyspyosis.run_training(
+            epochs=epochs, batch_size=batch_size, engine=engine
+        )
+        rows = dyspyosis.x_train.shape[0] * report["epochs"]
+        results[metric] = rows / report["wall_time"]
+
+    _, results["compute_loss_s"] = timed(dyspyosis.compute_loss, repeats)
+    _, results["get_latent_s"] = timed(dyspyosis.get_latent, repeats)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    return results
+
+
+def metadata(args):
+    import tensorflow as tf
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "tensorflow": tf.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "gpus": [d.name for d in tf.config.list_physical_devices("GPU")],
+        "settings": {
+            "quick": args.quick,
+            "iterations": args.iterations,
+            "epochs": args.epochs,
+            "batch_size": args.batch_size,
+            "repeats": args.repeats,
+        },
+    }
+
+
+def run(args):
+    cases = QUICK_CASES if args.quick else CASES
+    if args.cases:
+        unknown = set(args.cases) - set(cases)
+        if unknown:
+            sys.exit(f"Unknown cases: {', '.join(sorted(unknown))}")
+        cases = {name: cases[name] for name in args.cases}
+
+    output = {"meta": metadata(args), "cases": {}, "results": {}}
+    for name, spec in cases.items():
+        print(f"Running {name}: {spec[0]} samples x {spec[1]} features, ", end="")
+        print(f"{spec[2]:.0%} nonzero, depth {spec[3]}{', sparse' if spec[4] else ''}")
+
+        output["cases"][name] = dict(
+            zip(("samples", "features", "density", "depth", "sparse"), spec)
+        )
+        output["results"][name] = run_case(
+            spec,
+            iterations=args.iterations,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            repeats=args.repeats,
+        )
+
+        for metric, value in output["results"][name].items():
+            if value is not None:
+                print(f"  {metric:<24}{value:12.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares two benchmark results.
+
+    Parameters:
+    -----------
+    baseline, current : dict
+        Results as written by the run command.
+    threshold : float
+        Relative change (e.g. 0.1 for 10%) beyond which a metric counts as a regression or improvement.
+
+    Returns:
+    --------
+    rows : list of tuple
+        (case, metric, baseline value, current value, relative change, status) for every metric in both results,
+        the status is "regression", "improved" or "ok". The relative change is positive when the current run is
+        better.
+    """
+    rows = []
+    for case, results in current["results"].items():
+        reference = baseline["results"].get(case, {})
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            old, new = reference.get(metric), results.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+
+            change = (new - old) / old
+            if not higher_is_better:
+                change = -change
+
+            if change < -threshold:
+                status = "regression"
+            elif change > threshold:
+                status = "improved"
+            else:
+                status = "ok"
+            rows.append((case, metric, old, new, change, status))
+
+    return rows
+
+
+def run_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    for case, metric, old, new, change, status in rows:
+        print(f"{case:<14}{metric:<24}{old:12.4f}{new:12.4f}{change:+9.1%}  {status}")
+
+    regressions = [row for row in rows if row[-1] == "regression"]
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}.")
+
+    if regressions:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--output", "-o", help="JSON file to write results to")
+    run_parser.add_argument("--cases", nargs="+", help="Only run these cases")
+    run_parser.add_argument("--quick", action="store_true", help="Small tables only")
+    run_parser.add_argument("--cpu", action="store_true", help="Hide GPUs")
+    run_parser.add_argument("--iterations", type=int, default=10)
+    run_parser.add_argument("--epochs", type=int, default=3)
+    run_parser.add_argument("--batch-size", type=int, default=64)
+    run_parser.add_argument("--repeats", type=int, default=3)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if args.cpu:
+            # Has to be set before TensorFlow is loaded
+            os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+            os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
+        run(args)
+    else:
+        run_compare(args)
+
+
+if __name__ == "__main__":
+    main()
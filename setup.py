@@ -18,8 +18,9 @@ setup(
     install_requires=[
         "numpy>=2.0.0",
         "pandas>=2.2.0",
-        "scikit-learn>=1.5.0",
+        "scipy>=1.13.0",
         "tensorflow>=2.16.0",
+        "threadpoolctl>=3.0.0",
     ],
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -32,4 +33,7 @@ setup(
     packages=find_packages("src"),
     package_dir={"": "src"},
     python_requires=">=3.10",
+    entry_points={
+        "console_scripts": ["dyspyosis-score=dyspyosis.cli:main"],
+    },
 )
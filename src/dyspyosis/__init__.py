@@ -1 +1,27 @@
-from .dyspyosis import *
+# Submodules are imported on first access, so e.g. "import dyspyosis.utils" doesn't load TensorFlow
+from importlib import import_module
+
+# Public names and the submodule defining them
+_EXPORTS = {
+    "Dyspyosis": ".dyspyosis",
+    "NumpyModel": ".inference",
+    "build_dataset": ".utils",
+    "rarefy": ".utils",
+    "scale_data": ".utils",
+    "create_autoencoder": ".autoencoder",
+    "get_latent": ".autoencoder",
+    "get_loss": ".autoencoder",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,13 +1,94 @@
-from tensorflow.keras.layers import Input, Dense
+import numpy as np
+import scipy.sparse as sp
+import tensorflow as tf
+from tensorflow.keras.layers import Input, Dense, Layer
 from tensorflow.keras.models import Model
-from tensorflow.keras import regularizers
+from tensorflow.keras import activations, initializers, ops, regularizers
 from tensorflow.keras import losses
 
+from .utils import RowSubset
 
-def create_autoencoder(input_shape, encoding_dim=4, regularization_value=10e-5):
+
+class EnsembleDense(Layer):
+    """
+    A stack of independent Dense layers, one per ensemble member, evaluated as a single batched operation.
+
+    The input is either shared by all members, shape (batch, input_dim), or holds one input per member, shape
+    (batch, members, input_dim). The output has shape (batch, members, units). Every member's kernel is drawn
+    independently from a Glorot uniform distribution, as a Dense layer would be.
+
+    Attributes:
+    -----------
+    members : int
+        The number of members.
+    units : int
+        The number of outputs per member.
+    activation : callable
+        The activation function, applied along the last axis.
+    """
+
+    def __init__(self, members, units, activation=None, **kwargs):
+        super().__init__(**kwargs)
+        self.members = members
+        self.units = units
+        self.activation = activations.get(activation)
+
+    def build(self, input_shape):
+        input_dim = input_shape[-1]
+        limit = np.sqrt(6 / (input_dim + self.units))
+        self.kernel = self.add_weight(
+            name="kernel",
+            shape=(self.members, input_dim, self.units),
+            initializer=initializers.RandomUniform(-limit, limit),
+        )
+        self.bias = self.add_weight(
+            name="bias", shape=(self.members, self.units), initializer="zeros"
+        )
+
+    def call(self, inputs):
+        if len(inputs.shape) == 2:
+            # A shared input is multiplied with all kernels side by side, this also works for sparse inputs
+            kernel = ops.reshape(
+                ops.transpose(self.kernel, (1, 0, 2)), (-1, self.members * self.units)
+            )
+            outputs = ops.reshape(
+                ops.matmul(inputs, kernel), (-1, self.members, self.units)
+            )
+        else:
+            outputs = ops.einsum("bki,kio->bko", inputs, self.kernel)
+
+        return self.activation(outputs + self.bias)
+
+    def get_config(self):
+        return {
+            **super().get_config(),
+            "members": self.members,
+            "units": self.units,
+            "activation": activations.serialize(self.activation),
+        }
+
+
+def ensemble_mse(y_true, y_pred):
+    """
+    The mean squared error of every member of an ensemble, summed over the members.
+
+    As the members share no weights, the gradient for each member is that of its own loss.
+    """
+    error = ops.square(y_pred - ops.expand_dims(y_true, 1))
+
+    return ops.sum(ops.mean(error, axis=-1), axis=-1)
+
+
+def create_autoencoder(
+    input_shape, encoding_dim=4, regularization_value=10e-5, ensemble_size=None
+):
     """
     Creates an autoencoder and its corresponding encoder and decoder models.
 
+    With ensemble_size set, the model holds that many independently initialized autoencoders, stacked in
+    EnsembleDense layers, which are trained together on the same batches. Their outputs get an extra axis for
+    the members and the training loss is the sum of their losses (see ensemble_mse).
+
     Parameters:
     -----------
     input_shape : int
@@ -16,6 +97,8 @@ def create_autoencoder(input_shape, encoding_dim=4, regularization_value=10e-5):
         The size of the encoding layer. Default is 4.
     regularization_value : float, optional
         The L1 regularization factor. Default is 1e-5.
+    ensemble_size : int, optional
+        Number of ensemble members, None for a single autoencoder. Default is None.
 
     Returns:
     --------
@@ -28,39 +111,266 @@ def create_autoencoder(input_shape, encoding_dim=4, regularization_value=10e-5):
     """
     # Setup Layers
     input_data = Input(shape=(input_shape,))
-    encoded = Dense(
-        encoding_dim,
-        activation="relu",
-        activity_regularizer=regularizers.l1(regularization_value),
-    )(input_data)
+    if ensemble_size is None:
+        encoded = Dense(
+            encoding_dim,
+            activation="relu",
+            activity_regularizer=regularizers.l1(regularization_value),
+        )(input_data)
+
+        decoded = Dense(input_shape, activation="softmax")(encoded)
+    else:
+        # The penalty is summed over the members, so each member gets its own L1 penalty
+        encoded = EnsembleDense(
+            ensemble_size,
+            encoding_dim,
+            activation="relu",
+            activity_regularizer=regularizers.l1(regularization_value),
+        )(input_data)
 
-    decoded = Dense(input_shape, activation="softmax")(encoded)
+        decoded = EnsembleDense(ensemble_size, input_shape, activation="softmax")(
+            encoded
+        )
 
     # Create Autoencoder
     autoencoder = Model(input_data, decoded)
-    autoencoder.compile(optimizer="adadelta", loss="mean_squared_error")
+    autoencoder.compile(
+        optimizer="adadelta",
+        loss="mean_squared_error" if ensemble_size is None else ensemble_mse,
+    )
 
     # Create Encoder
     encoder = Model(input_data, encoded)
 
     # Create Decoder
-    encoded_input = Input(shape=(encoding_dim,))
+    if ensemble_size is None:
+        encoded_input = Input(shape=(encoding_dim,))
+    else:
+        encoded_input = Input(shape=(ensemble_size, encoding_dim))
     decoder_layer = autoencoder.layers[-1]
     decoder = Model(encoded_input, decoder_layer(encoded_input))
 
     return autoencoder, encoder, decoder
 
 
+def create_scoring_model(autoencoder, encoder):
+    """
+    Creates a model returning both the encoder activations and the reconstruction in a single forward pass.
+
+    Parameters:
+    -----------
+    autoencoder : keras.models.Model
+        The autoencoder, as returned by create_autoencoder.
+    encoder : keras.models.Model
+        The matching encoder.
+
+    Returns:
+    --------
+    scoring_model : keras.models.Model
+        A model with outputs [latent, reconstruction], sharing its weights with the autoencoder.
+    """
+    return Model(autoencoder.inputs, [encoder.outputs[0], autoencoder.outputs[0]])
+
+
+def _to_sparse_tensor(batch):
+    batch = batch.tocoo()
+    indices = np.stack([batch.row, batch.col], axis=1).astype(np.int64)
+
+    return tf.sparse.reorder(tf.SparseTensor(indices, batch.data, batch.shape))
+
+
+def _prefetch(dataset):
+    # The tf.data autotuner makes tearing down an iterator slow, roughly as slow as the time it has been
+    # running, which would add seconds to every fit call. A small fixed prefetch buffer is enough here.
+    options = tf.data.Options()
+    options.autotune.enabled = False
+
+    return dataset.prefetch(2).with_options(options)
+
+
+def create_stream(batches, n_features, sparse=False):
+    """
+    Wraps a generator of mini-batches in a prefetching tf.data pipeline for training.
+
+    Parameters:
+    -----------
+    batches : callable
+        A function returning an iterator over float32 arrays of shape (batch_size, n_features).
+    n_features : int
+        The number of features in the input data.
+    sparse : bool, optional
+        If True, batches are scipy.sparse matrices. They are fed to the model as sparse tensors, only the target
+        is densified, one batch at a time. Default is False.
+
+    Returns:
+    --------
+    dataset : tf.data.Dataset
+        A dataset of (input, target) pairs, batches are produced on a background thread.
+    """
+    if sparse:
+        dataset = tf.data.Dataset.from_generator(
+            lambda: (_to_sparse_tensor(batch) for batch in batches()),
+            output_signature=tf.SparseTensorSpec(
+                shape=(None, n_features), dtype=tf.float32
+            ),
+        )
+        dataset = dataset.map(lambda x: (x, tf.sparse.to_dense(x)))
+    else:
+        dataset = tf.data.Dataset.from_generator(
+            batches,
+            output_signature=tf.TensorSpec(shape=(None, n_features), dtype=tf.float32),
+        )
+        dataset = dataset.map(lambda x: (x, x))
+
+    return _prefetch(dataset)
+
+
+def create_count_stream(counts, rarefication_depth, batch_size, seed, epochs):
+    """
+    Builds a tf.data pipeline of shuffled, scaled mini-batches from compact integer counts.
+
+    The counts are kept as integers on the TensorFlow side as well, every batch is gathered and scaled to float32
+    inside the pipeline, giving the same values as utils.scale_data. The order of every epoch is a stateless
+    shuffle derived from the seed and the epoch number, so training can be split over several fit calls.
+
+    Parameters:
+    -----------
+    counts : numpy.ndarray or utils.RowSubset
+        A 2D integer array of shape (n_rows, n_features), e.g. the output of build_dataset. The rows of a RowSubset
+        are gathered on the host a batch at a time, other arrays are copied to TensorFlow as a whole.
+    rarefication_depth : int
+        Depth the counts were rarefied to, batches are divided by it.
+    batch_size : int
+        Number of rows per batch, the last batch of an epoch can be smaller.
+    seed : int
+        Seed for the order of the rows.
+    epochs : range
+        The epochs to generate batches for.
+
+    Returns:
+    --------
+    dataset : tf.data.Dataset
+        A dataset of (input, target) pairs.
+    """
+    if isinstance(counts, RowSubset):
+
+        def gather(index):
+            batch = tf.numpy_function(
+                lambda i: counts[i], [index], tf.as_dtype(counts.dtype)
+            )
+            batch.set_shape([None, counts.shape[1]])
+            return batch
+
+    else:
+        data = tf.constant(counts)
+
+        def gather(index):
+            return tf.gather(data, index)
+
+    rows = tf.range(counts.shape[0], dtype=tf.int64)
+
+    def epoch(e):
+        order = tf.random.experimental.stateless_shuffle(
+            rows, seed=tf.stack([tf.constant(seed, tf.int64), e])
+        )
+        return tf.data.Dataset.from_tensor_slices(order).batch(batch_size)
+
+    def scale(index):
+        batch = tf.cast(gather(index), tf.float32) / rarefication_depth
+        return batch, batch
+
+    dataset = tf.data.Dataset.range(epochs.start, epochs.stop).flat_map(epoch)
+
+    return _prefetch(dataset.map(scale))
+
+
+def _member_mse(data, predicted):
+    # Mean squared error of every member of an ensemble, shape (n_samples, members)
+    return np.mean(np.square(predicted - data[:, None, :]), axis=-1)
+
+
 def get_latent(encoder, data):
     latent = encoder.predict(data)
 
     return latent
 
 
-def get_loss(autoencoder, data):
-    predicted = autoencoder.predict(data)
+def get_loss(autoencoder, data, chunk_size=65536):
+    """
+    Computes the reconstruction loss (mean squared error) for every sample.
+
+    The loss is computed for a whole chunk of samples in a single operation, chunks keep memory bounded for
+    arbitrarily large inputs.
+
+    Parameters:
+    -----------
+    autoencoder : keras.models.Model
+        The trained autoencoder.
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) with the scaled data.
+    chunk_size : int, optional
+        Number of samples predicted and compared at once. Default is 65536.
+
+    Returns:
+    --------
+    output : numpy.ndarray
+        A float32 array of shape (n_samples,) with the loss per sample, (n_samples, members) for an ensemble.
+    """
     loss_function = losses.MeanSquaredError(reduction="none")
+    output = np.empty(data.shape[0], dtype=np.float32)
 
-    output = [loss_function(a, b).numpy() for a, b in zip(predicted, data)]
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start : start + chunk_size]
+        predicted = autoencoder.predict(chunk, verbose=0)
+        if predicted.ndim == 3 and output.ndim == 1:
+            output = np.empty((data.shape[0], predicted.shape[1]), dtype=np.float32)
+        if sp.issparse(chunk):
+            chunk = chunk.toarray()
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if predicted.ndim == 3:
+            output[start : start + chunk_size] = _member_mse(chunk, predicted)
+        else:
+            output[start : start + chunk_size] = loss_function(chunk, predicted)
 
     return output
+
+
+def get_scores(scoring_model, data, chunk_size=65536):
+    """
+    Computes the latent representation and reconstruction loss of every sample in one pass over the data.
+
+    Parameters:
+    -----------
+    scoring_model : keras.models.Model
+        A model created by create_scoring_model.
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) with the scaled data.
+    chunk_size : int, optional
+        Number of samples processed at once. Default is 65536.
+
+    Returns:
+    --------
+    latent : numpy.ndarray
+        A float32 array of shape (n_samples, encoding_dim), (n_samples, members, encoding_dim) for an ensemble.
+    loss : numpy.ndarray
+        A float32 array of shape (n_samples,) with the loss per sample, (n_samples, members) for an ensemble.
+    """
+    loss_function = losses.MeanSquaredError(reduction="none")
+    latent = np.empty(
+        (data.shape[0], *scoring_model.outputs[0].shape[1:]), dtype=np.float32
+    )
+    loss = np.empty(latent.shape[:-1], dtype=np.float32)
+
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start : start + chunk_size]
+        encoded, predicted = scoring_model.predict(chunk, verbose=0)
+        if sp.issparse(chunk):
+            chunk = chunk.toarray()
+        chunk = np.asarray(chunk, dtype=np.float32)
+        latent[start : start + chunk_size] = encoded
+        if predicted.ndim == 3:
+            loss[start : start + chunk_size] = _member_mse(chunk, predicted)
+        else:
+            loss[start : start + chunk_size] = loss_function(chunk, predicted)
+
+    return latent, loss
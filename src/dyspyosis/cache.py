@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from .utils import build_dataset
+
+# Bumped whenever the layout of the cache or the output of build_dataset changes
+CACHE_VERSION = 2
+
+
+def _hash_array(digest, array):
+    array = np.ascontiguousarray(array)
+    digest.update(f"{array.dtype.str}{array.shape}".encode())
+    digest.update(memoryview(array).cast("B"))
+
+
+def dataset_key(data, **params) -> str:
+    """
+    Computes the cache key of an expanded dataset, a hash of the count matrix and the parameters used to build it.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray, pd.DataFrame or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) with the counts.
+    params :
+        JSON serializable parameters (rarefication_depth, iterations, seed, mode, ...).
+
+    Returns:
+    --------
+    key : str
+        A hexadecimal digest.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(
+        json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True).encode()
+    )
+
+    if sp.issparse(data):
+        data = sp.csr_matrix(data)
+        data.sum_duplicates()
+        digest.update(b"csr")
+        for array in (data.indptr, data.indices, data.data):
+            _hash_array(digest, array)
+        digest.update(str(data.shape).encode())
+    else:
+        _hash_array(digest, np.asarray(data))
+
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """
+    An on-disk cache of expanded (rarefied) training datasets.
+
+    Entries are stored as .npy files in a subdirectory per key and opened as read-only memory maps, so repeated
+    runs skip generating the dataset and several processes reading the same entry share it through the page cache.
+    Entries are written to a temporary directory first and renamed into place, so concurrent writers never expose
+    a partial entry. When the total size exceeds max_bytes, the least recently used entries are removed.
+
+    Attributes:
+    -----------
+    directory : Path
+        The directory holding the cache entries.
+    max_bytes : int, optional
+        Size limit of the cache in bytes, None for no limit.
+    """
+
+    def __init__(self, directory, max_bytes: Optional[int] = None):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _entries(self):
+        return [
+            p for p in self.directory.iterdir() if p.is_dir() and ".tmp-" not in p.name
+        ]
+
+    @staticmethod
+    def _entry_size(path):
+        return sum(f.stat().st_size for f in path.iterdir())
+
+    def size(self) -> int:
+        """
+        Returns the total size of the cached entries in bytes.
+        """
+        return sum(self._entry_size(p) for p in self._entries())
+
+    def __contains__(self, key):
+        return (self.directory / key / "meta.json").exists()
+
+    def get(self, key):
+        """
+        Opens a cached dataset.
+
+        Parameters:
+        -----------
+        key : str
+            The key of the entry, see dataset_key.
+
+        Returns:
+        --------
+        output : numpy.memmap, scipy.sparse.csr_matrix or None
+            The dataset as a read-only memory map (sparse datasets are built on memory mapped arrays), None if the
+            key isn't cached.
+        """
+        path = self.directory / key
+        try:
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        # The modification time of the entry marks its last use
+        os.utime(path)
+
+        if meta["format"] == "csr":
+            arrays = [
+                np.load(path / f"{name}.npy", mmap_mode="r")
+                for name in ("data", "indices", "indptr")
+            ]
+            return sp.csr_matrix(tuple(arrays), shape=tuple(meta["shape"]), copy=False)
+
+        return np.load(path / "data.npy", mmap_mode="r")
+
+    def put(self, key, output):
+        """
+        Stores a dataset and evicts old entries if the cache grows beyond max_bytes.
+
+        Parameters:
+        -----------
+        key : str
+            The key of the entry, see dataset_key.
+        output : numpy.ndarray or scipy.sparse.csr_matrix
+            The dataset to store.
+
+        Returns:
+        --------
+        output : numpy.memmap or scipy.sparse.csr_matrix
+            The stored dataset, opened from the cache.
+        """
+        path = self.directory / key
+        tmp = self.directory / f"{key}.tmp-{uuid.uuid4().hex}"
+        tmp.mkdir()
+
+        try:
+            if sp.issparse(output):
+                output = sp.csr_matrix(output)
+                for name in ("data", "indices", "indptr"):
+                    np.save(tmp / f"{name}.npy", getattr(output, name))
+                meta = {"format": "csr", "shape": list(output.shape)}
+            else:
+                np.save(tmp / "data.npy", np.asarray(output))
+                meta = {"format": "dense", "shape": list(output.shape)}
+
+            # Written last, an entry without meta.json is incomplete
+            with open(tmp / "meta.json", "w") as f:
+                json.dump(meta, f)
+
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another process stored the same entry in the meantime
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+
+        return self.get(key)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+
+        Parameters:
+        -----------
+        keep : str, optional
+            The key of an entry that is never removed, e.g. the one just written.
+        """
+        if self.max_bytes is None:
+            return
+
+        entries = [(p.stat().st_mtime, self._entry_size(p), p) for p in self._entries()]
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if path.name == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+        """
+        for path in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def build_dataset(
+        self,
+        data,
+        rarefication_depth,
+        iterations=10,
+        seed=0,
+        mode="with_replacement",
+        low_depth_policy="keep",
+        n_jobs=1,
+    ):
+        """
+        Cached version of utils.build_dataset, returns the stored dataset if it was built before with the same data
+        and parameters and builds and stores it otherwise.
+
+        Returns:
+        --------
+        output : numpy.memmap or scipy.sparse.csr_matrix
+            A read-only 2D array of shape (n_samples * iterations, n_features) containing the rarefied data.
+        """
+        key = dataset_key(
+            data,
+            rarefication_depth=rarefication_depth,
+            iterations=iterations,
+            seed=np.asarray(seed).tolist(),
+            mode=mode,
+            low_depth_policy=low_depth_policy,
+        )
+
+        output = self.get(key)
+        if output is None:
+            output = self.put(
+                key,
+                build_dataset(
+                    data,
+                    rarefication_depth,
+                    iterations,
+                    seed=seed,
+                    mode=mode,
+                    low_depth_policy=low_depth_policy,
+                    n_jobs=n_jobs,
+                ),
+            )
+
+        return output
@@ -0,0 +1,190 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from .inference import NumpyModel
+from .utils import read_table_chunks
+
+
+class CsvWriter:
+    """
+    Appends DataFrames to a delimited text file, writing the header with the first one.
+    """
+
+    def __init__(self, path, sep=","):
+        self.path = path
+        self.sep = sep
+        self.rows = 0
+
+    def write(self, df):
+        df.to_csv(
+            self.path,
+            sep=self.sep,
+            index=False,
+            mode="w" if self.rows == 0 else "a",
+            header=self.rows == 0,
+        )
+        self.rows += len(df)
+
+    def close(self):
+        if self.rows == 0:
+            open(self.path, "w").close()
+
+
+class ParquetWriter:
+    """
+    Appends DataFrames to a Parquet file, one row group each. Requires pyarrow.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Writing Parquet files requires pyarrow.") from None
+
+        self.path = path
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(
+                df, schema=self.writer.schema, preserve_index=False
+            )
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def score_file(
+    model,
+    input_path,
+    output_path,
+    sep=None,
+    chunk_size=65536,
+    low_depth_policy="keep",
+    output_format=None,
+) -> int:
+    """
+    Scores a count table stored as a delimited text file chunk by chunk and streams the scores to a CSV, TSV or
+    Parquet file, memory only depends on chunk_size.
+
+    Parameters:
+    -----------
+    model : NumpyModel
+        The trained model.
+    input_path : str or Path
+        A table with the samples in rows, the sample labels in the first column and the feature names in the
+        header. Compressed files (.gz, .bz2, ...) are supported.
+    output_path : str or Path
+        The file to write the label, loss and latent space (L1, L2, ...) of every sample to.
+    sep : str, optional
+        The separator of the input, "," for .csv files and a tab otherwise by default.
+    chunk_size : int
+        Number of samples read, rarefied and scored at once.
+    low_depth_policy : str
+        What to do with samples that have fewer reads than the rarefication_depth: "keep", "drop" or "error".
+    output_format : str, optional
+        "csv", "tsv" or "parquet", derived from the extension of output_path by default.
+
+    Returns:
+    --------
+    rows : int
+        The number of samples written.
+    """
+    if output_format is None:
+        suffix = Path(output_path).suffix.lower()
+        output_format = {".parquet": "parquet", ".pq": "parquet", ".tsv": "tsv"}.get(
+            suffix, "csv"
+        )
+
+    if output_format == "parquet":
+        writer = ParquetWriter(output_path)
+    elif output_format in ("csv", "tsv"):
+        writer = CsvWriter(output_path, sep="\t" if output_format == "tsv" else ",")
+    else:
+        raise ValueError(f"Unknown output format {output_format!r}")
+
+    rows = 0
+    try:
+        with read_table_chunks(input_path, chunk_size, sep=sep) as tables:
+            for scores in model.score_chunks(
+                tables, chunk_size=chunk_size, low_depth_policy=low_depth_policy
+            ):
+                writer.write(scores)
+                rows += len(scores)
+    finally:
+        writer.close()
+
+    return rows
+
+
+def main(argv=None):
+    """
+    Entry point of the dyspyosis-score command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="dyspyosis-score",
+        description="Scores samples with a trained dyspyosis model, reading and writing in chunks so tables of any "
+        "size can be scored with little memory.",
+    )
+    parser.add_argument(
+        "model",
+        help="A model stored with Dyspyosis.save or exported with Dyspyosis.export",
+    )
+    parser.add_argument(
+        "input",
+        help="Count table (TSV or CSV, optionally compressed) with samples in rows and labels in the first column",
+    )
+    parser.add_argument("output", help="Output file, .csv, .tsv or .parquet")
+    parser.add_argument(
+        "--sep", help="Separator of the input, by default derived from the extension"
+    )
+    parser.add_argument(
+        "--format", choices=("csv", "tsv", "parquet"), help="Output format"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=65536,
+        help="Samples scored at once (default: 65536)",
+    )
+    parser.add_argument(
+        "--low-depth-policy",
+        choices=("keep", "drop", "error"),
+        default="keep",
+        help="How to handle samples with fewer reads than the rarefication depth (default: keep)",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        model = NumpyModel.load(args.model)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    rows = score_file(
+        model,
+        args.input,
+        args.output,
+        sep=args.sep,
+        chunk_size=args.chunk_size,
+        low_depth_policy=args.low_depth_policy,
+        output_format=args.format,
+    )
+    print(
+        f"Scored {rows} samples in {time.perf_counter() - start:.1f} s, written to {args.output}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,68 @@
-from sklearn.model_selection import train_test_split
+import copy
+import importlib.util
+from collections.abc import Callable
+from itertools import chain
+from pathlib import Path
+import json
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from typing import Optional
+import time
 
-from .utils import build_dataset, rarefy, scale_data
-from .autoencoder import create_autoencoder, get_loss, get_latent
+from .utils import (
+    RowSubset,
+    build_dataset,
+    check_depth,
+    drop_samples,
+    prepare_counts,
+    rarefied_chunks,
+    rarefied_batches,
+    rarefy,
+    scale_data,
+    shuffled_batches,
+    split_rows,
+)
+from .inference import WEIGHT_NAMES, NumpyModel, latent_columns, scores_frame
+from .cache import DatasetCache
+from .profiling import Profiler
+from .runtime import configure_threads, device_scope, select_device
+from .store import TrainingStore
+
+
+def _check_backend(backend, device, ensemble_size):
+    if backend not in ("tensorflow", "numpy"):
+        raise ValueError(f"Unknown backend {backend!r}, use 'tensorflow' or 'numpy'")
+    if backend == "numpy" and device is not None:
+        raise ValueError(
+            "The numpy backend always runs on the CPU, device can't be set"
+        )
+    if backend == "numpy" and ensemble_size is not None:
+        raise ValueError("The numpy backend does not support ensembles")
+
+
+def _stack(arrays):
+    # Concatenates the rows of count tables or datasets of the same kind
+    if sp.issparse(arrays[0]):
+        return sp.vstack(arrays, format="csr")
+    if isinstance(arrays[0], pd.DataFrame):
+        return pd.concat(arrays)
+
+    return np.concatenate(arrays)
+
+
+def _nbytes(data):
+    # Memory maps (see Dyspyosis.from_store) are backed by disk
+    if data is None or isinstance(data, np.memmap):
+        return 0
+    # Row subsets only hold the positions of their rows in a shared dataset
+    if isinstance(data, RowSubset):
+        return data.rows.nbytes
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(deep=True).sum())
+    if sp.issparse(data):
+        return data.data.nbytes + data.indices.nbytes + data.indptr.nbytes
+    return np.asarray(data).nbytes
 
 
 class Dyspyosis:
@@ -12,8 +71,8 @@ class Dyspyosis:
 
     Attributes:
     -----------
-    data : pd.DataFrame
-        The dataset used for training and evaluating the autoencoder.
+    data : pd.DataFrame or scipy.sparse.csr_matrix
+        The dataset used for training and evaluating the autoencoder. Sparse data stays sparse throughout.
     labels : list, optional
         The labels corresponding to the dataset, added when calculating losses per label.
     rarefication_depth : int
@@ -22,13 +81,57 @@ class Dyspyosis:
         The number of times the data is rarefied when generation the training data
     seed : int
         The random state seed used for data splitting and rarefication.
+    mode : str
+        Whether reads are sampled "with_replacement" or "without_replacement" during rarefication.
+    sample_mask : numpy.ndarray
+        Boolean array marking which of the input samples were kept after applying the low_depth_policy.
+    streaming : bool
+        If True, training batches are rarefied on the fly instead of materializing the expanded dataset.
+    columns : list, optional
+        The names of the features (columns) in data, used to align new samples when scoring.
+    profiler : Profiler
+        Records the wall time, rows and peak memory of every stage, see profiling.Profiler.
+    store : TrainingStore or None
+        The disk-backed training data, if the model was created with from_store or from_chunks.
+    ensemble_size : int or None
+        Number of autoencoders trained together as an ensemble, None for a single one.
+    device : str or None
+        The TensorFlow device the model is built, trained and run on, None if TensorFlow places it.
+    backend : str
+        "tensorflow" for a Keras model or "numpy" for a NumpyAutoencoder.
 
     Methods:
     --------
-    run_training(epochs, batch_size)
-        Trains the autoencoder using the scaled and rarefied data.
+    run_training(epochs, batch_size, ...)
+        Trains the autoencoder using the scaled and rarefied data, optionally with early stopping.
+    update(counts, labels, columns, epochs, replay, ...)
+        Adds new samples and fine-tunes the trained model on them, mixed with a replay sample of the old data.
     compute_loss()
         Computes the reconstruction loss of the autoencoder model on the scaled data.
+    get_latent()
+        Retrieves the latent representation of the scaled data.
+    score()
+        Computes the loss and latent representation of the scaled data in a single pass.
+    score_rarefied(repeats, quantiles, latent, chunk_size)
+        Computes the distribution of the loss over many rarefactions of each sample.
+    set_device(device, batch_size, steps)
+        Moves the model to another device, or the fastest one with "auto".
+    configure_threads(intra_op_threads, inter_op_threads, cpu_affinity)
+        Limits the threads and CPUs TensorFlow uses.
+    save(path)
+        Stores the trained model and its settings in a directory.
+    export(path)
+        Exports the trained weights to a single .npz file for TensorFlow-free scoring with NumpyModel.
+    load(path)
+        Restores a model stored with save, without generating training data.
+    from_store(store, encode_dim, profiler)
+        Creates a model that trains on a disk-backed TrainingStore.
+    from_chunks(source, directory, ...)
+        Builds a TrainingStore from a file or chunk iterator and creates a model on it.
+    score_new(counts, labels, columns, chunk_size, low_depth_policy)
+        Rarefies and scores new samples with the trained model.
+    memory_usage()
+        Reports the memory used by the data and model.
     """
 
     def __init__(
@@ -39,14 +142,26 @@ class Dyspyosis:
         rarefication_count: int = 10,
         encode_dim: int = 4,
         seed: int = 0,
+        mode: str = "with_replacement",
+        low_depth_policy: str = "keep",
+        n_jobs: int = 1,
+        streaming: bool = False,
+        columns: Optional[list] = None,
+        training_data=None,
+        cache=None,
+        profiler: Optional[Profiler] = None,
+        ensemble_size: Optional[int] = None,
+        device: Optional[str] = None,
+        backend: str = "tensorflow",
     ):
         """
         Initializes the Dyspyosis class with data, optional labels, and rarefication parameters.
 
         Parameters:
         -----------
-        data : pd.DataFrame
-            The dataset to be used in the analysis.
+        data : pd.DataFrame or scipy.sparse.csr_matrix
+            The dataset to be used in the analysis. Sparse (CSR) count tables are rarefied, stored and fed to the
+            model in sparse form.
         labels : list, optional
             Optional labels corresponding to the dataset.
         rarefication_depth : int
@@ -57,58 +172,750 @@ class Dyspyosis:
             Number of dimensions the latent space should have
         seed : int
             The random state seed for reproducibility purposes.
+        mode : str
+            "with_replacement" (default) or "without_replacement" (classic rarefaction, subsampling actual reads).
+        low_depth_policy : str
+            What to do with samples that have fewer reads than rarefication_depth: "keep" (default), "drop" or
+            "error". Dropped samples are removed from the data and labels.
+        n_jobs : int
+            Number of processes used to generate the training data, -1 uses all CPUs. Results do not depend on it.
+        streaming : bool
+            If True, the expanded training dataset is not built up front. Instead run_training draws freshly
+            rarefied batches on a background thread, keeping memory close to the size of the input data. The
+            validation set is a single, fixed rarefaction of every sample.
+        columns : list, optional
+            Names of the features in data, taken from data.columns if data is a DataFrame. Stored with the model
+            so new samples can be aligned to the training features in score_new.
+        training_data : numpy.ndarray or scipy.sparse.csr_matrix, optional
+            A precomputed expanded dataset for the samples kept in data, i.e. the output of build_dataset (with
+            seed + 1). Skips generating it, this is how run_jobs shares a single dataset between several models.
+            A dense dataset is split in x_train and x_test by row positions (see utils.RowSubset) rather than
+            copied, batches are gathered from it as they are used.
+        cache : DatasetCache, str or Path, optional
+            A DatasetCache (or the directory of one) to store the expanded dataset in. Later runs on the same data
+            and settings open the stored dataset instead of generating it again. A dense dataset stays a memory map,
+            split by row positions like training_data, so processes training on it share it through the page cache.
+        profiler : Profiler, optional
+            Records the stages of the pipeline (rarefy, build_model, build_dataset, split, every epoch, predict,
+            loss, ...) to its sinks, e.g. Profiler(Report()) to collect them in memory.
+        ensemble_size : int, optional
+            Train this many independently initialized autoencoders at once, stacked in a single model that
+            trains them on the same batches in the same steps. Scores report the mean loss, its standard
+            deviation and the loss and latent space of every member.
+        device : str, optional
+            The device to build, train and run the model on: "cpu", "gpu", "gpu:1", ... or "auto" to time a few
+            train steps with batches of 64 on every available device and pick the fastest (see set_device to time
+            other batch sizes). By default TensorFlow picks the device, the GPU if there is one.
+        backend : str
+            "tensorflow" (default) builds a Keras model. "numpy" trains and scores the same model in NumPy (see
+            numpy_backend.NumpyAutoencoder), without loading TensorFlow, for CPU-only deployments and many small
+            trainings in parallel. It doesn't support ensembles, devices, checkpoints or the compiled engines.
         """
+        _check_backend(backend, device, ensemble_size)
+
+        if columns is None and isinstance(data, pd.DataFrame):
+            columns = data.columns.tolist()
+
+        if sp.issparse(data):
+            data = sp.csr_matrix(data)
+
+        self.sample_mask = check_depth(data, rarefication_depth, low_depth_policy)
+        data, labels = drop_samples(data, labels, self.sample_mask)
+
         self.data = data
         self.labels = labels
         self.rarefication_depth = rarefication_depth
         self.rarefication_count = rarefication_count
         self.encode_dim = encode_dim
         self.seed = seed
+        self.mode = mode
+        self.streaming = streaming
+        self.columns = columns
+        self.profiler = Profiler() if profiler is None else profiler
+        self.store = None
+        self._trainer = None
+        self.ensemble_size = ensemble_size
+        self.backend = backend
+
+        self.device, _ = self._select_device(device, self.data.shape[1])
 
         self.x_test = None
         self.x_train = None
+        self.training_report = None
 
-        self.scaled_data = scale_data(
-            rarefy(data, rarefication_depth, seed=seed), self.rarefication_depth
-        )
-        self.autoencoder, self.encoder, self.decoder = create_autoencoder(
-            self.data.shape[1], encoding_dim=self.encode_dim
-        )
-
-        full_data = scale_data(
-            build_dataset(
-                self.data,
+        nsamples = self.data.shape[0]
+        with self.profiler.stage("rarefy", rows=nsamples):
+            self.scaled_data = scale_data(
+                rarefy(
+                    data,
+                    rarefication_depth,
+                    seed=seed,
+                    mode=mode,
+                    low_depth_policy=None,
+                ),
                 self.rarefication_depth,
-                self.rarefication_count,
-                seed=self.seed + 1,
-            ),
-            self.rarefication_depth,
+            )
+        with self.profiler.stage("build_model"):
+            self._build_model(self.data.shape[1])
+
+        # Training and validation data are kept as compact integer counts, batches are scaled when used
+        if self.streaming:
+            with self.profiler.stage("rarefy", rows=nsamples):
+                self.x_test = rarefy(
+                    self.data,
+                    rarefication_depth,
+                    seed=seed + 1,
+                    mode=mode,
+                    low_depth_policy=None,
+                )
+            return
+
+        if training_data is None:
+            if cache is not None and not isinstance(cache, DatasetCache):
+                cache = DatasetCache(cache)
+            with self.profiler.stage(
+                "build_dataset",
+                rows=nsamples * rarefication_count,
+                cached=cache is not None,
+            ):
+                full_data = (build_dataset if cache is None else cache.build_dataset)(
+                    self.data,
+                    self.rarefication_depth,
+                    self.rarefication_count,
+                    seed=self.seed + 1,
+                    mode=self.mode,
+                    low_depth_policy=None,
+                    n_jobs=n_jobs,
+                )
+        else:
+            expected = (self.data.shape[0] * rarefication_count, self.data.shape[1])
+            if training_data.shape != expected:
+                raise ValueError(
+                    f"training_data has shape {training_data.shape}, expected {expected}"
+                )
+            full_data = training_data
+
+        # A dataset shared with other processes (passed in, or a memory map of the cache) isn't copied, see
+        # utils.RowSubset
+        shared = not sp.issparse(full_data) and (
+            training_data is not None or isinstance(full_data, np.memmap)
         )
+        with self.profiler.stage("split", rows=full_data.shape[0]):
+            self.x_train, self.x_test = split_rows(
+                full_data, 0.15, seed=self.seed, copy=not shared
+            )
+
+    def _build_model(self, n_features):
+        # TensorFlow is only imported once a model of the tensorflow backend is built
+        if self.backend == "numpy":
+            from .numpy_backend import NumpyAutoencoder
+
+            self.autoencoder = NumpyAutoencoder(
+                n_features, encoding_dim=self.encode_dim, seed=self.seed
+            )
+            self.encoder = self.decoder = self.scoring_model = None
+            return
+
+        if importlib.util.find_spec("tensorflow") is None:
+            raise ImportError(
+                'The tensorflow backend requires TensorFlow, install it or use backend="numpy".'
+            )
+        from .autoencoder import create_autoencoder, create_scoring_model
+
+        with device_scope(self.device):
+            self.autoencoder, self.encoder, self.decoder = create_autoencoder(
+                n_features,
+                encoding_dim=self.encode_dim,
+                ensemble_size=self.ensemble_size,
+            )
+            self.scoring_model = create_scoring_model(self.autoencoder, self.encoder)
+
+    def _get_scores(self, data):
+        # The latent space and loss of scaled data
+        if self.backend == "numpy":
+            return self.autoencoder.get_scores(data)
+
+        from .autoencoder import get_scores
+
+        return get_scores(self.scoring_model, data)
 
-        self.x_train, self.x_test = train_test_split(
-            full_data, test_size=0.15, random_state=self.seed
+    def _select_device(self, device, n_features, batch_size=64, steps=20):
+        if device != "auto":
+            return select_device(device, n_features)
+
+        with self.profiler.stage("select_device") as details:
+            device, timings = select_device(
+                device,
+                n_features,
+                self.encode_dim,
+                batch_size=batch_size,
+                ensemble_size=self.ensemble_size,
+                steps=steps,
+            )
+            details["device"] = device
+
+        return device, timings
+
+    def set_device(self, device, batch_size: int = 64, steps: int = 20) -> dict:
+        """
+        Moves the model, with its weights and optimizer state, to another device.
+
+        Parameters:
+        -----------
+        device : str or None
+            "cpu", "gpu", "gpu:1", ..., "auto" to pick the fastest device for the model and batch_size, or None
+            to leave the placement to TensorFlow.
+        batch_size : int
+            With "auto", the batch size to time train steps with, use the one passed to run_training.
+        steps : int
+            With "auto", the number of train steps timed per device.
+
+        Returns:
+        --------
+        timings : dict
+            With "auto", the seconds per train step of every device that was timed.
+        """
+        if self.backend == "numpy":
+            raise ValueError("The numpy backend always runs on the CPU")
+
+        device, timings = self._select_device(
+            device, self.autoencoder.input_shape[1], batch_size, steps
         )
+        if device == self.device:
+            return timings
+
+        weights = self.autoencoder.get_weights()
+        optimizer = self.autoencoder.optimizer
+        state = [v.numpy() for v in optimizer.variables] if optimizer.built else None
 
-    def run_training(self, epochs: int = 4000, batch_size: int = 64) -> None:
+        self.device = device
+        self._trainer = None
+        self._build_model(self.autoencoder.input_shape[1])
+
+        with device_scope(device):
+            self.autoencoder.set_weights(weights)
+            if state is not None:
+                self.autoencoder.optimizer.build(self.autoencoder.trainable_variables)
+                for variable, value in zip(self.autoencoder.optimizer.variables, state):
+                    variable.assign(value)
+
+        return timings
+
+    @staticmethod
+    def configure_threads(
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+        cpu_affinity=None,
+    ) -> None:
+        """
+        Sets the size of the TensorFlow thread pools and pins the process to a set of CPUs, see
+        runtime.configure_threads. Settings apply to the whole process and have to be made before the first model
+        is built.
+        """
+        configure_threads(intra_op_threads, inter_op_threads, cpu_affinity)
+
+    def run_training(
+        self,
+        epochs: int = 4000,
+        batch_size: int = 64,
+        patience: Optional[int] = None,
+        min_delta: float = 0.0,
+        restore_best_weights: bool = True,
+        lr_schedule: Optional[Callable] = None,
+        validation_freq: int = 1,
+        validation_size: Optional[float] = None,
+        checkpoint_dir: Optional[str] = None,
+        checkpoint_freq: int = 100,
+        resume: bool = False,
+        verbose="auto",
+        engine: str = "fit",
+        steps_per_call: Optional[int] = None,
+    ) -> dict:
         """
         Trains the autoencoder using the prepared training data.
 
         Parameters:
         -----------
         epochs : int
-            The number of epochs to train the autoencoder.
+            The (maximum) number of epochs to train the autoencoder.
         batch_size : int
             The batch size used during training.
+        patience : int, optional
+            If set, training stops once the validation loss hasn't improved for this many validations.
+        min_delta : float
+            Minimum decrease of the validation loss that counts as an improvement for early stopping.
+        restore_best_weights : bool
+            With early stopping, end training with the weights that had the lowest validation loss.
+        lr_schedule : callable, optional
+            A function (epoch, lr) -> lr setting the learning rate at the start of each epoch, see e.g.
+            training.exponential_decay and training.step_decay.
+        validation_freq : int
+            Validate every validation_freq epochs.
+        validation_size : int or float, optional
+            Validate on a fixed random subset of the validation data, either a number of rows or a fraction.
+        checkpoint_dir : str or Path, optional
+            If set, the model weights, optimizer state, epoch counter, early stopping state and history are
+            stored in this directory every checkpoint_freq epochs. The order of the training batches is derived
+            from the seed and epoch, so no further random state is needed to continue a run.
+        checkpoint_freq : int
+            Number of epochs between checkpoints.
+        resume : bool
+            Continue from the latest checkpoint in checkpoint_dir, if there is one. The result is the same as
+            that of an uninterrupted run with the same checkpoint settings.
+        verbose : "auto", 0, 1 or 2
+            Passed to Keras: 1 shows a progress bar, 2 a line per epoch and 0 nothing. For long runs use 0 and a
+            profiling.ProgressLog sink on the profiler to print a line every few epochs instead. The compiled
+            engines print a line per epoch unless verbose is 0.
+        engine : str
+            "fit" trains with Keras fit. "xla" and "graph" use a custom loop (see training.CompiledTrainer) that
+            shuffles and batches on the device and runs many steps per call, compiled with XLA or as a TensorFlow
+            graph respectively. With the same seed these train on the same batches and optimize the same loss as
+            "fit", at a multiple of its speed for small models. Only for dense data held in memory.
+        steps_per_call : int, optional
+            With a compiled engine, the maximum number of train steps per call, an entire epoch by default.
+
+        Returns:
+        --------
+        report : dict
+            The total number of epochs trained, the epoch training resumed from, wall time in seconds, whether
+            training stopped early, the best validation loss and its epoch, and the loss history. Also stored as
+            training_report.
         """
-        self.autoencoder.fit(
-            self.x_train,
-            self.x_train,
-            epochs=epochs,
-            batch_size=batch_size,
-            shuffle=True,
-            validation_data=(self.x_test, self.x_test),
+        sparse = sp.issparse(self.data)
+        if engine not in ("fit", "xla", "graph"):
+            raise ValueError(f"Unknown engine {engine!r}, use 'fit', 'xla' or 'graph'")
+        if engine != "fit" and (self.streaming or sparse or self.store is not None):
+            raise ValueError(
+                f"The {engine!r} engine requires dense training data held in memory, use engine='fit'"
+            )
+        if self.backend == "numpy" and (engine != "fit" or checkpoint_dir is not None):
+            raise ValueError(
+                "The numpy backend supports neither the compiled engines nor checkpoints"
+            )
+
+        x_val = self.x_test
+        if validation_size is not None:
+            nval = x_val.shape[0]
+            size = validation_size if validation_size >= 1 else validation_size * nval
+            rows = np.random.default_rng(self.seed).choice(
+                nval, size=min(nval, max(1, int(size))), replace=False
+            )
+            x_val = x_val[np.sort(rows)]
+
+        # Disk-backed validation data is streamed and scaled per batch, like the training data
+        val_depth = None
+        if self.store is None:
+            x_val = scale_data(x_val, self.rarefication_depth)
+        else:
+            val_depth = self.rarefication_depth
+
+        def batch_source(initial_epoch, last):
+            # A function returning an iterator over the training batches of the epochs, and the rows per epoch.
+            # All randomness in the order of the batches is derived from the seed and the epoch, so training
+            # can be split over several fit calls (see checkpoint_dir) without changing the result.
+            if self.streaming:
+                # An epoch covers as many rows as the materialized training set would have
+                rows = 0.85 * self.data.shape[0] * self.rarefication_count
+
+                def batches():
+                    return rarefied_batches(
+                        self.data,
+                        self.rarefication_depth,
+                        batch_size=batch_size,
+                        seed=[self.seed + 2, initial_epoch],
+                        mode=self.mode,
+                        low_depth_policy=None,
+                    )
+
+            else:
+                rows = self.x_train.shape[0]
+
+                def batches():
+                    return chain.from_iterable(
+                        shuffled_batches(
+                            self.x_train,
+                            batch_size,
+                            seed=[self.seed, e],
+                            rarefication_depth=self.rarefication_depth,
+                        )
+                        for e in range(initial_epoch, last)
+                    )
+
+            return batches, rows
+
+        if self.backend == "numpy":
+            batches, rows = batch_source(0, epochs)
+            start = time.perf_counter()
+            result = self.autoencoder.fit(
+                iter(batches()),
+                int(np.ceil(rows / batch_size)),
+                epochs,
+                validation_data=lambda: shuffled_batches(
+                    x_val, batch_size, seed=None, rarefication_depth=val_depth
+                ),
+                validation_freq=validation_freq,
+                patience=patience,
+                min_delta=min_delta,
+                restore_best_weights=restore_best_weights,
+                lr_schedule=lr_schedule,
+                profiler=self.profiler,
+                rows=int(rows),
+                verbose=verbose,
+            )
+            self.training_report = {
+                "epochs": result["epochs"],
+                "resumed_from": 0,
+                "wall_time": time.perf_counter() - start,
+                "stopped_early": result["stopped_early"],
+                "best_val_loss": result["best_val_loss"],
+                "best_epoch": result["best_epoch"],
+                "history": result["history"],
+            }
+
+            return self.training_report
+
+        from tensorflow.keras.callbacks import LearningRateScheduler
+        from .autoencoder import create_count_stream, create_stream
+        from .training import (
+            CompiledTrainer,
+            ConvergenceMonitor,
+            StageCallback,
+            load_checkpoint,
+            save_checkpoint,
+        )
+
+        callbacks = []
+        monitor = None
+        if patience is not None:
+            monitor = ConvergenceMonitor(patience, min_delta, restore_best_weights)
+            callbacks.append(monitor)
+        if lr_schedule is not None:
+            callbacks.append(LearningRateScheduler(lr_schedule))
+        if self.profiler.enabled:
+            if self.streaming:
+                rows = int(0.85 * self.data.shape[0] * self.rarefication_count)
+            else:
+                rows = self.x_train.shape[0]
+            callbacks.append(StageCallback(self.profiler, rows))
+
+        def fit_args(initial_epoch, last):
+            if not (self.streaming or sparse or self.store is not None):
+                return {
+                    "x": create_count_stream(
+                        self.x_train,
+                        self.rarefication_depth,
+                        batch_size,
+                        self.seed,
+                        range(initial_epoch, last),
+                    ),
+                    "steps_per_epoch": int(np.ceil(self.x_train.shape[0] / batch_size)),
+                    "shuffle": False,
+                    "validation_data": (x_val, x_val),
+                    "validation_batch_size": batch_size,
+                }
+
+            batches, rows = batch_source(initial_epoch, last)
+            args = {
+                "x": create_stream(batches, self.data.shape[1], sparse=sparse),
+                "steps_per_epoch": int(np.ceil(rows / batch_size)),
+                "shuffle": False,
+                "validation_data": (x_val, x_val),
+                "validation_batch_size": batch_size,
+            }
+
+            if sparse or self.store is not None:
+                args["validation_data"] = create_stream(
+                    lambda: shuffled_batches(
+                        x_val, batch_size, seed=None, rarefication_depth=val_depth
+                    ),
+                    self.data.shape[1],
+                    sparse=sparse,
+                )
+                args["validation_steps"] = int(np.ceil(x_val.shape[0] / batch_size))
+                del args["validation_batch_size"]
+
+            return args
+
+        epoch = 0
+        history = {}
+        if checkpoint_dir is not None and resume:
+            state = load_checkpoint(checkpoint_dir, self.autoencoder, monitor)
+            if state is not None:
+                epoch = state["epoch"]
+                history = state["history"]
+        resumed_from = epoch
+
+        def stopped():
+            return monitor is not None and monitor.stopped_epoch is not None
+
+        trainer = None
+        if engine != "fit":
+            # Kept for later calls, so the train steps are only compiled once
+            settings = (engine, batch_size, steps_per_call)
+            if (
+                self._trainer is None
+                or self._trainer[0] != settings
+                or self._trainer[1] is not self.x_train
+            ):
+                with device_scope(self.device):
+                    self._trainer = (
+                        settings,
+                        self.x_train,
+                        CompiledTrainer(
+                            self.autoencoder,
+                            self.x_train,
+                            self.rarefication_depth,
+                            batch_size=batch_size,
+                            seed=self.seed,
+                            steps_per_call=steps_per_call,
+                            jit_compile=engine == "xla",
+                        ),
+                    )
+            trainer = self._trainer[2]
+
+        start = time.perf_counter()
+        while epoch < epochs and not stopped():
+            last = (
+                epochs
+                if checkpoint_dir is None
+                else min(epoch + checkpoint_freq, epochs)
+            )
+            with device_scope(self.device):
+                if trainer is not None:
+                    result = trainer.fit(
+                        initial_epoch=epoch,
+                        epochs=last,
+                        callbacks=callbacks,
+                        validation_data=(x_val, x_val),
+                        validation_freq=validation_freq,
+                        validation_batch_size=batch_size,
+                        verbose=verbose,
+                    )
+                else:
+                    result = self.autoencoder.fit(
+                        **fit_args(epoch, last),
+                        initial_epoch=epoch,
+                        epochs=last,
+                        callbacks=callbacks,
+                        validation_freq=validation_freq,
+                        verbose=verbose,
+                    )
+            for key, values in result.history.items():
+                history.setdefault(key, []).extend(float(v) for v in values)
+            epoch += len(result.history["loss"])
+
+            if checkpoint_dir is not None:
+                save_checkpoint(
+                    checkpoint_dir,
+                    self.autoencoder,
+                    {"epoch": epoch, "seed": self.seed, "history": history},
+                    monitor,
+                )
+        wall_time = time.perf_counter() - start
+
+        if monitor is not None:
+            # A run resumed after it stopped early never calls fit, which sets the model of the callbacks
+            monitor.set_model(self.autoencoder)
+            monitor.restore_best()
+
+        self.training_report = {
+            "epochs": epoch,
+            "resumed_from": resumed_from,
+            "wall_time": wall_time,
+            "stopped_early": stopped(),
+            "best_val_loss": None if monitor is None else float(monitor.best),
+            "best_epoch": None if monitor is None else monitor.best_epoch,
+            "history": history,
+        }
+
+        return self.training_report
+
+    def _validation_loss(self, x) -> float:
+        # The mean reconstruction loss of expanded data, over its rows and the members of an ensemble
+        with device_scope(self.device):
+            _, loss = self._get_scores(scale_data(x, self.rarefication_depth))
+
+        return float(np.mean(loss))
+
+    def update(
+        self,
+        counts,
+        labels: Optional[list] = None,
+        columns: Optional[list] = None,
+        epochs: int = 200,
+        replay: float = 1.0,
+        low_depth_policy: str = "keep",
+        reference_epochs: Optional[int] = None,
+        n_jobs: int = 1,
+        **training,
+    ) -> dict:
+        """
+        Adds new samples to a trained model and fine-tunes it from its current weights and optimizer state, instead
+        of rarefying the whole cohort again and training a new model from scratch.
+
+        Only the new samples are rarefied: once for scaled_data (seed [seed, n]) and rarefication_count times for
+        the training data (seed [seed + 1, n]), where n is the number of samples the model had. Their expanded rows
+        are split in a training and validation set as in __init__. The model is trained for a short schedule on the
+        new training rows mixed with a random replay sample of the old training rows, which keeps it from drifting
+        away from the old samples, and validated on the old and new validation rows. Afterwards the new samples are
+        part of data, labels, scaled_data, x_train and x_test, so scores and later updates include them.
+
+        Parameters:
+        -----------
+        counts, labels, columns :
+            The new samples, aligned to the features of the model as in score_new.
+        epochs : int
+            The (maximum) number of epochs to fine-tune, typically a small fraction of the original schedule.
+        replay : float
+            Size of the replay sample relative to the number of new training rows, at most all old training rows.
+        low_depth_policy : str
+            What to do with new samples that have fewer reads than the rarefication_depth: "keep", "drop" or
+            "error".
+        reference_epochs : int, optional
+            If set, a new model is also trained from scratch on all training rows for this many epochs, with the
+            same training settings, and its losses are reported next to those of the update. This costs a full
+            retrain.
+        n_jobs : int
+            Number of processes used to expand the new samples, see build_dataset.
+        **training :
+            Passed to run_training, e.g. batch_size, patience, lr_schedule or engine.
+
+        Returns:
+        --------
+        report : dict
+            The number of new samples, the new and replayed training rows, the mean reconstruction loss of the old
+            and new validation rows before and after the update, the drift (after minus before), the wall time and
+            the run_training report. With reference_epochs, "retrain" holds the losses and training report of the
+            retrained model and the difference of the losses after the update with them, None otherwise.
+        """
+        if (
+            self.data is None
+            or self.streaming
+            or self.store is not None
+            or isinstance(self.x_train, RowSubset)
+        ):
+            raise ValueError(
+                "update requires training data held in memory, it is not available for loaded, streaming or "
+                "disk-backed models, or models sharing their training data (training_data or cache)"
+            )
+
+        start = time.perf_counter()
+        counts, labels, mask = prepare_counts(
+            counts,
+            self.rarefication_depth,
+            reference=self.columns,
+            n_features=self.autoencoder.input_shape[1],
+            labels=labels,
+            columns=columns,
+            low_depth_policy=low_depth_policy,
+            return_mask=True,
+        )
+        if counts.shape[0] == 0:
+            raise ValueError(
+                "None of the new samples are kept, there is nothing to add."
+            )
+        if self.labels is not None and labels is None:
+            raise ValueError(
+                "The model has labels, the new samples need labels as well."
+            )
+        if sp.issparse(self.data):
+            counts = sp.csr_matrix(counts)
+        elif sp.issparse(counts):
+            counts = counts.toarray()
+
+        nold, nnew = self.data.shape[0], counts.shape[0]
+        with self.profiler.stage("rarefy", rows=nnew):
+            scaled = scale_data(
+                rarefy(
+                    counts,
+                    self.rarefication_depth,
+                    seed=[self.seed, nold],
+                    mode=self.mode,
+                    low_depth_policy=None,
+                ),
+                self.rarefication_depth,
+            )
+        with self.profiler.stage("build_dataset", rows=nnew * self.rarefication_count):
+            expanded = build_dataset(
+                counts,
+                self.rarefication_depth,
+                self.rarefication_count,
+                seed=[self.seed + 1, nold],
+                mode=self.mode,
+                low_depth_policy=None,
+                n_jobs=n_jobs,
+            )
+        with self.profiler.stage("split", rows=expanded.shape[0]):
+            new_train, new_test = split_rows(expanded, 0.15, seed=[self.seed, nold])
+
+        old_train, old_test = self.x_train, self.x_test
+        nreplay = min(old_train.shape[0], round(replay * new_train.shape[0]))
+        rows = np.random.default_rng([self.seed, nold]).choice(
+            old_train.shape[0], size=nreplay, replace=False
         )
 
+        def losses(dyspyosis):
+            return {
+                "old": dyspyosis._validation_loss(old_test),
+                "new": dyspyosis._validation_loss(new_test),
+            }
+
+        before = losses(self)
+
+        # Both sets describe the old samples again if fine-tuning fails
+        x_test = _stack([old_test, new_test])
+        self.x_train = _stack([old_train[np.sort(rows)], new_train])
+        self.x_test = x_test
+        try:
+            training_report = self.run_training(epochs=epochs, **training)
+        finally:
+            self.x_train, self.x_test = old_train, old_test
+            self._trainer = None
+
+        after = losses(self)
+
+        if isinstance(self.data, pd.DataFrame):
+            counts = pd.DataFrame(counts, columns=self.data.columns, index=labels)
+        self.data = _stack([self.data, counts])
+        if self.labels is not None:
+            self.labels = list(self.labels) + list(labels)
+        self.sample_mask = np.concatenate([self.sample_mask, mask])
+        self.scaled_data = _stack([self.scaled_data, scaled])
+        self.x_train = _stack([old_train, new_train])
+        self.x_test = x_test
+
+        report = {
+            "samples": nnew,
+            "rows": {"new": new_train.shape[0], "replay": nreplay},
+            "loss_before": before,
+            "loss_after": after,
+            "drift": {key: after[key] - before[key] for key in after},
+            "wall_time": time.perf_counter() - start,
+            "training": training_report,
+            "retrain": None,
+        }
+
+        if reference_epochs is not None:
+            # A model trained from scratch on the same rows, as a new Dyspyosis on the whole cohort would be
+            reference = copy.copy(self)
+            reference.profiler = Profiler()
+            reference._trainer = None
+            reference._build_model(self.autoencoder.input_shape[1])
+            settings = {
+                key: value
+                for key, value in training.items()
+                if key not in ("checkpoint_dir", "checkpoint_freq", "resume")
+            }
+            retrain_report = reference.run_training(epochs=reference_epochs, **settings)
+            retrained = losses(reference)
+            report["retrain"] = {
+                "loss": retrained,
+                "difference": {key: after[key] - retrained[key] for key in after},
+                "training": retrain_report,
+            }
+
+        return report
+
     def compute_loss(self) -> pd.DataFrame:
         """
         Computes the reconstruction loss of the autoencoder on the scaled data.
@@ -118,7 +925,17 @@ class Dyspyosis:
         output : pd.DataFrame
             A dataframe with loss values and optional labels.
         """
-        loss = get_loss(self.autoencoder, self.scaled_data)
+        rows = self.scaled_data.shape[0]
+        with self.profiler.stage("loss", rows=rows), device_scope(self.device):
+            if self.backend == "numpy":
+                loss = self.autoencoder.get_scores(self.scaled_data)[1]
+            else:
+                from .autoencoder import get_loss
+
+                loss = get_loss(self.autoencoder, self.scaled_data)
+
+        if loss.ndim == 2:
+            return scores_frame(loss, None, self.labels)
 
         if self.labels is not None:
             output = pd.DataFrame({"label": self.labels, "loss": loss})
@@ -136,12 +953,435 @@ class Dyspyosis:
         latent : pd.DataFrame
             A DataFrame containing the latent representations of the scaled data.
         """
-        latent = get_latent(self.encoder, self.scaled_data)
+        rows = self.scaled_data.shape[0]
+        with self.profiler.stage("predict", rows=rows), device_scope(self.device):
+            if self.backend == "numpy":
+                latent = self.autoencoder.get_scores(self.scaled_data)[0]
+            else:
+                from .autoencoder import get_latent
 
-        num_columns = latent.shape[1]
-        output = pd.DataFrame(latent, columns=[f"L{i + 1}" for i in range(num_columns)])
+                latent = get_latent(self.encoder, self.scaled_data)
+
+        output = pd.DataFrame(
+            latent.reshape(latent.shape[0], -1),
+            columns=latent_columns(latent.shape[-1], self.ensemble_size),
+        )
 
         if self.labels is not None and len(self.labels) == output.shape[0]:
             output["label"] = self.labels
 
         return output
+
+    def score(self) -> pd.DataFrame:
+        """
+        Computes the reconstruction loss and latent representation of the scaled data in a single forward pass.
+
+        Returns:
+        --------
+        output : pd.DataFrame
+            A DataFrame with the loss, the latent space (columns L1, L2, ...) and optional labels.
+        """
+        rows = self.scaled_data.shape[0]
+        with self.profiler.stage("score", rows=rows), device_scope(self.device):
+            latent, loss = self._get_scores(self.scaled_data)
+
+        return scores_frame(loss, latent, self.labels)
+
+    def score_rarefied(
+        self,
+        repeats: int = 100,
+        quantiles: tuple = (0.05, 0.5, 0.95),
+        latent: bool = False,
+        chunk_size: int = 65536,
+    ) -> pd.DataFrame:
+        """
+        Scores every sample rarefied many times, so scores don't depend on a single random draw.
+
+        Samples are processed in chunks, each chunk is rarefied repeats times and scored in large batched forward
+        passes, after which the rows are summarized per sample. Memory is bounded by chunk_size rows. Results are
+        reproducible for a given seed and chunk_size.
+
+        Parameters:
+        -----------
+        repeats : int
+            Number of rarefactions per sample.
+        quantiles : tuple
+            Quantiles of the loss to report, as fractions.
+        latent : bool
+            If True, the mean and standard deviation of the latent space are reported as well.
+        chunk_size : int
+            Maximum number of rows (samples x repeats) scored at once.
+
+        Returns:
+        --------
+        output : pd.DataFrame
+            A DataFrame with loss_mean, loss_std and a loss_q<percentile> column per quantile, optionally
+            L<i>_mean and L<i>_std columns and labels.
+        """
+        nsamples = self.data.shape[0]
+        block = max(1, chunk_size // repeats)
+
+        summaries = []
+        for start in range(0, nsamples, block):
+            stop = min(start + block, nsamples)
+            with self.profiler.stage("build_dataset", rows=(stop - start) * repeats):
+                expanded = scale_data(
+                    build_dataset(
+                        self.data[start:stop],
+                        self.rarefication_depth,
+                        repeats,
+                        seed=[self.seed, start],
+                        mode=self.mode,
+                        low_depth_policy=None,
+                    ),
+                    self.rarefication_depth,
+                )
+            with (
+                self.profiler.stage("score", rows=expanded.shape[0]),
+                device_scope(self.device),
+            ):
+                encoded, loss = self._get_scores(expanded)
+            if self.ensemble_size is not None:
+                # The distribution of the mean loss of the members
+                loss = loss.mean(axis=1)
+            loss = loss.reshape(repeats, stop - start)
+
+            summary = {"loss_mean": loss.mean(axis=0), "loss_std": loss.std(axis=0)}
+            for q, values in zip(quantiles, np.quantile(loss, quantiles, axis=0)):
+                summary[f"loss_q{q * 100:g}"] = values
+
+            if latent:
+                encoded = encoded.reshape(repeats, stop - start, -1)
+                names = latent_columns(self.encode_dim, self.ensemble_size)
+                for i, name in enumerate(names):
+                    summary[f"{name}_mean"] = encoded[:, :, i].mean(axis=0)
+                    summary[f"{name}_std"] = encoded[:, :, i].std(axis=0)
+
+            summaries.append(pd.DataFrame(summary))
+
+        output = pd.concat(summaries, ignore_index=True)
+
+        if self.labels is not None:
+            output.insert(0, "label", self.labels)
+
+        return output
+
+    def save(self, path) -> None:
+        """
+        Stores the trained autoencoder weights and the settings needed to score new samples in a directory.
+
+        Parameters:
+        -----------
+        path : str or Path
+            The directory to write to, created if it doesn't exist.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        config = {
+            "n_features": self.autoencoder.input_shape[1],
+            "encode_dim": self.encode_dim,
+            "rarefication_depth": self.rarefication_depth,
+            "rarefication_count": self.rarefication_count,
+            "seed": self.seed,
+            "mode": self.mode,
+            "columns": self.columns,
+            "ensemble_size": self.ensemble_size,
+        }
+
+        with open(path / "config.json", "w") as f:
+            json.dump(config, f, indent=2)
+
+        np.savez(
+            path / "weights.npz",
+            **dict(zip(WEIGHT_NAMES, self.autoencoder.get_weights())),
+        )
+
+    def export(self, path) -> None:
+        """
+        Exports the trained weights and scoring settings to a single .npz file, which can be loaded by
+        NumpyModel to score samples without TensorFlow.
+
+        Parameters:
+        -----------
+        path : str or Path
+            The file to write to.
+        """
+        if self.ensemble_size is not None:
+            raise ValueError(
+                "NumpyModel does not support ensembles, use save and Dyspyosis.load instead."
+            )
+
+        NumpyModel(
+            *self.autoencoder.get_weights(),
+            rarefication_depth=self.rarefication_depth,
+            seed=self.seed,
+            mode=self.mode,
+            columns=self.columns,
+        ).save(path)
+
+    @classmethod
+    def load(
+        cls, path, device: Optional[str] = None, backend: str = "tensorflow"
+    ) -> "Dyspyosis":
+        """
+        Restores a model stored with save. No training data is generated, the returned object can only be used
+        to score new samples with score_new.
+
+        Parameters:
+        -----------
+        path : str or Path
+            The directory the model was saved to.
+        device : str, optional
+            The device to run the model on, see __init__.
+        backend : str
+            "tensorflow" or "numpy", see __init__. Models can be loaded with either backend.
+
+        Returns:
+        --------
+        dyspyosis : Dyspyosis
+            The restored model.
+        """
+        path = Path(path)
+        with open(path / "config.json") as f:
+            config = json.load(f)
+        _check_backend(backend, device, config.get("ensemble_size"))
+
+        dyspyosis = cls.__new__(cls)
+        dyspyosis.data = None
+        dyspyosis.labels = None
+        dyspyosis.sample_mask = None
+        dyspyosis.scaled_data = None
+        dyspyosis.x_train = None
+        dyspyosis.x_test = None
+        dyspyosis.training_report = None
+        dyspyosis.streaming = False
+        dyspyosis.rarefication_depth = config["rarefication_depth"]
+        dyspyosis.rarefication_count = config["rarefication_count"]
+        dyspyosis.encode_dim = config["encode_dim"]
+        dyspyosis.seed = config["seed"]
+        dyspyosis.mode = config["mode"]
+        dyspyosis.columns = config["columns"]
+        dyspyosis.profiler = Profiler()
+        dyspyosis.store = None
+        dyspyosis._trainer = None
+        dyspyosis.ensemble_size = config.get("ensemble_size")
+        dyspyosis.backend = backend
+        dyspyosis.device, _ = dyspyosis._select_device(device, config["n_features"])
+
+        dyspyosis._build_model(config["n_features"])
+        with np.load(path / "weights.npz") as weights, device_scope(dyspyosis.device):
+            dyspyosis.autoencoder.set_weights([weights[k] for k in WEIGHT_NAMES])
+
+        return dyspyosis
+
+    @classmethod
+    def from_store(
+        cls,
+        store,
+        encode_dim: int = 4,
+        profiler: Optional[Profiler] = None,
+        ensemble_size: Optional[int] = None,
+        device: Optional[str] = None,
+        backend: str = "tensorflow",
+    ) -> "Dyspyosis":
+        """
+        Creates a model that trains on a disk-backed TrainingStore, for data that doesn't fit in memory.
+
+        The counts, training and validation data stay on disk as memory maps, run_training draws shuffled batches
+        from them and scales them one at a time. Only the scaled data (a single rarefaction of every sample, used
+        by compute_loss, get_latent and score) is loaded in memory.
+
+        Parameters:
+        -----------
+        store : TrainingStore, str or Path
+            The store, or the directory of one.
+        encode_dim : int
+            Number of dimensions the latent space should have.
+        profiler : Profiler, optional
+            Records the stages of the pipeline, see profiling.Profiler.
+        ensemble_size : int, optional
+            Number of autoencoders to train as an ensemble, see __init__.
+        device : str, optional
+            The device to build, train and run the model on, see __init__.
+        backend : str
+            "tensorflow" or "numpy", see __init__.
+
+        Returns:
+        --------
+        dyspyosis : Dyspyosis
+            The model, ready to be trained.
+        """
+        _check_backend(backend, device, ensemble_size)
+        if not isinstance(store, TrainingStore):
+            store = TrainingStore(store)
+        meta = store.meta
+
+        dyspyosis = cls.__new__(cls)
+        dyspyosis.store = store
+        dyspyosis.profiler = Profiler() if profiler is None else profiler
+        dyspyosis._trainer = None
+        dyspyosis.data = store.counts
+        dyspyosis.labels = store.labels
+        dyspyosis.sample_mask = np.asarray(store.sample_mask)
+        dyspyosis.training_report = None
+        dyspyosis.streaming = False
+        dyspyosis.rarefication_depth = meta["rarefication_depth"]
+        dyspyosis.rarefication_count = meta["rarefication_count"]
+        dyspyosis.encode_dim = encode_dim
+        dyspyosis.ensemble_size = ensemble_size
+        dyspyosis.backend = backend
+        dyspyosis.seed = meta["seed"]
+        dyspyosis.mode = meta["mode"]
+        dyspyosis.columns = store.columns
+        dyspyosis.x_train = store.train
+        dyspyosis.x_test = store.validation
+
+        with dyspyosis.profiler.stage("rarefy", rows=dyspyosis.data.shape[0]):
+            dyspyosis.scaled_data = scale_data(
+                store.rarefied, dyspyosis.rarefication_depth
+            )
+        dyspyosis.device, _ = dyspyosis._select_device(device, dyspyosis.data.shape[1])
+        with dyspyosis.profiler.stage("build_model"):
+            dyspyosis._build_model(dyspyosis.data.shape[1])
+
+        return dyspyosis
+
+    @classmethod
+    def from_chunks(
+        cls,
+        source,
+        directory,
+        rarefication_depth: int = 5000,
+        rarefication_count: int = 10,
+        encode_dim: int = 4,
+        seed: int = 0,
+        mode: str = "with_replacement",
+        low_depth_policy: str = "keep",
+        validation_fraction: float = 0.15,
+        chunk_size: int = 65536,
+        sep: Optional[str] = None,
+        n_jobs: int = 1,
+        profiler: Optional[Profiler] = None,
+        ensemble_size: Optional[int] = None,
+        device: Optional[str] = None,
+        backend: str = "tensorflow",
+    ) -> "Dyspyosis":
+        """
+        Reads a count table from a file or a chunk iterator, rarefies and expands it chunk by chunk into a
+        TrainingStore in directory and creates a model on it, see TrainingStore.build and from_store. Samples are
+        split in a training and validation set as a whole, reproducibly for a given seed.
+
+        Returns:
+        --------
+        dyspyosis : Dyspyosis
+            The model, ready to be trained.
+        """
+        _check_backend(backend, device, ensemble_size)
+        store = TrainingStore.build(
+            source,
+            directory,
+            rarefication_depth=rarefication_depth,
+            rarefication_count=rarefication_count,
+            seed=seed,
+            mode=mode,
+            low_depth_policy=low_depth_policy,
+            validation_fraction=validation_fraction,
+            chunk_size=chunk_size,
+            sep=sep,
+            n_jobs=n_jobs,
+            profiler=profiler,
+        )
+
+        return cls.from_store(
+            store,
+            encode_dim=encode_dim,
+            profiler=profiler,
+            ensemble_size=ensemble_size,
+            device=device,
+            backend=backend,
+        )
+
+    def score_new(
+        self,
+        counts,
+        labels: Optional[list] = None,
+        columns: Optional[list] = None,
+        chunk_size: int = 65536,
+        low_depth_policy: str = "keep",
+    ) -> pd.DataFrame:
+        """
+        Rarefies and scores new samples with the trained model, in chunks to keep memory bounded.
+
+        Parameters:
+        -----------
+        counts : pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix
+            A count table of shape (n_samples, n_features).
+        labels : list, optional
+            Labels for the samples, taken from the index if counts is a DataFrame.
+        columns : list, optional
+            Names of the features in counts, taken from counts.columns if counts is a DataFrame. If the model
+            has feature names, columns are aligned to them: missing features are set to zero, others are dropped.
+        chunk_size : int
+            Number of samples rarefied and scored at once.
+        low_depth_policy : str
+            What to do with samples that have fewer reads than the rarefication_depth: "keep", "drop" or "error".
+
+        Returns:
+        --------
+        output : pd.DataFrame
+            A DataFrame with the loss, the latent space (columns L1, L2, ...) and optional labels, like score().
+        """
+        counts, labels = prepare_counts(
+            counts,
+            self.rarefication_depth,
+            reference=self.columns,
+            n_features=self.autoencoder.input_shape[1],
+            labels=labels,
+            columns=columns,
+            low_depth_policy=low_depth_policy,
+        )
+
+        with (
+            self.profiler.stage("score_new", rows=counts.shape[0]),
+            device_scope(self.device),
+        ):
+            scores = [
+                self._get_scores(chunk)
+                for chunk in rarefied_chunks(
+                    counts,
+                    self.rarefication_depth,
+                    seed=self.seed,
+                    mode=self.mode,
+                    chunk_size=chunk_size,
+                    low_depth_policy=None,
+                )
+            ]
+
+        return scores_frame(
+            np.concatenate([loss for _, loss in scores]),
+            np.concatenate([latent for latent, _ in scores]),
+            labels,
+        )
+
+    def memory_usage(self) -> pd.Series:
+        """
+        Reports the memory used by the input data, the scaled data, the training and validation data (stored as
+        integer counts, see utils.count_dtype) and the model weights. Training data in a memory map, or shared
+        through a RowSubset, takes no memory of this object.
+
+        Returns:
+        --------
+        usage : pd.Series
+            The size in bytes per item and their total.
+        """
+        usage = pd.Series(
+            {
+                name: _nbytes(getattr(self, name))
+                for name in ("data", "scaled_data", "x_train", "x_test")
+            }
+        )
+        usage["weights"] = sum(w.nbytes for w in self.autoencoder.get_weights())
+        usage["total"] = usage.sum()
+
+        return usage
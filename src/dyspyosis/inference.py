@@ -0,0 +1,384 @@
+import json
+from itertools import chain
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .utils import prepare_counts, rarefied_chunks, rarefy, scale_data
+
+# Names of the autoencoder weights, in the order returned by autoencoder.get_weights()
+WEIGHT_NAMES = ("encoder_kernel", "encoder_bias", "decoder_kernel", "decoder_bias")
+
+
+def latent_columns(encoding_dim, ensemble_size=None):
+    """
+    Returns the names of the latent space columns: L1, L2, ... or m1_L1, m1_L2, ..., m2_L1, ... per member of an
+    ensemble.
+    """
+    names = [f"L{i + 1}" for i in range(encoding_dim)]
+    if ensemble_size is None:
+        return names
+
+    return [f"m{k + 1}_{name}" for k in range(ensemble_size) for name in names]
+
+
+def scores_frame(loss, latent, labels=None):
+    """
+    Combines per-sample losses and latent representations in a DataFrame.
+
+    For an ensemble the loss column holds the mean loss of the members and loss_std its standard deviation,
+    followed by the loss of every member (loss_m1, loss_m2, ...). The latent space is reported per member, as the
+    latent axes of independently trained members don't correspond to each other.
+
+    Parameters:
+    -----------
+    loss : numpy.ndarray
+        A 1D array with the loss per sample, or a 2D array of shape (n_samples, members) for an ensemble.
+    latent : numpy.ndarray or None
+        A 2D array of shape (n_samples, encoding_dim), or (n_samples, members, encoding_dim) for an ensemble.
+    labels : list, optional
+        Labels for the samples.
+
+    Returns:
+    --------
+    output : pd.DataFrame
+        A DataFrame with an optional label column, the loss and the latent space (columns L1, L2, ...).
+    """
+    if loss.ndim == 2:
+        columns = {"loss": loss.mean(axis=1), "loss_std": loss.std(axis=1)}
+        for k in range(loss.shape[1]):
+            columns[f"loss_m{k + 1}"] = loss[:, k]
+    else:
+        columns = {"loss": loss}
+
+    if latent is not None:
+        ensemble_size = latent.shape[1] if latent.ndim == 3 else None
+        names = latent_columns(latent.shape[-1], ensemble_size)
+        columns.update(zip(names, latent.reshape(latent.shape[0], -1).T))
+
+    output = pd.DataFrame(columns)
+
+    if labels is not None:
+        output.insert(0, "label", labels)
+
+    return output
+
+
+class NumpyModel:
+    """
+    A NumPy implementation of a trained dyspyosis autoencoder, to score samples without TensorFlow.
+
+    The forward pass (Dense relu encoder, Dense softmax decoder) is computed in float32 using blocked matrix
+    multiplications. Losses and latent representations match the Keras model to within a relative tolerance of
+    1e-5 (absolute 1e-7), differences are due to the order of floating point operations.
+
+    Attributes:
+    -----------
+    encoder_kernel, encoder_bias, decoder_kernel, decoder_bias : numpy.ndarray
+        The float32 weights of the autoencoder.
+    rarefication_depth : int
+        Depth new samples are rarefied to.
+    seed : int
+        The random state seed used for rarefication.
+    mode : str
+        Whether reads are sampled "with_replacement" or "without_replacement" during rarefication.
+    columns : list, optional
+        The names of the features the model was trained on.
+    """
+
+    def __init__(
+        self,
+        encoder_kernel,
+        encoder_bias,
+        decoder_kernel,
+        decoder_bias,
+        rarefication_depth: int = 5000,
+        seed: int = 0,
+        mode: str = "with_replacement",
+        columns: Optional[list] = None,
+    ):
+        self.encoder_kernel = np.asarray(encoder_kernel, dtype=np.float32)
+        self.encoder_bias = np.asarray(encoder_bias, dtype=np.float32)
+        self.decoder_kernel = np.asarray(decoder_kernel, dtype=np.float32)
+        self.decoder_bias = np.asarray(decoder_bias, dtype=np.float32)
+        self.rarefication_depth = rarefication_depth
+        self.seed = seed
+        self.mode = mode
+        self.columns = columns
+
+    @classmethod
+    def load(cls, path) -> "NumpyModel":
+        """
+        Loads a model from a .npz file written by Dyspyosis.export or a directory written by Dyspyosis.save.
+        Ensembles are not supported, load those with Dyspyosis.load.
+
+        Parameters:
+        -----------
+        path : str or Path
+            The file or directory to load.
+
+        Returns:
+        --------
+        model : NumpyModel
+            The loaded model.
+        """
+        path = Path(path)
+
+        if path.is_dir():
+            with open(path / "config.json") as f:
+                config = json.load(f)
+            if config.get("ensemble_size") is not None:
+                raise ValueError(
+                    f"{path} holds an ensemble, which NumpyModel does not support, use Dyspyosis.load instead."
+                )
+            path = path / "weights.npz"
+        else:
+            config = None
+
+        with np.load(path) as weights:
+            if config is None:
+                config = json.loads(str(weights["config"]))
+            arrays = [weights[k] for k in WEIGHT_NAMES]
+
+        return cls(
+            *arrays,
+            rarefication_depth=config["rarefication_depth"],
+            seed=config["seed"],
+            mode=config["mode"],
+            columns=config["columns"],
+        )
+
+    def save(self, path) -> None:
+        """
+        Writes the weights and scoring settings to a single .npz file.
+
+        Parameters:
+        -----------
+        path : str or Path
+            The file to write to.
+        """
+        config = {
+            "rarefication_depth": self.rarefication_depth,
+            "seed": self.seed,
+            "mode": self.mode,
+            "columns": self.columns,
+        }
+
+        np.savez(
+            path,
+            encoder_kernel=self.encoder_kernel,
+            encoder_bias=self.encoder_bias,
+            decoder_kernel=self.decoder_kernel,
+            decoder_bias=self.decoder_bias,
+            config=np.array(json.dumps(config)),
+        )
+
+    def _forward(self, chunk):
+        if sp.issparse(chunk):
+            chunk = sp.csr_matrix(chunk, dtype=np.float32)
+        else:
+            chunk = np.asarray(chunk, dtype=np.float32)
+
+        encoded = np.asarray(chunk @ self.encoder_kernel)
+        encoded += self.encoder_bias
+        np.maximum(encoded, 0, out=encoded)
+
+        decoded = encoded @ self.decoder_kernel
+        decoded += self.decoder_bias
+        decoded -= decoded.max(axis=1, keepdims=True)
+        np.exp(decoded, out=decoded)
+        decoded /= decoded.sum(axis=1, keepdims=True)
+
+        return encoded, decoded
+
+    def get_scores(self, data, chunk_size: int = 8192):
+        """
+        Computes the latent representation and reconstruction loss of every sample.
+
+        Parameters:
+        -----------
+        data : numpy.ndarray or scipy.sparse.csr_matrix
+            A 2D array of shape (n_samples, n_features) with the scaled data.
+        chunk_size : int
+            Number of samples multiplied at once.
+
+        Returns:
+        --------
+        latent : numpy.ndarray
+            A float32 array of shape (n_samples, encoding_dim).
+        loss : numpy.ndarray
+            A float32 array of shape (n_samples,) with the mean squared error per sample.
+        """
+        latent = np.empty((data.shape[0], self.encoder_kernel.shape[1]), np.float32)
+        loss = np.empty(data.shape[0], dtype=np.float32)
+
+        for start in range(0, data.shape[0], chunk_size):
+            chunk = data[start : start + chunk_size]
+            encoded, decoded = self._forward(chunk)
+            if sp.issparse(chunk):
+                chunk = chunk.toarray()
+            decoded -= chunk
+            latent[start : start + chunk_size] = encoded
+            loss[start : start + chunk_size] = np.mean(np.square(decoded), axis=1)
+
+        return latent, loss
+
+    def get_latent(self, data, chunk_size: int = 8192):
+        """
+        Computes the latent representation (encoder activations) of every sample, see get_scores.
+        """
+        return self.get_scores(data, chunk_size=chunk_size)[0]
+
+    def get_loss(self, data, chunk_size: int = 8192):
+        """
+        Computes the reconstruction loss of every sample, see get_scores.
+        """
+        return self.get_scores(data, chunk_size=chunk_size)[1]
+
+    def score_new(
+        self,
+        counts,
+        labels: Optional[list] = None,
+        columns: Optional[list] = None,
+        chunk_size: int = 65536,
+        low_depth_policy: str = "keep",
+    ) -> pd.DataFrame:
+        """
+        Rarefies and scores new samples, giving the same results as Dyspyosis.score_new (within tolerance).
+
+        Parameters:
+        -----------
+        counts : pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix
+            A count table of shape (n_samples, n_features).
+        labels : list, optional
+            Labels for the samples, taken from the index if counts is a DataFrame.
+        columns : list, optional
+            Names of the features in counts, taken from counts.columns if counts is a DataFrame.
+        chunk_size : int
+            Number of samples rarefied and scored at once.
+        low_depth_policy : str
+            What to do with samples that have fewer reads than the rarefication_depth: "keep", "drop" or "error".
+
+        Returns:
+        --------
+        output : pd.DataFrame
+            A DataFrame with the loss, the latent space (columns L1, L2, ...) and optional labels.
+        """
+        counts, labels = prepare_counts(
+            counts,
+            self.rarefication_depth,
+            reference=self.columns,
+            n_features=self.encoder_kernel.shape[0],
+            labels=labels,
+            columns=columns,
+            low_depth_policy=low_depth_policy,
+        )
+
+        scores = [
+            self.get_scores(chunk)
+            for chunk in rarefied_chunks(
+                counts,
+                self.rarefication_depth,
+                seed=self.seed,
+                mode=self.mode,
+                chunk_size=chunk_size,
+                low_depth_policy=None,
+            )
+        ]
+
+        return scores_frame(
+            np.concatenate([loss for _, loss in scores]),
+            np.concatenate([latent for latent, _ in scores]),
+            labels,
+        )
+
+    def _score_block(self, counts, labels, start):
+        scaled = scale_data(
+            rarefy(
+                counts,
+                self.rarefication_depth,
+                seed=[self.seed, start],
+                mode=self.mode,
+                low_depth_policy=None,
+            ),
+            self.rarefication_depth,
+        )
+        latent, loss = self.get_scores(scaled)
+
+        return scores_frame(loss, latent, labels)
+
+    def score_chunks(
+        self, tables, chunk_size: int = 65536, low_depth_policy: str = "keep"
+    ):
+        """
+        Rarefies and scores a count table that arrives in pieces, e.g. read with pandas using chunksize, and yields
+        the scores as they are computed, so memory doesn't grow with the size of the table.
+
+        The kept samples are rarefied in blocks of chunk_size rows regardless of how the input is split, so the
+        concatenated output is identical to that of score_new on the whole table with the same chunk_size.
+
+        Parameters:
+        -----------
+        tables : iterable of pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix
+            Consecutive pieces of a count table, labels and feature names are taken from DataFrames. Either all
+            pieces or none of them should be DataFrames, so that every sample or none has a label.
+        chunk_size : int
+            Number of samples rarefied and scored at once.
+        low_depth_policy : str
+            What to do with samples that have fewer reads than the rarefication_depth: "keep", "drop" or "error".
+
+        Yields:
+        -------
+        output : pd.DataFrame
+            The scores of the next chunk_size samples (fewer for the last one), see score_new.
+        """
+        pending, pending_labels = [], []
+        npending = 0
+        start = 0
+        labeled = None
+
+        def take(n):
+            if sp.issparse(pending[0]):
+                counts = sp.vstack(pending, format="csr")
+            else:
+                counts = np.concatenate(pending)
+            labels = None
+            if pending_labels[0] is not None:
+                labels = list(chain.from_iterable(pending_labels))
+            pending.clear()
+            pending_labels.clear()
+            if n < counts.shape[0]:
+                pending.append(counts[n:])
+                pending_labels.append(None if labels is None else labels[n:])
+                labels = None if labels is None else labels[:n]
+            return counts[:n], labels
+
+        for table in tables:
+            counts, labels = prepare_counts(
+                table,
+                self.rarefication_depth,
+                reference=self.columns,
+                n_features=self.encoder_kernel.shape[0],
+                low_depth_policy=low_depth_policy,
+            )
+            if labeled is None:
+                labeled = labels is not None
+            elif labeled != (labels is not None):
+                raise ValueError(
+                    "Either all pieces of the table need labels (DataFrames) or none of them."
+                )
+            pending.append(counts)
+            pending_labels.append(labels)
+            npending += counts.shape[0]
+
+            while npending >= chunk_size:
+                block, block_labels = take(chunk_size)
+                yield self._score_block(block, block_labels, start)
+                start += chunk_size
+                npending -= chunk_size
+
+        if npending > 0:
+            yield self._score_block(*take(npending), start)
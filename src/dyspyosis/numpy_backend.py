@@ -0,0 +1,286 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .inference import NumpyModel
+
+
+class Adadelta:
+    """
+    The Adadelta optimizer, with the defaults and update rule of Keras.
+
+    Attributes:
+    -----------
+    learning_rate : float
+        Scales every update, see lr_schedule in Dyspyosis.run_training.
+    rho : float
+        Decay rate of the running averages of the squared gradients and updates.
+    epsilon : float
+        Added to the running averages before taking their square root.
+    iterations : int
+        Number of updates applied so far.
+    """
+
+    def __init__(self, learning_rate=0.001, rho=0.95, epsilon=1e-7):
+        self.learning_rate = learning_rate
+        self.rho = rho
+        self.epsilon = epsilon
+        self.iterations = 0
+        self.accumulated_grads = None
+        self.accumulated_deltas = None
+
+    def apply(self, variables, gradients):
+        """
+        Updates variables in place with their gradients.
+        """
+        if self.accumulated_grads is None:
+            self.accumulated_grads = [np.zeros_like(v) for v in variables]
+            self.accumulated_deltas = [np.zeros_like(v) for v in variables]
+
+        rho = np.float32(self.rho)
+        epsilon = np.float32(self.epsilon)
+        learning_rate = np.float32(self.learning_rate)
+
+        for variable, grad, accumulated_grad, accumulated_delta in zip(
+            variables, gradients, self.accumulated_grads, self.accumulated_deltas
+        ):
+            accumulated_grad *= rho
+            accumulated_grad += (1 - rho) * np.square(grad)
+            delta = np.sqrt(accumulated_delta + epsilon)
+            delta /= np.sqrt(accumulated_grad + epsilon)
+            delta *= -grad
+            accumulated_delta *= rho
+            accumulated_delta += (1 - rho) * np.square(delta)
+            variable += learning_rate * delta
+
+        self.iterations += 1
+
+
+class NumpyAutoencoder:
+    """
+    The dyspyosis autoencoder implemented in NumPy, so it can be trained without TensorFlow.
+
+    The model is the one built by autoencoder.create_autoencoder: a Dense relu encoder with an L1 activity penalty
+    and a Dense softmax decoder, Glorot uniform initialized kernels and zero biases, trained with Adadelta on the
+    mean squared error. As in Keras, the penalty of a batch is divided by its size. Gradients are computed
+    analytically with float32 matrix multiplications, sparse batches are only multiplied in sparse form.
+
+    Attributes:
+    -----------
+    encoder_kernel, encoder_bias, decoder_kernel, decoder_bias : numpy.ndarray
+        The float32 weights, in the order of WEIGHT_NAMES.
+    regularization_value : float
+        The L1 activity regularization factor.
+    optimizer : Adadelta
+        The optimizer and its state.
+    """
+
+    def __init__(self, n_features, encoding_dim=4, regularization_value=10e-5, seed=0):
+        rng = np.random.default_rng(seed)
+
+        def glorot_uniform(fan_in, fan_out):
+            limit = np.sqrt(6 / (fan_in + fan_out))
+            return rng.uniform(-limit, limit, (fan_in, fan_out)).astype(np.float32)
+
+        self.encoder_kernel = glorot_uniform(n_features, encoding_dim)
+        self.encoder_bias = np.zeros(encoding_dim, dtype=np.float32)
+        self.decoder_kernel = glorot_uniform(encoding_dim, n_features)
+        self.decoder_bias = np.zeros(n_features, dtype=np.float32)
+        self.regularization_value = regularization_value
+        self.optimizer = Adadelta()
+
+    @property
+    def input_shape(self):
+        return (None, self.encoder_kernel.shape[0])
+
+    @property
+    def weights(self) -> list:
+        return [
+            self.encoder_kernel,
+            self.encoder_bias,
+            self.decoder_kernel,
+            self.decoder_bias,
+        ]
+
+    def get_weights(self) -> list:
+        return [w.copy() for w in self.weights]
+
+    def set_weights(self, weights):
+        for variable, value in zip(self.weights, weights):
+            variable[...] = value
+
+    def _forward(self, batch):
+        # Returns the encoder activations and the reconstruction
+        return NumpyModel(*self.weights)._forward(batch)
+
+    def _batch_loss(self, batch, encoded, decoded):
+        # The loss Keras reports for a batch: mean squared error plus the activity penalty divided by the batch size
+        target = batch.toarray() if sp.issparse(batch) else batch
+        mse = float(np.mean(np.square(decoded - target)))
+
+        return mse + self.regularization_value * float(encoded.sum()) / batch.shape[0]
+
+    def train_step(self, batch) -> float:
+        """
+        Updates the weights with the gradient of the loss on a batch of scaled data.
+
+        Returns:
+        --------
+        loss : float
+            The loss of the batch before the update.
+        """
+        encoded, decoded = self._forward(batch)
+        loss = self._batch_loss(batch, encoded, decoded)
+
+        nrows, nfeatures = batch.shape
+        target = batch.toarray() if sp.issparse(batch) else batch
+
+        # Mean squared error and softmax
+        grad = decoded - target
+        grad *= np.float32(2 / (nrows * nfeatures))
+        grad -= np.sum(grad * decoded, axis=1, keepdims=True)
+        grad *= decoded
+
+        decoder_kernel_grad = encoded.T @ grad
+        decoder_bias_grad = grad.sum(axis=0)
+
+        # Activity penalty (encoded is non-negative) and relu
+        grad = grad @ self.decoder_kernel.T
+        grad += np.float32(self.regularization_value / nrows)
+        grad *= encoded > 0
+
+        encoder_kernel_grad = np.asarray(batch.T @ grad, dtype=np.float32)
+        encoder_bias_grad = grad.sum(axis=0)
+
+        self.optimizer.apply(
+            self.weights,
+            [
+                encoder_kernel_grad,
+                encoder_bias_grad,
+                decoder_kernel_grad,
+                decoder_bias_grad,
+            ],
+        )
+
+        return loss
+
+    def evaluate(self, batches) -> float:
+        """
+        Computes the loss over batches of scaled data as Keras evaluate does, the mean of the batch losses
+        weighted by their size.
+        """
+        total, rows = 0.0, 0
+        for batch in batches:
+            total += self._batch_loss(batch, *self._forward(batch)) * batch.shape[0]
+            rows += batch.shape[0]
+
+        return total / rows
+
+    def get_scores(self, data, chunk_size: int = 8192):
+        """
+        Computes the latent representation and reconstruction loss of every sample, see NumpyModel.get_scores.
+        """
+        return NumpyModel(*self.weights).get_scores(data, chunk_size=chunk_size)
+
+    def fit(
+        self,
+        batches,
+        steps_per_epoch,
+        epochs,
+        validation_data=None,
+        validation_freq=1,
+        patience=None,
+        min_delta=0.0,
+        restore_best_weights=True,
+        lr_schedule=None,
+        profiler=None,
+        rows=None,
+        verbose=0,
+    ) -> dict:
+        """
+        Trains for a number of epochs, with the early stopping and learning rate schedule of Dyspyosis.run_training.
+
+        Parameters:
+        -----------
+        batches : iterator
+            Yields the scaled training batches, steps_per_epoch of them per epoch.
+        steps_per_epoch : int
+            Number of batches per epoch.
+        epochs : int
+            The (maximum) number of epochs.
+        validation_data : callable, optional
+            A function returning an iterator over the scaled validation batches.
+        validation_freq, patience, min_delta, restore_best_weights, lr_schedule, verbose :
+            See Dyspyosis.run_training.
+        profiler : Profiler, optional
+            Records every epoch as a stage, like training.StageCallback.
+        rows : int, optional
+            The number of rows per epoch, for the profiler.
+
+        Returns:
+        --------
+        result : dict
+            The number of epochs trained, whether training stopped early, the best validation loss and its epoch
+            (None without patience) and the loss history.
+        """
+        history = {}
+        best, best_epoch, best_weights = np.inf, None, None
+        wait = 0
+        stopped = False
+
+        epoch = 0
+        while epoch < epochs and not stopped:
+            token = (
+                None
+                if profiler is None
+                else profiler.start("epoch", rows=rows, epoch=epoch)
+            )
+            start = time.perf_counter()
+            if lr_schedule is not None:
+                self.optimizer.learning_rate = float(
+                    lr_schedule(epoch, self.optimizer.learning_rate)
+                )
+
+            total, nrows = 0.0, 0
+            for _ in range(steps_per_epoch):
+                batch = next(batches)
+                total += self.train_step(batch) * batch.shape[0]
+                nrows += batch.shape[0]
+            logs = {"loss": total / nrows}
+
+            if validation_data is not None and (epoch + 1) % validation_freq == 0:
+                logs["val_loss"] = self.evaluate(validation_data())
+
+                if patience is not None:
+                    if logs["val_loss"] < best - min_delta:
+                        best, best_epoch, wait = logs["val_loss"], epoch, 0
+                        if restore_best_weights:
+                            best_weights = self.get_weights()
+                    else:
+                        wait += 1
+                        stopped = wait >= patience
+            if lr_schedule is not None:
+                logs["learning_rate"] = self.optimizer.learning_rate
+
+            for key, value in logs.items():
+                history.setdefault(key, []).append(value)
+            if profiler is not None:
+                profiler.stop(token, **logs)
+            if verbose != 0:
+                losses = " - ".join(f"{k}: {v:.4f}" for k, v in logs.items())
+                print(
+                    f"Epoch {epoch + 1}/{epochs} - {time.perf_counter() - start:.2f}s - {losses}"
+                )
+            epoch += 1
+
+        if best_weights is not None:
+            self.set_weights(best_weights)
+
+        return {
+            "epochs": epoch,
+            "stopped_early": stopped,
+            "best_val_loss": None if patience is None else float(best),
+            "best_epoch": best_epoch,
+            "history": history,
+        }
@@ -0,0 +1,220 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+import pandas as pd
+
+
+class Profiler:
+    """
+    Records the wall time, number of rows and peak memory of the stages of a Dyspyosis pipeline (rarefy,
+    build_dataset, split, every epoch, predict, loss, ...) and passes every record to its sinks.
+
+    A record is a dictionary with the stage name, wall_time in seconds, rows processed, peak_memory in bytes
+    allocated on top of what was in use when the stage started (NumPy and Python allocations as seen by tracemalloc,
+    memory held by TensorFlow isn't included) and stage specific details, such as the epoch and losses. Without sinks
+    nothing is measured.
+
+    Attributes:
+    -----------
+    sinks : list
+        Callables receiving every record, e.g. a Report, a JsonLines or a ProgressLog object or any function.
+    memory : bool
+        Whether to trace the peak memory of each stage. Tracing slows down allocations, set it to False to only
+        record times.
+    """
+
+    def __init__(self, *sinks, memory: bool = True):
+        self.sinks = list(sinks)
+        self.memory = memory
+        self._peaks = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sinks)
+
+    def start(self, stage: str, rows: Optional[int] = None, **info):
+        """
+        Starts measuring a stage, to be ended with stop. Stages may be nested.
+
+        Returns:
+        --------
+        token : dict or None
+            The state of the running stage, None if the profiler has no sinks.
+        """
+        if not self.enabled:
+            return None
+
+        token = {"stage": stage, "rows": rows, **info}
+        if self.memory:
+            if tracemalloc.is_tracing():
+                # Hand the peak so far to the enclosing stage before measuring this one from scratch
+                if self._peaks:
+                    self._peaks[-1] = max(
+                        self._peaks[-1], tracemalloc.get_traced_memory()[1]
+                    )
+                token["_owner"] = False
+            else:
+                tracemalloc.start()
+                token["_owner"] = True
+            tracemalloc.reset_peak()
+            token["_base"] = tracemalloc.get_traced_memory()[0]
+            self._peaks.append(0)
+
+        token["_start"] = time.perf_counter()
+        return token
+
+    def stop(self, token, **info) -> dict:
+        """
+        Ends a stage started with start and passes its record to the sinks.
+
+        Parameters:
+        -----------
+        token : dict or None
+            As returned by start.
+        info :
+            Details to add to the record, e.g. the loss.
+
+        Returns:
+        --------
+        record : dict or None
+            The record of the stage.
+        """
+        if token is None:
+            return None
+
+        wall_time = time.perf_counter() - token.pop("_start")
+        record = {k: v for k, v in token.items() if not k.startswith("_")}
+        record.update(wall_time=wall_time, **info)
+
+        peak = None
+        if "_base" in token:
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if token["_owner"]:
+                tracemalloc.stop()
+            elif self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            peak -= token["_base"]
+        record["peak_memory"] = peak
+        record["timestamp"] = time.time()
+
+        for sink in self.sinks:
+            sink(record)
+
+        return record
+
+    @contextmanager
+    def stage(self, stage: str, rows: Optional[int] = None, **info):
+        """
+        Measures the code in a with block as a stage. Yields a dictionary, details added to it end up in the record.
+        """
+        token = self.start(stage, rows, **info)
+        details = {}
+        try:
+            yield details
+        finally:
+            self.stop(token, **details)
+
+
+class Report:
+    """
+    A sink keeping every record in memory.
+
+    Attributes:
+    -----------
+    records : list of dict
+        The records received so far.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the records as a DataFrame, one row per stage.
+        """
+        return pd.DataFrame(self.records)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Summarizes the records per stage.
+
+        Returns:
+        --------
+        summary : pd.DataFrame
+            Per stage the number of records, the total wall_time and rows, the throughput in rows per second and
+            the largest peak_memory.
+        """
+        df = self.to_frame()
+        for column in ("rows", "peak_memory"):
+            if column not in df:
+                df[column] = None
+
+        summary = df.groupby("stage", sort=False).agg(
+            count=("wall_time", "size"),
+            wall_time=("wall_time", "sum"),
+            rows=("rows", "sum"),
+            peak_memory=("peak_memory", "max"),
+        )
+        summary.insert(3, "rows_per_s", summary["rows"] / summary["wall_time"])
+
+        return summary
+
+
+class JsonLines:
+    """
+    A sink writing every record as a JSON object on its own line, e.g. to collect structured logs.
+
+    Attributes:
+    -----------
+    target : str, Path or file-like
+        A file to append to or an open text stream, stderr by default.
+    """
+
+    def __init__(self, target=None):
+        self.target = sys.stderr if target is None else target
+
+    def __call__(self, record):
+        line = json.dumps(record, default=float) + "\n"
+        if hasattr(self.target, "write"):
+            self.target.write(line)
+            self.target.flush()
+        else:
+            with open(self.target, "a") as f:
+                f.write(line)
+
+
+class ProgressLog:
+    """
+    A sink printing a single line every few epochs, a compact replacement for the Keras progress bar when training
+    with verbose=0.
+
+    Attributes:
+    -----------
+    every : int
+        Print every this many epochs.
+    stream : file-like
+        Where to print to, stdout by default.
+    """
+
+    def __init__(self, every: int = 100, stream=None):
+        self.every = every
+        self.stream = stream
+
+    def __call__(self, record):
+        if record["stage"] != "epoch" or (record["epoch"] + 1) % self.every != 0:
+            return
+
+        losses = " ".join(
+            f"{k}={record[k]:.6g}" for k in ("loss", "val_loss") if k in record
+        )
+        print(
+            f"Epoch {record['epoch'] + 1}: {losses} ({record['wall_time']:.3f} s)",
+            file=self.stream or sys.stdout,
+        )
@@ -0,0 +1,336 @@
+import inspect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Optional
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .utils import _shared_empty, build_dataset, check_depth, count_dtype
+
+# Settings of a job that are passed to Dyspyosis, together with the name of the cohort
+CONFIG_KEYS = (
+    "cohort",
+    "encode_dim",
+    "ensemble_size",
+    "seed",
+    "rarefication_depth",
+    "rarefication_count",
+    "mode",
+    "low_depth_policy",
+    "backend",
+)
+
+# Settings that determine the expanded dataset, jobs that only differ in other settings share it
+DATASET_KEYS = (
+    "cohort",
+    "rarefication_depth",
+    "rarefication_count",
+    "seed",
+    "mode",
+    "low_depth_policy",
+)
+
+_job_worker = {}
+
+
+def config_grid(**options) -> list:
+    """
+    Builds the configurations for run_jobs from every combination of the given options.
+
+    Example: config_grid(encode_dim=[4, 6, 8], cohort=["cohort_a", "cohort_b"]) returns six configurations.
+
+    Parameters:
+    -----------
+    options : lists
+        The values to combine per setting, see run_jobs for the valid settings.
+
+    Returns:
+    --------
+    configs : list of dict
+        One dictionary per combination.
+    """
+    keys = list(options)
+    return [dict(zip(keys, values)) for values in product(*options.values())]
+
+
+def _resolve_configs(configs):
+    from .dyspyosis import Dyspyosis
+
+    signature = inspect.signature(Dyspyosis.__init__).parameters
+    defaults = {k: signature[k].default for k in CONFIG_KEYS if k in signature}
+    defaults["cohort"] = None
+
+    resolved = []
+    for config in configs:
+        unknown = set(config) - set(CONFIG_KEYS)
+        if unknown:
+            raise ValueError(
+                f"Unknown settings {sorted(unknown)}, valid settings are {CONFIG_KEYS}"
+            )
+        resolved.append({**defaults, **config})
+
+    return resolved
+
+
+def _select(data, labels, cohorts, cohort):
+    if cohort is None:
+        return data, labels
+
+    if cohorts is None or cohort not in cohorts:
+        raise ValueError(f"Unknown cohort {cohort!r}")
+
+    index = np.asarray(cohorts[cohort])
+    if index.dtype == bool:
+        index = np.flatnonzero(index)
+
+    if labels is not None:
+        labels = [labels[i] for i in index]
+
+    return data[index], labels
+
+
+def _build(data, config):
+    # Same filtering and seed as Dyspyosis uses for its own training data
+    depth = config["rarefication_depth"]
+    iterations = config["rarefication_count"]
+    mask = check_depth(data, depth, config["low_depth_policy"])
+    data = data[mask]
+
+    if sp.issparse(data):
+        dataset = build_dataset(
+            data,
+            depth,
+            iterations,
+            seed=config["seed"] + 1,
+            mode=config["mode"],
+            low_depth_policy=None,
+        )
+        return dataset, None
+
+    output, shm = _shared_empty(
+        (data.shape[0] * iterations, data.shape[1]), count_dtype(depth)
+    )
+    build_dataset(
+        data,
+        depth,
+        iterations,
+        seed=config["seed"] + 1,
+        mode=config["mode"],
+        low_depth_policy=None,
+        out=output,
+    )
+
+    return output, shm
+
+
+def _run_job(data, labels, columns, config, training_data, training_args, path):
+    from .dyspyosis import Dyspyosis
+
+    start = time.time()
+    dyspyosis = Dyspyosis(
+        data,
+        labels=labels,
+        columns=columns,
+        training_data=training_data,
+        **{k: v for k, v in config.items() if k != "cohort"},
+    )
+    report = dyspyosis.run_training(**training_args)
+
+    if path is not None:
+        dyspyosis.save(path)
+
+    history = report["history"]
+    return {
+        "epochs": report["epochs"],
+        "loss": history["loss"][-1] if history.get("loss") else np.nan,
+        "val_loss": history["val_loss"][-1] if history.get("val_loss") else np.nan,
+        "best_val_loss": report["best_val_loss"],
+        "best_epoch": report["best_epoch"],
+        "stopped_early": report["stopped_early"],
+        "wall_time": time.time() - start,
+        "history": history,
+        "scores": dyspyosis.score(),
+        "path": None if path is None else str(path),
+    }
+
+
+def _init_job_worker(threads, tensorflow, data, labels, columns, cohorts):
+    # Limit the BLAS and TensorFlow thread pools before TensorFlow runs anything in this process
+    from threadpoolctl import threadpool_limits
+
+    _job_worker["limits"] = threadpool_limits(limits=threads)
+    if tensorflow:
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    _job_worker.update(data=data, labels=labels, columns=columns, cohorts=cohorts)
+
+
+def _run_pooled(task):
+    config, dataset, training_args, path = task
+    data, labels = _select(
+        _job_worker["data"],
+        _job_worker["labels"],
+        _job_worker["cohorts"],
+        config["cohort"],
+    )
+    columns = _job_worker["columns"]
+
+    if isinstance(dataset, tuple):
+        name, shape, dtype = dataset
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            training_data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            result = _run_job(
+                data, labels, columns, config, training_data, training_args, path
+            )
+            # Release every view on the buffer before closing it
+            del training_data
+        finally:
+            shm.close()
+        return result
+
+    return _run_job(data, labels, columns, config, dataset, training_args, path)
+
+
+def run_jobs(
+    data,
+    configs: list,
+    labels: Optional[list] = None,
+    cohorts: Optional[dict] = None,
+    columns: Optional[list] = None,
+    n_jobs: int = 1,
+    threads_per_job: int = 1,
+    save_dir=None,
+    **training_args,
+) -> pd.DataFrame:
+    """
+    Trains several models, e.g. to tune encode_dim or to fit one model per cohort, and collects their results.
+
+    Each unique expanded dataset (determined by the cohort, rarefication_depth, rarefication_count, seed, mode and
+    low_depth_policy) is generated only once, in shared memory, and used by every job that needs it. Jobs are
+    trained concurrently by n_jobs worker processes, each limited to threads_per_job threads for TensorFlow and
+    NumPy so the workers don't oversubscribe the CPUs. Workers only import TensorFlow if a job uses that backend. Every job trains the same model as
+    Dyspyosis(cohort_data, **config).run_training(**training_args) would.
+
+    Parameters:
+    -----------
+    data : pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix
+        A count table of shape (n_samples, n_features) with every sample.
+    configs : list of dict
+        One dictionary per model with any of the settings "cohort", "encode_dim", "ensemble_size", "seed",
+        "rarefication_depth", "rarefication_count", "mode", "low_depth_policy" and "backend". Missing settings take the
+        Dyspyosis defaults, a missing cohort uses all samples. See config_grid to build a grid of configurations.
+    labels : list, optional
+        Labels for the samples, taken from the index if data is a DataFrame.
+    cohorts : dict, optional
+        Maps cohort names to the samples in the cohort, as row positions or a boolean mask.
+    columns : list, optional
+        Names of the features, taken from data.columns if data is a DataFrame.
+    n_jobs : int
+        Number of models trained concurrently, -1 uses all CPUs. With n_jobs=1 models are trained in this process.
+    threads_per_job : int
+        Number of threads each worker process may use.
+    save_dir : str or Path, optional
+        If set, every model is stored with Dyspyosis.save in save_dir/job_<index>.
+    training_args :
+        Passed to Dyspyosis.run_training, e.g. epochs, batch_size or patience.
+
+    Returns:
+    --------
+    results : pd.DataFrame
+        One row per job with its settings, the final training and validation loss, the best validation loss and
+        epoch, the number of epochs trained and the wall time. The "history" column holds the training curves
+        (as in the training report) and the "scores" column a DataFrame with the loss and latent space of every
+        sample in the cohort, as returned by Dyspyosis.score.
+    """
+    if isinstance(data, pd.DataFrame):
+        if columns is None:
+            columns = data.columns.tolist()
+        if labels is None:
+            labels = data.index.tolist()
+        data = data.to_numpy()
+    elif sp.issparse(data):
+        data = sp.csr_matrix(data)
+    else:
+        data = np.asarray(data)
+
+    configs = _resolve_configs(configs)
+    if save_dir is not None:
+        save_dir = Path(save_dir)
+        save_dir.mkdir(parents=True, exist_ok=True)
+    paths = [
+        None if save_dir is None else save_dir / f"job_{i:03d}"
+        for i in range(len(configs))
+    ]
+
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = max(1, min(n_jobs or 1, len(configs)))
+
+    datasets = {}
+    segments = []
+    try:
+        for config in configs:
+            key = tuple(config[k] for k in DATASET_KEYS)
+            if key not in datasets:
+                cohort_data, _ = _select(data, labels, cohorts, config["cohort"])
+                datasets[key] = _build(cohort_data, config)
+                if datasets[key][1] is not None:
+                    segments.append(datasets[key][1])
+
+        if n_jobs == 1:
+            results = []
+            for config, path in zip(configs, paths):
+                cohort_data, cohort_labels = _select(
+                    data, labels, cohorts, config["cohort"]
+                )
+                dataset, _ = datasets[tuple(config[k] for k in DATASET_KEYS)]
+                results.append(
+                    _run_job(
+                        cohort_data,
+                        cohort_labels,
+                        columns,
+                        config,
+                        dataset,
+                        training_args,
+                        path,
+                    )
+                )
+        else:
+            tasks = []
+            for config, path in zip(configs, paths):
+                dataset, shm = datasets[tuple(config[k] for k in DATASET_KEYS)]
+                if shm is not None:
+                    dataset = (shm.name, dataset.shape, dataset.dtype)
+                tasks.append((config, dataset, training_args, path))
+
+            # TensorFlow isn't fork-safe, workers are started fresh
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_job_worker,
+                initargs=(
+                    threads_per_job,
+                    any(config["backend"] == "tensorflow" for config in configs),
+                    data,
+                    labels,
+                    columns,
+                    cohorts,
+                ),
+            ) as executor:
+                results = list(executor.map(_run_pooled, tasks))
+    finally:
+        datasets.clear()
+        for shm in segments:
+            shm.unlink()
+
+    return pd.concat([pd.DataFrame(configs), pd.DataFrame(results)], axis=1)
@@ -0,0 +1,182 @@
+import os
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import numpy as np
+
+
+def configure_threads(
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None,
+    cpu_affinity=None,
+) -> None:
+    """
+    Limits the CPU resources TensorFlow uses, so jobs sharing a machine don't oversubscribe its cores.
+
+    TensorFlow fixes its thread pools when it runs its first operation, call this before building a model. Settings
+    left at None keep the TensorFlow defaults (one thread per available core).
+
+    Parameters:
+    -----------
+    intra_op_threads : int, optional
+        Number of threads a single operation (e.g. a matrix multiplication) may use. Defaults to the number of
+        CPUs in cpu_affinity if that is set.
+    inter_op_threads : int, optional
+        Number of operations that may run in parallel.
+    cpu_affinity : iterable of int, optional
+        Pins the process, and all threads it starts from then on, to these CPUs. Only supported on Linux.
+    """
+    if cpu_affinity is not None:
+        if not hasattr(os, "sched_setaffinity"):
+            raise ValueError(
+                "Setting the CPU affinity is not supported on this platform"
+            )
+        cpu_affinity = sorted(set(cpu_affinity))
+        os.sched_setaffinity(0, cpu_affinity)
+        if intra_op_threads is None:
+            intra_op_threads = len(cpu_affinity)
+
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        raise RuntimeError(
+            "TensorFlow is already initialized, configure the threads before building a model"
+        ) from None
+
+
+def available_devices() -> list:
+    """
+    Lists the devices TensorFlow can train on, e.g. ["/device:CPU:0", "/device:GPU:0"].
+    """
+    import tensorflow as tf
+
+    return [
+        d.name
+        for d in tf.config.list_logical_devices()
+        if d.device_type in ("CPU", "GPU")
+    ]
+
+
+def resolve_device(device):
+    """
+    Translates a device as passed to Dyspyosis ("cpu", "gpu", "gpu:1", "/GPU:0", ...) to its TensorFlow name.
+
+    Returns:
+    --------
+    device : str or None
+        The full device name, e.g. "/device:GPU:1", or None if device is None (TensorFlow picks the device).
+    """
+    if device is None:
+        return None
+
+    name = str(device).lower().replace("/device:", "").lstrip("/")
+    if ":" not in name:
+        name += ":0"
+    kind, index = name.split(":", 1)
+    name = f"/device:{kind.upper()}:{index}"
+
+    devices = available_devices()
+    if name not in devices:
+        raise ValueError(
+            f"Device {device!r} is not available, found {', '.join(devices)}"
+        )
+
+    return name
+
+
+def device_scope(device):
+    """
+    Returns a context placing the operations and variables created in it on device, or a no-op for None.
+    """
+    if device is None:
+        return nullcontext()
+
+    import tensorflow as tf
+
+    return tf.device(device)
+
+
+def time_train_steps(
+    device,
+    n_features: int,
+    encoding_dim: int = 4,
+    batch_size: int = 64,
+    ensemble_size: Optional[int] = None,
+    steps: int = 20,
+) -> float:
+    """
+    Measures the time of a train step of a freshly built autoencoder on device, on random scaled data.
+
+    Returns:
+    --------
+    seconds : float
+        Average wall time per step, after a first step that traces the model.
+    """
+    from .autoencoder import create_autoencoder
+
+    rng = np.random.default_rng(0)
+    x = rng.dirichlet(np.ones(n_features), size=batch_size).astype(np.float32)
+
+    with device_scope(device):
+        model, _, _ = create_autoencoder(
+            n_features, encoding_dim=encoding_dim, ensemble_size=ensemble_size
+        )
+        model.train_on_batch(x, x)
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.train_on_batch(x, x)
+
+    return (time.perf_counter() - start) / steps
+
+
+def select_device(
+    device,
+    n_features: int,
+    encoding_dim: int = 4,
+    batch_size: int = 64,
+    ensemble_size: Optional[int] = None,
+    steps: int = 20,
+):
+    """
+    Resolves the device to train on. With "auto", a few train steps of the model are timed on every available
+    device (see time_train_steps) and the fastest is picked. For a model this small that is often the CPU.
+
+    Parameters:
+    -----------
+    device : str or None
+        "auto", a device such as "cpu", "gpu" or "gpu:1", or None to leave the placement to TensorFlow.
+    n_features, encoding_dim, batch_size, ensemble_size :
+        The shape of the model and batches to time.
+    steps : int
+        Number of train steps timed per device.
+
+    Returns:
+    --------
+    device : str or None
+        The full TensorFlow name of the device.
+    timings : dict
+        Seconds per train step of every device that was timed, empty unless device is "auto" and there is more
+        than one device.
+    """
+    if device != "auto":
+        return resolve_device(device), {}
+
+    devices = available_devices()
+    if len(devices) == 1:
+        return devices[0], {}
+
+    timings = {
+        d: time_train_steps(
+            d, n_features, encoding_dim, batch_size, ensemble_size, steps
+        )
+        for d in devices
+    }
+
+    return min(timings, key=timings.get), timings
@@ -0,0 +1,342 @@
+import json
+import shutil
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .profiling import Profiler
+from .utils import (
+    align_columns,
+    build_dataset,
+    check_depth,
+    drop_samples,
+    rarefy,
+    read_table_chunks,
+)
+
+# Arrays of a store, each kept as a raw binary file next to meta.json
+STORE_ARRAYS = ("counts", "rarefied", "train", "validation", "sample_mask")
+
+
+def validation_samples(indices, validation_fraction=0.15, seed=0):
+    """
+    Assigns samples to the validation set by hashing their position in the input with the seed, so the split is
+    reproducible and does not depend on how the input is divided in chunks.
+
+    Parameters:
+    -----------
+    indices : numpy.ndarray
+        Positions of the samples in the input.
+    validation_fraction : float
+        Expected fraction of samples in the validation set.
+    seed : int
+        The random state seed.
+
+    Returns:
+    --------
+    mask : numpy.ndarray
+        A boolean array, True for validation samples.
+    """
+    # splitmix64 of (seed, index), the top 53 bits give a uniform number in [0, 1)
+    z = np.asarray(indices, dtype=np.uint64) | np.uint64((seed % 2**32) << 32)
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+
+    return (z >> np.uint64(11)) * 2.0**-53 < validation_fraction
+
+
+def _to_json(value):
+    # Labels and feature names taken from a DataFrame can be numpy scalars, anything else isn't stored silently
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(
+        f"Labels and feature names should be strings or numbers, got {type(value).__name__}"
+    )
+
+
+def _prepare_chunk(chunk, rarefication_depth, low_depth_policy, columns, nfeatures):
+    """
+    Aligns a chunk to the features of the first one and applies the low_depth_policy.
+
+    Returns:
+    --------
+    counts : numpy.ndarray
+        The dense counts of the kept samples.
+    mask : numpy.ndarray
+        Boolean array marking the kept samples of the chunk.
+    labels : list or None
+        Labels of the kept samples.
+    columns : list or None
+        The feature names of the store.
+    """
+    labels = None
+    if isinstance(chunk, pd.DataFrame):
+        labels = chunk.index.tolist()
+        if columns is None:
+            columns = chunk.columns.tolist()
+        counts, missing = align_columns(chunk.values, chunk.columns.tolist(), columns)
+        if missing:
+            print(
+                f"Warning: {len(missing)} feature(s) are missing from a chunk, these are set to 0."
+            )
+    else:
+        counts = chunk.toarray() if sp.issparse(chunk) else np.asarray(chunk)
+        if nfeatures is not None and counts.shape[1] != nfeatures:
+            raise ValueError(f"Expected {nfeatures} features, got {counts.shape[1]}.")
+
+    mask = check_depth(counts, rarefication_depth, low_depth_policy)
+    counts, labels = drop_samples(counts, labels, mask)
+
+    return counts, mask, labels, columns
+
+
+class TrainingStore:
+    """
+    A disk-backed training set, built chunk by chunk from a count table that doesn't fit in memory.
+
+    The directory holds the input counts, a single rarefaction of every sample (used for scoring) and the expanded
+    training and validation data as raw binary files, opened as read-only memory maps. Samples are split in a
+    training and validation set as a whole, every rarefaction of a sample ends up in the same set.
+
+    Attributes:
+    -----------
+    directory : Path
+        The directory holding the store.
+    meta : dict
+        The settings used to build the store and the shapes and dtypes of its arrays.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory).expanduser()
+        try:
+            with open(self.directory / "meta.json") as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No complete training store in {self.directory}"
+            ) from None
+
+    def _open(self, name):
+        shape = tuple(self.meta["arrays"][name]["shape"])
+        dtype = np.dtype(self.meta["arrays"][name]["dtype"])
+        if 0 in shape:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(self.directory / f"{name}.bin", dtype, mode="r", shape=shape)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        The counts of the kept samples, shape (n_samples, n_features).
+        """
+        return self._open("counts")
+
+    @property
+    def rarefied(self) -> np.ndarray:
+        """
+        A single rarefaction of every kept sample, as Dyspyosis uses to compute scaled_data.
+        """
+        return self._open("rarefied")
+
+    @property
+    def train(self) -> np.ndarray:
+        """
+        The expanded training data of the training samples, unscaled counts.
+        """
+        return self._open("train")
+
+    @property
+    def validation(self) -> np.ndarray:
+        """
+        The expanded training data of the validation samples, unscaled counts.
+        """
+        return self._open("validation")
+
+    @property
+    def sample_mask(self) -> np.ndarray:
+        """
+        Boolean array marking which input samples were kept after applying the low_depth_policy.
+        """
+        return self._open("sample_mask")
+
+    @property
+    def labels(self):
+        return self.meta["labels"]
+
+    @property
+    def columns(self):
+        return self.meta["columns"]
+
+    @classmethod
+    def build(
+        cls,
+        source,
+        directory,
+        rarefication_depth: int = 5000,
+        rarefication_count: int = 10,
+        seed: int = 0,
+        mode: str = "with_replacement",
+        low_depth_policy: str = "keep",
+        validation_fraction: float = 0.15,
+        chunk_size: int = 65536,
+        sep: Optional[str] = None,
+        n_jobs: int = 1,
+        profiler: Optional[Profiler] = None,
+    ) -> "TrainingStore":
+        """
+        Builds a store from a file or an iterator of chunks, only a single chunk is held in memory at any time.
+
+        Every chunk is rarefied once (seed [seed, offset]) and expanded rarefication_count times (seed
+        [seed + 1, offset]), where offset is the position of the first kept sample of the chunk. The split is
+        derived from the seed and the position of each sample in the input (see validation_samples). The store
+        is reproducible for a given seed and chunk_size.
+
+        Parameters:
+        -----------
+        source : str, Path or iterable
+            A delimited text file with samples in rows (see utils.read_table_chunks) or an iterable of count
+            tables (pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix) with the same features. Feature
+            names of DataFrames are aligned to those of the first chunk.
+        directory : str or Path
+            The directory to write the store to, it should not contain a store yet.
+        rarefication_depth, rarefication_count, seed, mode, low_depth_policy :
+            See Dyspyosis.
+        validation_fraction : float
+            Fraction of samples used for validation.
+        chunk_size : int
+            Number of samples read from a file at once.
+        sep : str, optional
+            The separator of the file, derived from its extension by default.
+        n_jobs : int
+            Number of processes used to expand each chunk, see build_dataset.
+        profiler : Profiler, optional
+            Records the time and memory spent on every chunk.
+
+        Returns:
+        --------
+        store : TrainingStore
+            The store, opened from directory.
+        """
+        directory = Path(directory).expanduser()
+        if (directory / "meta.json").exists():
+            raise FileExistsError(f"{directory} already contains a training store")
+        created = not directory.exists()
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def remove():
+            for name in STORE_ARRAYS:
+                (directory / f"{name}.bin").unlink(missing_ok=True)
+            if created:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        profiler = Profiler() if profiler is None else profiler
+        files = {}
+        arrays = {}
+        columns, labels = None, []
+        nfeatures = None
+        ninput = 0
+        nkept = 0
+
+        def write(name, array):
+            array = np.ascontiguousarray(array)
+            info = arrays.setdefault(
+                name, {"shape": [0, *array.shape[1:]], "dtype": array.dtype.str}
+            )
+            array.astype(info["dtype"], copy=False).tofile(files[name])
+            info["shape"][0] += array.shape[0]
+
+        try:
+            with ExitStack() as stack:
+                for name in STORE_ARRAYS:
+                    files[name] = stack.enter_context(
+                        open(directory / f"{name}.bin", "wb")
+                    )
+                if isinstance(source, (str, Path)):
+                    reader = stack.enter_context(
+                        read_table_chunks(source, chunk_size, sep=sep)
+                    )
+                else:
+                    reader = iter(source)
+
+                for chunk in reader:
+                    counts, mask, chunk_labels, columns = _prepare_chunk(
+                        chunk, rarefication_depth, low_depth_policy, columns, nfeatures
+                    )
+                    nfeatures = counts.shape[1]
+
+                    with profiler.stage(
+                        "build_dataset", rows=counts.shape[0] * rarefication_count
+                    ):
+                        validation = validation_samples(
+                            ninput + np.flatnonzero(mask), validation_fraction, seed
+                        )
+                        expanded = build_dataset(
+                            counts,
+                            rarefication_depth,
+                            rarefication_count,
+                            seed=[seed + 1, nkept],
+                            mode=mode,
+                            low_depth_policy=None,
+                            n_jobs=n_jobs,
+                        ).reshape(rarefication_count, *counts.shape)
+
+                        write("counts", counts)
+                        write(
+                            "rarefied",
+                            rarefy(
+                                counts,
+                                rarefication_depth,
+                                seed=[seed, nkept],
+                                mode=mode,
+                                low_depth_policy=None,
+                            ),
+                        )
+                        write("train", expanded[:, ~validation].reshape(-1, nfeatures))
+                        write(
+                            "validation", expanded[:, validation].reshape(-1, nfeatures)
+                        )
+                        write("sample_mask", mask)
+
+                    if chunk_labels is not None:
+                        labels.extend(chunk_labels)
+                    ninput += mask.shape[0]
+                    nkept += counts.shape[0]
+        except BaseException:
+            remove()
+            raise
+
+        if arrays.get("train", {}).get("shape", [0])[0] == 0 or (
+            arrays["validation"]["shape"][0] == 0
+        ):
+            remove()
+            raise ValueError(
+                "The input has too few samples for both a training and validation set."
+            )
+
+        meta = {
+            "rarefication_depth": rarefication_depth,
+            "rarefication_count": rarefication_count,
+            "seed": seed,
+            "mode": mode,
+            "low_depth_policy": low_depth_policy,
+            "validation_fraction": validation_fraction,
+            "chunk_size": chunk_size,
+            "columns": columns,
+            "labels": labels or None,
+            "arrays": arrays,
+        }
+        try:
+            meta = json.dumps(meta, default=_to_json)
+        except TypeError:
+            remove()
+            raise
+        # Written last, a directory without meta.json doesn't hold a complete store
+        (directory / "meta.json").write_text(meta)
+
+        return cls(directory)
@@ -0,0 +1,405 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback, CallbackList, History
+
+
+class ConvergenceMonitor(Callback):
+    """
+    Stops training once the validation loss no longer improves.
+
+    Unlike the Keras EarlyStopping callback, its state is kept across calls to fit and the best weights are only
+    restored when restore_best is called, so training can be split in several fit calls.
+
+    Attributes:
+    -----------
+    patience : int
+        Number of validations without improvement after which training is stopped.
+    min_delta : float
+        Minimum decrease of the validation loss that counts as an improvement.
+    restore_best_weights : bool
+        Whether restore_best puts back the weights of the best validation.
+    best : float
+        The best validation loss seen so far.
+    best_epoch : int
+        The epoch (0-based) of the best validation loss.
+    stopped_epoch : int
+        The epoch (0-based) training was stopped at, None if it wasn't stopped.
+    """
+
+    def __init__(self, patience=10, min_delta=0.0, restore_best_weights=True):
+        super().__init__()
+        self.patience = patience
+        self.min_delta = min_delta
+        self.restore_best_weights = restore_best_weights
+
+        self.best = np.inf
+        self.best_epoch = None
+        self.best_weights = None
+        self.wait = 0
+        self.stopped_epoch = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Epochs without validation (see validation_freq) are skipped
+        value = (logs or {}).get("val_loss")
+        if value is None:
+            return
+
+        if value < self.best - self.min_delta:
+            self.best = value
+            self.best_epoch = epoch
+            self.wait = 0
+            if self.restore_best_weights:
+                self.best_weights = self.model.get_weights()
+        else:
+            self.wait += 1
+            if self.wait >= self.patience:
+                self.stopped_epoch = epoch
+                self.model.stop_training = True
+
+    def restore_best(self):
+        """
+        Restores the weights of the best validation, if restore_best_weights is set.
+        """
+        if self.restore_best_weights and self.best_weights is not None:
+            self.model.set_weights(self.best_weights)
+
+
+class StageCallback(Callback):
+    """
+    Records every epoch as a stage of a Profiler, with the epoch, the rows trained on and the losses.
+
+    Attributes:
+    -----------
+    profiler : Profiler
+        The profiler to record to.
+    rows : int
+        The number of rows trained on per epoch.
+    """
+
+    def __init__(self, profiler, rows):
+        super().__init__()
+        self.profiler = profiler
+        self.rows = rows
+        self._token = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._token = self.profiler.start("epoch", rows=self.rows, epoch=epoch)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.profiler.stop(
+            self._token, **{k: float(v) for k, v in (logs or {}).items()}
+        )
+        self._token = None
+
+
+class CompiledTrainer:
+    """
+    Trains a compiled autoencoder on dense in-memory counts with a custom loop, an alternative to Keras fit.
+
+    The counts are kept on the device as integers. The rows of every epoch are shuffled on the device with the same
+    stateless shuffle as autoencoder.create_count_stream, so the batches are identical to those of the fit path.
+    A single tf.function call then runs up to steps_per_call train steps: gather, scale, forward pass, loss,
+    gradients and optimizer update. This avoids the per-step overhead of the Keras training loop, which dominates for
+    a model this small. The loss is the one Keras fit optimizes: the compiled loss plus the activity regularization,
+    as computed by model.compute_loss. The reported epoch loss is its mean over the rows of the epoch.
+
+    Attributes:
+    -----------
+    model : keras.models.Model
+        The compiled model to train.
+    batch_size : int
+        Number of rows per batch, the last batch of an epoch can be smaller.
+    seed : int
+        Seed for the order of the rows.
+    steps_per_call : int, optional
+        Maximum number of train steps per compiled call, an entire epoch by default.
+    """
+
+    def __init__(
+        self,
+        model,
+        counts,
+        rarefication_depth,
+        batch_size=64,
+        seed=0,
+        steps_per_call=None,
+        jit_compile=True,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.seed = seed
+        self.steps_per_call = steps_per_call
+        self.rows = counts.shape[0]
+        self.rarefication_depth = rarefication_depth
+
+        self.data = tf.constant(np.asarray(counts))
+        self._order = tf.function(self._shuffle)
+        # Every distinct number of steps and batch size (e.g. the last, smaller batch) is compiled once
+        self._train = tf.function(self._train_steps, jit_compile=jit_compile)
+        self._evaluate = tf.function(self._test_steps, jit_compile=jit_compile)
+        self._validation = None
+
+    def _shuffle(self, epoch):
+        return tf.random.experimental.stateless_shuffle(
+            tf.range(self.rows, dtype=tf.int64),
+            seed=tf.stack([tf.constant(self.seed, tf.int64), epoch]),
+        )
+
+    def _train_steps(self, indices):
+        # indices has shape (steps, batch_size), returns the summed loss of the steps
+        total = tf.constant(0.0)
+        for i in tf.range(tf.shape(indices)[0]):
+            x = tf.cast(tf.gather(self.data, indices[i]), tf.float32)
+            x = x / self.rarefication_depth
+            with tf.GradientTape() as tape:
+                y_pred = self.model(x, training=True)
+                loss = self.model.compute_loss(x=x, y=x, y_pred=y_pred)
+            variables = self.model.trainable_variables
+            gradients = tape.gradient(loss, variables)
+            self.model.optimizer.apply_gradients(zip(gradients, variables))
+            total += loss
+        return total
+
+    def _test_steps(self, batches):
+        # batches has shape (steps, batch_size, features), returns the summed loss of the steps
+        total = tf.constant(0.0)
+        for i in tf.range(tf.shape(batches)[0]):
+            y_pred = self.model(batches[i], training=False)
+            total += self.model.compute_loss(
+                x=batches[i], y=batches[i], y_pred=y_pred, training=False
+            )
+        return total
+
+    def evaluate(self, x, batch_size=None) -> float:
+        """
+        Computes the loss on scaled data as Keras evaluate does, the mean over the rows of the per batch losses.
+        The data is copied to the device once and kept for later calls with the same array.
+        """
+        size = batch_size or self.batch_size
+        if self._validation is None or self._validation[0] is not x:
+            self._validation = x, tf.constant(x, tf.float32)
+        data = self._validation[1]
+
+        full, remainder = divmod(data.shape[0], size)
+        total = 0.0
+        if full:
+            batches = tf.reshape(data[: full * size], (full, size, data.shape[1]))
+            total += float(self._evaluate(batches)) * size
+        if remainder:
+            total += float(self._evaluate(data[None, full * size :])) * remainder
+
+        return total / data.shape[0]
+
+    def train_epoch(self, epoch) -> float:
+        """
+        Trains a single epoch.
+
+        Returns:
+        --------
+        loss : float
+            The mean loss over the rows of the epoch.
+        """
+        order = self._order(tf.constant(epoch, tf.int64))
+        size = self.batch_size
+        full, remainder = divmod(self.rows, size)
+        steps = self.steps_per_call or max(full, 1)
+
+        batches = tf.reshape(order[: full * size], (full, size))
+        total = 0.0
+        for start in range(0, full, steps):
+            total += float(self._train(batches[start : start + steps])) * size
+        if remainder:
+            total += float(self._train(order[None, full * size :])) * remainder
+
+        return total / self.rows
+
+    def fit(
+        self,
+        initial_epoch=0,
+        epochs=1,
+        callbacks=None,
+        validation_data=None,
+        validation_freq=1,
+        validation_batch_size=None,
+        verbose=0,
+    ):
+        """
+        Trains epochs initial_epoch to epochs, with the same arguments and callback calls as Keras fit.
+
+        Parameters:
+        -----------
+        validation_data : tuple, optional
+            (x, x) of scaled data to compute the val_loss on after every validation_freq epochs.
+        verbose : "auto", 0, 1 or 2
+            Anything but 0 prints a line per epoch.
+
+        Returns:
+        --------
+        history : keras.callbacks.History
+            The losses of every epoch.
+        """
+        history = History()
+        callbacks = CallbackList(
+            [*(callbacks or []), history], model=self.model, epochs=epochs
+        )
+
+        self.model.stop_training = False
+        callbacks.on_train_begin()
+        for epoch in range(initial_epoch, epochs):
+            callbacks.on_epoch_begin(epoch)
+            start = time.perf_counter()
+            logs = {"loss": self.train_epoch(epoch)}
+
+            if validation_data is not None and (epoch + 1) % validation_freq == 0:
+                logs["val_loss"] = self.evaluate(
+                    validation_data[0], validation_batch_size
+                )
+
+            callbacks.on_epoch_end(epoch, logs)
+            if verbose != 0:
+                losses = " - ".join(f"{k}: {v:.4f}" for k, v in logs.items())
+                print(
+                    f"Epoch {epoch + 1}/{epochs} - {time.perf_counter() - start:.2f}s - {losses}"
+                )
+            if self.model.stop_training:
+                break
+        callbacks.on_train_end()
+
+        return history
+
+
+def exponential_decay(rate=0.999):
+    """
+    Learning rate schedule multiplying the learning rate by rate after every epoch.
+
+    Returns:
+    --------
+    schedule : callable
+        A function (epoch, lr) -> lr, to be used as lr_schedule in Dyspyosis.run_training.
+    """
+
+    def schedule(epoch, lr):
+        return lr * rate if epoch > 0 else lr
+
+    return schedule
+
+
+def step_decay(factor=0.5, every=1000):
+    """
+    Learning rate schedule multiplying the learning rate by factor every few epochs.
+
+    Returns:
+    --------
+    schedule : callable
+        A function (epoch, lr) -> lr, to be used as lr_schedule in Dyspyosis.run_training.
+    """
+
+    def schedule(epoch, lr):
+        return lr * factor if epoch > 0 and epoch % every == 0 else lr
+
+    return schedule
+
+
+def save_checkpoint(checkpoint_dir, model, state, monitor=None):
+    """
+    Stores the training state in checkpoint_dir.
+
+    Every checkpoint is written to its own subdirectory, the file "latest" is only updated once it is complete,
+    so an interrupted write never corrupts the previous checkpoint.
+
+    Parameters:
+    -----------
+    checkpoint_dir : str or Path
+        The directory to write to.
+    model : keras.models.Model
+        The compiled model, its weights and optimizer state are stored.
+    state : dict
+        JSON serializable state, must contain the next epoch to train as "epoch".
+    monitor : ConvergenceMonitor, optional
+        Early stopping state to store.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    name = f"epoch_{state['epoch']:06d}"
+    path = checkpoint_dir / name
+    path.mkdir(parents=True, exist_ok=True)
+
+    np.savez(path / "weights.npz", *model.get_weights())
+    np.savez(path / "optimizer.npz", *[v.numpy() for v in model.optimizer.variables])
+
+    state = dict(state)
+    if monitor is not None:
+        state["monitor"] = {
+            "best": None if np.isinf(monitor.best) else float(monitor.best),
+            "best_epoch": monitor.best_epoch,
+            "wait": monitor.wait,
+            "stopped_epoch": monitor.stopped_epoch,
+        }
+        if monitor.best_weights is not None:
+            np.savez(path / "best_weights.npz", *monitor.best_weights)
+
+    with open(path / "state.json", "w") as f:
+        json.dump(state, f)
+
+    with open(checkpoint_dir / "latest.tmp", "w") as f:
+        f.write(name)
+    os.replace(checkpoint_dir / "latest.tmp", checkpoint_dir / "latest")
+
+    # Only keep the most recent checkpoint
+    for old in checkpoint_dir.glob("epoch_*"):
+        if old.name != name:
+            shutil.rmtree(old)
+
+
+def load_checkpoint(checkpoint_dir, model, monitor=None):
+    """
+    Restores the latest checkpoint written by save_checkpoint.
+
+    Parameters:
+    -----------
+    checkpoint_dir : str or Path
+        The directory the checkpoints were written to.
+    model : keras.models.Model
+        The compiled model to restore the weights and optimizer state into.
+    monitor : ConvergenceMonitor, optional
+        Restores the early stopping state into this monitor.
+
+    Returns:
+    --------
+    state : dict or None
+        The stored state, None if there is no checkpoint.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    if not (checkpoint_dir / "latest").exists():
+        return None
+
+    path = checkpoint_dir / (checkpoint_dir / "latest").read_text().strip()
+    with open(path / "state.json") as f:
+        state = json.load(f)
+
+    with np.load(path / "weights.npz") as weights:
+        model.set_weights([weights[f"arr_{i}"] for i in range(len(weights.files))])
+
+    model.optimizer.build(model.trainable_variables)
+    with np.load(path / "optimizer.npz") as values:
+        for i, variable in enumerate(model.optimizer.variables):
+            variable.assign(values[f"arr_{i}"])
+
+    if monitor is not None and "monitor" in state:
+        stored = state["monitor"]
+        monitor.best = np.inf if stored["best"] is None else stored["best"]
+        monitor.best_epoch = stored["best_epoch"]
+        monitor.wait = stored["wait"]
+        monitor.stopped_epoch = stored["stopped_epoch"]
+        if (path / "best_weights.npz").exists():
+            with np.load(path / "best_weights.npz") as weights:
+                monitor.best_weights = [
+                    weights[f"arr_{i}"] for i in range(len(weights.files))
+                ]
+
+    return state
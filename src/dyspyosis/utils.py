@@ -1,91 +1,944 @@
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
 import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+# Upper bound on the number of elements drawn in a single shard of build_dataset, this
+# keeps the temporary int64 buffer numpy allocates for a draw around 32 MB. The shard
+# layout depends only on the shape of the data, never on the number of workers.
+_BLOCK_ELEMENTS = 2**22
+
+# Per-process state of build_dataset workers, set once by _init_worker
+_worker = {}
+
 
+RAREFACTION_MODES = ("with_replacement", "without_replacement")
+LOW_DEPTH_POLICIES = ("keep", "drop", "error")
 
-def rarefy(data, rarefication_depth=None, seed=0):
+
+def count_dtype(rarefication_depth):
     """
-    This function performs rarefaction on a matrix data.
+    Returns the smallest unsigned integer type (uint16 or wider) that holds rarefied counts.
+
+    A single count of a rarefied sample never exceeds the rarefication_depth.
+
+    Parameters:
+    -----------
+    rarefication_depth : int
+        Number of reads samples are rarefied to.
+
+    Returns:
+    --------
+    dtype : numpy.dtype
+        np.uint16, np.uint32 or np.uint64.
+    """
+    for dtype in (np.uint16, np.uint32):
+        if rarefication_depth <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+    return np.dtype(np.uint64)
+
+
+def _row_sums(data):
+    """
+    Returns the total count per sample as a 1D array, for both dense arrays and sparse matrices.
+    """
+    if sp.issparse(data):
+        return np.asarray(data.sum(axis=1)).ravel()
+
+    return np.sum(np.asarray(data), axis=1)
+
+
+def check_depth(data, rarefication_depth, low_depth_policy="keep"):
+    """
+    Detects samples with fewer reads than the rarefication depth and applies a policy to them.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) containing the data.
+    rarefication_depth : int
+        Number of reads samples will be rarefied to.
+    low_depth_policy : str, optional
+        What to do with samples below the depth: "keep" them (with a warning), "drop" them or raise an "error".
+        Default is "keep".
+
+    Returns:
+    --------
+    mask : numpy.ndarray
+        A boolean array of shape (n_samples,), True for samples that should be kept.
+    """
+    if low_depth_policy not in LOW_DEPTH_POLICIES:
+        raise ValueError(
+            f"low_depth_policy should be one of {LOW_DEPTH_POLICIES}, got {low_depth_policy!r}"
+        )
+
+    noccur = _row_sums(data)
+    low_depth = noccur < rarefication_depth
+
+    if not low_depth.any():
+        return ~low_depth
+
+    message = f"{np.sum(low_depth)} sample(s) have fewer reads than the rarefication_depth ({rarefication_depth})"
+    if low_depth_policy == "error":
+        raise ValueError(f"{message}, lowest count is {np.min(noccur)}.")
+    elif low_depth_policy == "drop":
+        print(f"Warning: {message}, these are dropped.")
+        return ~low_depth
+    else:
+        print(
+            f"Warning: Specified rarefication_depth ({rarefication_depth}) is larger than the minimum number of occurrences ({np.min(noccur)})."
+        )
+        return np.ones(len(noccur), dtype=bool)
+
+
+def drop_samples(data, labels, mask):
+    """
+    Keeps the samples marked in mask (see check_depth), in both the data and the labels.
+
+    Returns:
+    --------
+    data : numpy.ndarray, pd.DataFrame or scipy.sparse.csr_matrix
+        The rows of the kept samples.
+    labels : list or None
+        The labels of the kept samples.
+    """
+    if mask.all():
+        return data, labels
+
+    if labels is not None:
+        labels = [label for label, keep in zip(labels, mask) if keep]
+
+    return data[mask], labels
+
+
+def _prepare(data, rarefication_depth, mode, low_depth_policy):
+    """
+    Validates the input and parameters shared by rarefy and build_dataset.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray
+        A 2D array of shape (n_samples, n_features) containing the data.
+    rarefication_depth : int or None
+        Requested depth. If None, the minimum number of occurrences is used.
+    mode : str
+        Either "with_replacement" or "without_replacement".
+    low_depth_policy : str or None
+        Policy for samples below the depth, see check_depth. None skips the check, for data that was checked before.
+
+    Returns:
+    --------
+    data : numpy.ndarray
+        The data, without dropped samples.
+    rarefication_depth : int
+        The depth to rarefy to.
+    """
+    if mode not in RAREFACTION_MODES:
+        raise ValueError(f"mode should be one of {RAREFACTION_MODES}, got {mode!r}")
+
+    if sp.issparse(data):
+        data = sp.csr_matrix(data)
+        data.sum_duplicates()
+        data.eliminate_zeros()
+        values = data.data
+    else:
+        data = np.asarray(data)
+        values = data
+
+    if mode == "without_replacement":
+        if not np.all(np.mod(values, 1) == 0):
+            raise ValueError("Rarefying without replacement requires integer counts.")
+        data = data.astype(np.int64)
+
+    if rarefication_depth is None:
+        rarefication_depth = np.min(_row_sums(data))
+    elif low_depth_policy is not None:
+        mask = check_depth(data, rarefication_depth, low_depth_policy)
+        if not mask.all():
+            data = data[mask]
+
+    return data, int(rarefication_depth)
+
+
+def _multivariate_hypergeometric(prng, data, rarefication_depth, size=None):
+    """
+    Subsamples reads without replacement for many samples at once.
+
+    Reads are drawn one feature at a time from a univariate hypergeometric distribution conditioned on the
+    reads left in the sample, vectorized over all samples. The cost scales with the number of features, not with
+    the depth. Samples with fewer reads than the depth keep all of their reads.
 
     Parameters:
     -----------
+    prng : numpy.random.Generator
+        The random number generator to draw from.
     data : numpy.ndarray
+        A 2D integer array of shape (n_samples, n_features) containing the counts.
+    rarefication_depth : int
+        Number of reads to sample.
+    size : tuple, optional
+        Leading dimensions to repeat the draw for, e.g. (iterations, n_samples).
+
+    Returns:
+    --------
+    output : numpy.ndarray
+        An integer array of shape size + (n_features,) (or the shape of data) with the subsampled counts.
+    """
+    shape = data.shape if size is None else (*size, data.shape[-1])
+    colors = np.broadcast_to(data, shape)
+
+    remaining = np.broadcast_to(np.sum(data, axis=-1), shape[:-1]).copy()
+    nsample = np.minimum(remaining, rarefication_depth)
+
+    output = np.empty(shape, dtype=np.int64)
+    for j in range(shape[-1]):
+        good = colors[..., j]
+        remaining -= good
+        output[..., j] = prng.hypergeometric(good, remaining, nsample)
+        nsample -= output[..., j]
+
+    return output
+
+
+def _sparse_draw(prng, data, rarefication_depth, mode, repeats=1):
+    """
+    Rarefies a CSR matrix, touching only its nonzero entries.
+
+    Counts are drawn for the k-th nonzero entry of every row at once, conditioned on the reads drawn for the
+    entries before it: binomial draws with replacement, hypergeometric draws without. The number of vectorized
+    steps equals the largest number of nonzero entries in a row.
+
+    Parameters:
+    -----------
+    prng : numpy.random.Generator
+        The random number generator to draw from.
+    data : scipy.sparse.csr_matrix
+        A canonical CSR matrix of shape (n_samples, n_features) without explicit zeros.
+    rarefication_depth : int
+        Number of reads to sample.
+    mode : str
+        "with_replacement" or "without_replacement".
+    repeats : int, optional
+        Number of times to rarefy every sample, repeats are stacked along the rows. Default is 1.
+
+    Returns:
+    --------
+    output : scipy.sparse.csr_matrix
+        A CSR matrix of shape (n_samples * repeats, n_features) with the rarefied counts.
+    """
+    lengths = np.tile(np.diff(data.indptr), repeats)
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.tile(data.indices, repeats)
+    counts = np.tile(data.data, repeats)
+
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(counts)) - indptr[rows]
+    last = position == lengths[rows] - 1
+
+    order = np.argsort(position, kind="stable")
+    bounds = np.searchsorted(position[order], np.arange(lengths.max(initial=0) + 1))
+
+    remaining = np.tile(_row_sums(data), repeats)
+    if mode == "without_replacement":
+        nsample = np.minimum(remaining, rarefication_depth)
+    else:
+        nsample = np.full(len(lengths), rarefication_depth, dtype=np.int64)
+
+    values = np.empty(len(counts), dtype=np.int64)
+    for k in range(len(bounds) - 1):
+        entries = order[bounds[k] : bounds[k + 1]]
+        r = rows[entries]
+        good = counts[entries]
+        if mode == "without_replacement":
+            draw = prng.hypergeometric(good, remaining[r] - good, nsample[r])
+        else:
+            p = np.where(last[entries], 1.0, np.minimum(good / remaining[r], 1.0))
+            draw = prng.binomial(nsample[r], p)
+        values[entries] = draw
+        nsample[r] -= draw
+        remaining[r] -= good
+
+    output = sp.csr_matrix(
+        (values.astype(count_dtype(rarefication_depth)), indices, indptr),
+        shape=(len(lengths), data.shape[1]),
+    )
+    output.eliminate_zeros()
+
+    return output
+
+
+def _draw(prng, data, rarefication_depth, mode, size=None):
+    """
+    Draws rarefied counts for all samples in data, see rarefy for the parameters.
+
+    For sparse input a CSR matrix is returned with the leading dimensions in size flattened into the rows.
+    """
+    if sp.issparse(data):
+        repeats = 1 if size is None else int(np.prod(size[:-1]))
+        return _sparse_draw(prng, data, rarefication_depth, mode, repeats=repeats)
+
+    if mode == "without_replacement":
+        return _multivariate_hypergeometric(prng, data, rarefication_depth, size=size)
+
+    p = data / np.sum(data, axis=1, keepdims=True)
+    return prng.multinomial(rarefication_depth, p, size=size)
+
+
+def rarefy(
+    data,
+    rarefication_depth=None,
+    seed=0,
+    out=None,
+    mode="with_replacement",
+    low_depth_policy="keep",
+):
+    """
+    This function performs rarefaction on a matrix data.
+
+    With replacement, counts are drawn directly from a multinomial distribution per sample. Without replacement
+    reads are subsampled using multivariate hypergeometric draws. In both cases all samples are handled in
+    vectorized calls, so the cost does not depend on the number of reads sampled. Sparse input is rarefied
+    using its nonzero entries only.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
         A 2D array of shape (n_samples, n_features) containing the data.
     rarefication_depth : int, optional
         Sampling rarefication_depth. If not specified, the minimum number of occurrences is used.
     seed : int, optional
         Seed for the random number generator. Default is 0.
+    out : numpy.ndarray, optional
+        Preallocated array of shape (n_samples, n_features) to write the result to, ignored for sparse input.
+        Any numeric dtype that holds the counts can be used.
+    mode : str, optional
+        "with_replacement" (default) samples reads from the relative frequencies, "without_replacement"
+        subsamples the actual reads (classic rarefaction).
+    low_depth_policy : str or None, optional
+        How to handle samples with fewer reads than rarefication_depth: "keep" (default), "drop" or "error".
+        Kept samples are sampled up to the depth with replacement, or keep all their reads without replacement.
+        None keeps them without checking, for data that was already checked with check_depth.
 
     Returns:
     --------
-    output : numpy.ndarray
-        A 2D array of shape (n_samples, n_features) containing the rarefied data.
+    output : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) containing the rarefied data, sparse if data is sparse. The
+        counts are stored as unsigned integers, see count_dtype.
     """
+    data, rarefication_depth = _prepare(
+        data, rarefication_depth, mode, low_depth_policy
+    )
     prng = np.random.default_rng(seed)
-    noccur = np.sum(data, axis=1)
-    nvar = data.shape[1]
 
-    if rarefication_depth is None:
-        rarefication_depth = np.min(noccur)
-    elif rarefication_depth > np.min(noccur):
-        print(
-            f"Warning: Specified rarefication_depth ({rarefication_depth}) is larger than the minimum number of occurrences ({np.min(noccur)})."
-        )
+    if sp.issparse(data):
+        return _draw(prng, data, rarefication_depth, mode)
 
-    output = np.empty((data.shape[0], nvar))
-    for i in np.arange(data.shape[0]):  # for each sample
-        p = data[i] / float(noccur[i])  # relative frequency / probability
-        choice = prng.choice(nvar, rarefication_depth, p=p)
-        output[i] = np.bincount(choice, minlength=nvar)
+    if out is None:
+        output = np.empty(data.shape, dtype=count_dtype(rarefication_depth))
+    else:
+        output = out
+    output[...] = _draw(prng, data, rarefication_depth, mode)
 
     return output
 
 
+def _divide(values, divisor):
+    # Integers are exactly representable in float32 up to 2**24, far beyond any depth
+    if np.issubdtype(values.dtype, np.integer):
+        return np.divide(values, divisor, dtype=np.float32)
+
+    return (values / divisor).astype(np.float32)
+
+
 def scale_data(data, rarefication_depth):
     """
     Scales each row of the input data by the rarefaction depth.
 
+    The result is float32, the precision the model uses. For integer counts the division is done in float32
+    directly, which gives exactly the same values as dividing in float64 and rounding the result to float32.
+
     Parameters:
     -----------
-    data : numpy.ndarray
+    data : numpy.ndarray or scipy.sparse.csr_matrix
         A 2D array of shape (n_samples, n_features) containing the data to be scaled.
     rarefication_depth : float
         The value by which each value in the data matrix will be divided.
 
     Returns:
     --------
-    scaled_data : numpy.ndarray
-        The resulting data after scaling, which has the same shape as the input data.
+    scaled_data : numpy.ndarray or scipy.sparse.csr_matrix
+        The resulting float32 data after scaling, which has the same shape as the input data. Sparse input stays
+        sparse.
     """
+    if sp.issparse(data):
+        data = sp.csr_matrix(data)
+        return sp.csr_matrix(
+            (_divide(data.data, rarefication_depth), data.indices, data.indptr),
+            shape=data.shape,
+        )
 
     # Ensure that data is a NumPy array to apply operations element-wise
     data = np.asarray(data)
 
     # Scale each row of the data matrix by the rarefaction depth
-    scaled_data = data / rarefication_depth
+    scaled_data = _divide(data, rarefication_depth)
 
     return scaled_data
 
 
-def build_dataset(data, rarefication_depth, iterations=10, seed=0):
+def align_columns(data, columns, reference):
     """
-    This function builds an expanded dataset by performing multiple rarefaction on a matrix data.
+    Reorders the columns of data to match a reference, e.g. the features a model was trained on.
+
+    Features missing from data are filled with zeros, features not in the reference are dropped.
 
     Parameters:
     -----------
-    data : numpy.ndarray
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, len(columns)).
+    columns : list
+        The feature names of the columns in data.
+    reference : list
+        The feature names, in order, the output should have.
+
+    Returns:
+    --------
+    output : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, len(reference)).
+    missing : list
+        The features in reference that were not found in columns.
+    """
+    position = {c: i for i, c in enumerate(columns)}
+    if len(position) != len(columns):
+        raise ValueError("Column names should be unique.")
+
+    src = np.array([position[c] for c in reference if c in position], dtype=np.int64)
+    dst = np.array(
+        [i for i, c in enumerate(reference) if c in position], dtype=np.int64
+    )
+    missing = [c for c in reference if c not in position]
+
+    if sp.issparse(data):
+        selection = sp.csr_matrix(
+            (np.ones(len(src)), (src, dst)), shape=(len(columns), len(reference))
+        )
+        return (sp.csr_matrix(data) @ selection).astype(data.dtype), missing
+
+    data = np.asarray(data)
+    output = np.zeros((data.shape[0], len(reference)), dtype=data.dtype)
+    output[:, dst] = data[:, src]
+
+    return output, missing
+
+
+def prepare_counts(
+    counts,
+    rarefication_depth,
+    reference=None,
+    n_features=None,
+    labels=None,
+    columns=None,
+    low_depth_policy="keep",
+    return_mask=False,
+):
+    """
+    Prepares a count table of new samples for scoring with a trained model.
+
+    Parameters:
+    -----------
+    counts : pd.DataFrame, numpy.ndarray or scipy.sparse.csr_matrix
+        A count table of shape (n_samples, n_features).
+    rarefication_depth : int
+        The depth the model rarefies to.
+    reference : list, optional
+        The feature names the model was trained on, columns are aligned to these if both are known.
+    n_features : int, optional
+        The number of features the model expects, checked when columns can't be aligned.
+    labels : list, optional
+        Labels for the samples, taken from the index if counts is a DataFrame.
+    columns : list, optional
+        Names of the features in counts, taken from counts.columns if counts is a DataFrame.
+    low_depth_policy : str, optional
+        What to do with samples that have fewer reads than the rarefication_depth: "keep", "drop" or "error".
+    return_mask : bool, optional
+        If True, the mask of the kept samples is returned as well.
+
+    Returns:
+    --------
+    counts : numpy.ndarray or scipy.sparse.csr_matrix
+        The aligned counts, without dropped samples.
+    labels : list or None
+        The labels of the remaining samples.
+    mask : numpy.ndarray
+        Boolean array marking the kept samples, only if return_mask is True.
+    """
+    if isinstance(counts, pd.DataFrame):
+        if columns is None:
+            columns = counts.columns.tolist()
+        if labels is None:
+            labels = counts.index.tolist()
+        counts = counts.values
+
+    if reference is not None and columns is not None:
+        counts, missing = align_columns(counts, columns, reference)
+        if missing:
+            print(
+                f"Warning: {len(missing)} feature(s) of the model are missing from the input, these are set to 0."
+            )
+    elif n_features is not None and counts.shape[1] != n_features:
+        raise ValueError(f"Expected {n_features} features, got {counts.shape[1]}.")
+
+    mask = check_depth(counts, rarefication_depth, low_depth_policy)
+    counts, labels = drop_samples(counts, labels, mask)
+
+    if return_mask:
+        return counts, labels, mask
+
+    return counts, labels
+
+
+def read_table_chunks(path, chunk_size=65536, sep=None):
+    """
+    Opens a count table stored as a delimited text file for reading in chunks.
+
+    Parameters:
+    -----------
+    path : str or Path
+        A table with the samples in rows, the sample labels in the first column and the feature names in the
+        header. Compressed files (.gz, .bz2, ...) are supported.
+    chunk_size : int, optional
+        Number of samples per chunk. Default is 65536.
+    sep : str, optional
+        The separator, "," for .csv files and a tab otherwise by default.
+
+    Returns:
+    --------
+    reader : pandas.io.parsers.TextFileReader
+        An iterator over DataFrames of up to chunk_size samples, to be used as a context manager.
+    """
+    if sep is None:
+        suffixes = [s.lower() for s in Path(path).suffixes]
+        while suffixes and suffixes[-1] in (".gz", ".bz2", ".xz", ".zip", ".zst"):
+            suffixes.pop()
+        sep = "," if suffixes and suffixes[-1] == ".csv" else "\t"
+
+    return pd.read_csv(path, sep=sep, index_col=0, chunksize=chunk_size)
+
+
+def rarefied_chunks(
+    counts,
+    rarefication_depth,
+    seed=0,
+    mode="with_replacement",
+    chunk_size=65536,
+    low_depth_policy="keep",
+):
+    """
+    Rarefies and scales a count table chunk by chunk, for scoring large tables with bounded memory.
+
+    Parameters:
+    -----------
+    counts : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features).
+    rarefication_depth : int
+        Number of reads to sample during rarefication.
+    seed : int, optional
+        Seed for the random number generator, combined with the position of each chunk. Default is 0.
+    mode : str, optional
+        "with_replacement" (default) or "without_replacement", see rarefy.
+    chunk_size : int, optional
+        Number of samples per chunk. Default is 65536.
+    low_depth_policy : str or None, optional
+        Applied once to all of counts before chunking, see rarefy. Default is "keep".
+
+    Yields:
+    -------
+    chunk : numpy.ndarray or scipy.sparse.csr_matrix
+        The rarefied data of the next chunk of samples, scaled by the depth.
+    """
+    if low_depth_policy is not None:
+        mask = check_depth(counts, rarefication_depth, low_depth_policy)
+        if not mask.all():
+            counts = counts[mask]
+
+    for start in range(0, counts.shape[0], chunk_size):
+        yield scale_data(
+            rarefy(
+                counts[start : start + chunk_size],
+                rarefication_depth,
+                seed=[seed, start],
+                mode=mode,
+                low_depth_policy=None,
+            ),
+            rarefication_depth,
+        )
+
+
+def rarefied_batches(
+    data,
+    rarefication_depth,
+    batch_size=64,
+    seed=0,
+    mode="with_replacement",
+    low_depth_policy="keep",
+):
+    """
+    Generates an endless stream of freshly rarefied and scaled mini-batches.
+
+    Every pass over the data visits all samples once in a random order, each batch is rarefied on the fly, so
+    only a single batch is materialized at any time.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
         A 2D array of shape (n_samples, n_features) containing the data.
     rarefication_depth : int
         Number of reads to sample during rarefication.
-    iterations : int, optional
-        Number of rarefied sets to generate. Default is 10.
+    batch_size : int, optional
+        Number of rows per batch. Default is 64.
     seed : int, optional
         Seed for the random number generator. Default is 0.
+    mode : str, optional
+        "with_replacement" (default) or "without_replacement", see rarefy.
+    low_depth_policy : str or None, optional
+        Policy for samples below the depth, see rarefy. Default is "keep".
+
+    Yields:
+    -------
+    batch : numpy.ndarray or scipy.sparse.csr_matrix
+        A float32 array of shape (batch_size, n_features) with rarefied data scaled by the depth, the last batch
+        of a pass can be smaller. Batches are sparse if data is sparse.
+    """
+    data, rarefication_depth = _prepare(
+        data, rarefication_depth, mode, low_depth_policy
+    )
+    prng = np.random.default_rng(seed)
+
+    while True:
+        order = prng.permutation(data.shape[0])
+        for start in range(0, len(order), batch_size):
+            batch = _draw(
+                prng, data[order[start : start + batch_size]], rarefication_depth, mode
+            )
+            yield scale_data(batch, rarefication_depth)
+
+
+def shuffled_batches(data, batch_size=64, seed=0, rarefication_depth=None):
+    """
+    Generates mini-batches from the rows of data in a random order, making a single pass.
+
+    Compact count data (see build_dataset) can be scaled batch by batch, so the full dataset is never converted
+    to floating point.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_rows, n_features).
+    batch_size : int, optional
+        Number of rows per batch. Default is 64.
+    seed : int or None, optional
+        Seed for the random order, if None rows are returned in order. Default is 0.
+    rarefication_depth : int, optional
+        If set, data holds counts and every batch is scaled by the depth, see scale_data.
+
+    Yields:
+    -------
+    batch : numpy.ndarray or scipy.sparse.csr_matrix
+        A float32 batch of rows from data.
+    """
+    if seed is None:
+        order = np.arange(data.shape[0])
+    else:
+        order = np.random.default_rng(seed).permutation(data.shape[0])
+
+    for start in range(0, len(order), batch_size):
+        batch = data[order[start : start + batch_size]]
+        if rarefication_depth is not None:
+            yield scale_data(batch, rarefication_depth)
+        else:
+            yield batch.astype(np.float32)
+
+
+class RowSubset:
+    """
+    A selection of the rows of a 2D array that doesn't copy them. Indexing it gathers the selected rows from the
+    array, e.g. one batch at a time, so a dataset in a memory map or shared memory isn't copied by every process
+    that trains on it.
+
+    Attributes:
+    -----------
+    data : numpy.ndarray
+        The array the rows are taken from.
+    rows : numpy.ndarray
+        The positions of the selected rows in data.
+    """
+
+    def __init__(self, data, rows):
+        self.data = data
+        self.rows = np.asarray(rows)
+
+    @property
+    def shape(self):
+        return (len(self.rows), *self.data.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.data[self.rows[index]]
+
+    def __array__(self, dtype=None, copy=None):
+        output = self.data[self.rows]
+        return output if dtype is None else output.astype(dtype, copy=False)
+
+
+def split_rows(data, test_size=0.15, seed=0, copy=True):
+    """
+    Randomly splits the rows of data in a training and test set, the same split as scikit-learn's
+    train_test_split(data, test_size=test_size, random_state=seed).
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_rows, n_features).
+    test_size : float
+        Fraction of the rows in the test set, rounded up.
+    seed : int
+        The random state seed.
+    copy : bool
+        If False, both sets are a RowSubset of data instead of a copy of its rows.
 
     Returns:
     --------
-    output : numpy.ndarray
-        A 2D array of shape (n_samples * iterations, n_features) containing the rarefied data.
+    train, test : numpy.ndarray, scipy.sparse.csr_matrix or RowSubset
+        The rows of both sets.
+    """
+    ntest = int(np.ceil(test_size * data.shape[0]))
+    order = np.random.RandomState(seed).permutation(data.shape[0])
+
+    if not copy:
+        return RowSubset(data, order[ntest:]), RowSubset(data, order[:ntest])
+
+    return data[order[ntest:]], data[order[:ntest]]
+
+
+def _shards(nsamples, nvar, iterations):
+    """
+    Splits the expanded dataset into blocks of (iterations, samples) that are drawn independently.
+
+    Small tables are grouped across iterations, large ones are split into sample blocks within an iteration.
+
+    Returns:
+    --------
+    shards : list
+        A list of (iteration_start, iteration_stop, sample_start, sample_stop) tuples.
     """
-    rarefied_sets = [
-        rarefy(data, rarefication_depth, seed=seed + i) for i in range(iterations)
+    rows = max(1, _BLOCK_ELEMENTS // max(1, nvar))
+    if rows >= nsamples:
+        step = max(1, rows // max(1, nsamples))
+        return [
+            (i, min(i + step, iterations), 0, nsamples)
+            for i in range(0, iterations, step)
+        ]
+
+    return [
+        (i, i + 1, j, min(j + rows, nsamples))
+        for i in range(iterations)
+        for j in range(0, nsamples, rows)
     ]
-    return np.concatenate(rarefied_sets, axis=0)
+
+
+def _draw_shard(data, rarefication_depth, mode, seed, shard):
+    """
+    Draws one shard of build_dataset.
+
+    Every shard has its own random stream, spawned from the seed by its position, so the result does not depend
+    on which process draws it or in which order.
+    """
+    iteration_start, iteration_stop, sample_start, sample_stop = shard
+    prng = np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(iteration_start, sample_start))
+    )
+    return _draw(
+        prng,
+        data[sample_start:sample_stop],
+        rarefication_depth,
+        mode,
+        size=(iteration_stop - iteration_start, sample_stop - sample_start),
+    )
+
+
+def _fill_shard(output, data, rarefication_depth, mode, seed, shard):
+    """
+    Draws one shard of build_dataset into output, a (iterations, n_samples, n_features) view of the result.
+    """
+    iteration_start, iteration_stop, sample_start, sample_stop = shard
+    output[iteration_start:iteration_stop, sample_start:sample_stop] = _draw_shard(
+        data, rarefication_depth, mode, seed, shard
+    )
+
+
+def _init_worker(name, shape, dtype, data, rarefication_depth, mode, seed):
+    """
+    Sets up a build_dataset worker process, attaching it to the shared output array if there is one.
+    """
+    if name is not None:
+        shm = shared_memory.SharedMemory(name=name)
+        _worker["shm"] = shm
+        _worker["output"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker["args"] = (data, rarefication_depth, mode, seed)
+
+
+def _run_shard(shard):
+    if "output" in _worker:
+        _fill_shard(_worker["output"], *_worker["args"], shard)
+    else:
+        return _draw_shard(*_worker["args"], shard)
+
+
+def _shared_empty(shape, dtype=np.float64):
+    """
+    Allocates an uninitialized array in shared memory.
+
+    The shared memory segment is released once the returned array (and every view on it) is garbage collected.
+
+    Returns:
+    --------
+    output : numpy.ndarray
+        The array backed by shared memory.
+    shm : multiprocessing.shared_memory.SharedMemory
+        The segment, other processes can attach to it using shm.name.
+    """
+    nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    output = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    finalizer = weakref.finalize(output, shm.close)
+    finalizer.atexit = False
+
+    return output, shm
+
+
+def build_dataset(
+    data,
+    rarefication_depth,
+    iterations=10,
+    seed=0,
+    mode="with_replacement",
+    low_depth_policy="keep",
+    n_jobs=1,
+    out=None,
+):
+    """
+    This function builds an expanded dataset by performing multiple rarefaction on a matrix data.
+
+    The expanded dataset is split in shards (blocks of iterations and samples), each drawn from an independent
+    random stream spawned from the seed with numpy.random.SeedSequence. Shards are written directly into a
+    preallocated output array, which is placed in shared memory when multiple processes are used. The output is
+    identical regardless of n_jobs. Sparse input produces a sparse expanded dataset, its shards are returned by the
+    worker processes and stacked.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples, n_features) containing the data.
+    rarefication_depth : int
+        Number of reads to sample during rarefication.
+    iterations : int, optional
+        Number of rarefied sets to generate. Default is 10.
+    seed : int or sequence of ints, optional
+        Seed for the random number generator, used as entropy for numpy.random.SeedSequence. Default is 0.
+    mode : str, optional
+        "with_replacement" (default) or "without_replacement", see rarefy.
+    low_depth_policy : str or None, optional
+        How to handle samples with fewer reads than rarefication_depth: "keep" (default), "drop" or "error", or
+        None to skip the check for data that was already checked, see rarefy.
+    n_jobs : int, optional
+        Number of processes used to draw the shards, -1 uses all CPUs. Default is 1. Workers are started with
+        spawn, as TensorFlow (which may be loaded in this process) isn't fork-safe, so scripts need an
+        if __name__ == "__main__" guard.
+    out : numpy.ndarray, optional
+        A C-contiguous array of shape (n_samples * iterations, n_features) to write the dense result to, e.g. a
+        shared memory buffer. Any numeric dtype that holds the counts can be used. Not supported for sparse input.
+
+    Returns:
+    --------
+    output : numpy.ndarray or scipy.sparse.csr_matrix
+        A 2D array of shape (n_samples * iterations, n_features) containing the rarefied data. Counts are stored
+        as unsigned integers (see count_dtype), use scale_data (per batch) to get the model inputs.
+    """
+    data, rarefication_depth = _prepare(
+        data, rarefication_depth, mode, low_depth_policy
+    )
+    nsamples, nvar = data.shape
+    if sp.issparse(data):
+        # Size shards by the number of stored entries rather than the number of features
+        shards = _shards(nsamples, max(1, data.nnz // max(1, nsamples)), iterations)
+    else:
+        shards = _shards(nsamples, nvar, iterations)
+
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    n_jobs = max(1, min(n_jobs or 1, len(shards)))
+
+    if sp.issparse(data):
+        if out is not None:
+            raise ValueError("out is not supported for sparse data")
+        args = (data, rarefication_depth, mode, seed)
+        if n_jobs == 1:
+            blocks = [_draw_shard(*args, shard) for shard in shards]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(None, None, None, *args),
+            ) as executor:
+                blocks = list(executor.map(_run_shard, shards))
+        return sp.vstack(blocks, format="csr")
+
+    shape = (iterations, nsamples, nvar)
+    dtype = count_dtype(rarefication_depth)
+    if out is not None:
+        if out.shape != (nsamples * iterations, nvar):
+            raise ValueError(
+                f"out must have shape {(nsamples * iterations, nvar)}, not {out.shape}"
+            )
+        if not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous")
+
+    if n_jobs == 1:
+        output = np.empty(shape, dtype) if out is None else out.reshape(shape)
+        for shard in shards:
+            _fill_shard(output, data, rarefication_depth, mode, seed, shard)
+    else:
+        output, shm = _shared_empty(shape, dtype)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shm.name, shape, dtype, data, rarefication_depth, mode, seed),
+            ) as executor:
+                for _ in executor.map(_run_shard, shards):
+                    pass
+        finally:
+            shm.unlink()
+
+        if out is not None:
+            out.reshape(shape)[...] = output
+            output = out
+
+    return output.reshape(nsamples * iterations, nvar)
@@ -2,9 +2,17 @@ import numpy as np
 from unittest.mock import MagicMock
 from tensorflow.keras import backend as K
 from tensorflow.keras import models
+from tensorflow.keras import losses
 
 # Assuming create_autoencoder was defined in a module called autoencoder_module
-from dyspyosis.autoencoder import create_autoencoder, get_loss
+from dyspyosis.autoencoder import (
+    create_autoencoder,
+    create_count_stream,
+    create_scoring_model,
+    get_loss,
+    get_scores,
+)
+from dyspyosis.utils import build_dataset, scale_data
 
 
 def test_autoencoder_creation():
@@ -65,3 +73,70 @@ def test_get_loss():
     assert np.allclose(losses_output, expected), (
         f"Expected {expected}, got {losses_output}"
     )
+
+
+def test_get_loss_matches_per_sample():
+    data = np.random.default_rng(0).random((50, 10)).astype(np.float32)
+    data /= data.sum(axis=1, keepdims=True)
+
+    autoencoder, _, _ = create_autoencoder(10)
+
+    # Reference: the loss computed one sample at a time
+    predicted = autoencoder.predict(data, verbose=0)
+    loss_function = losses.MeanSquaredError(reduction="none")
+    expected = [loss_function(a, b).numpy() for a, b in zip(predicted, data)]
+
+    output = get_loss(autoencoder, data)
+    assert output.dtype == np.float32
+    assert np.array_equal(output, expected)
+
+    # Chunking doesn't change the result
+    assert np.array_equal(get_loss(autoencoder, data, chunk_size=7), output)
+
+    K.clear_session()
+
+
+def test_create_count_stream():
+    counts = build_dataset(np.random.default_rng(0).integers(0, 100, (20, 6)), 500, 5)
+    scaled = scale_data(counts, 500)
+
+    batches = [
+        x.numpy() for x, _ in create_count_stream(counts, 500, 16, 3, range(2, 4))
+    ]
+    assert [len(b) for b in batches] == [16] * 6 + [4] + [16] * 6 + [4]
+
+    # Every epoch visits each row once and is scaled exactly like scale_data
+    first = np.concatenate(batches[:7])
+    order = np.lexsort(first.T)
+    assert np.array_equal(first[order], scaled[np.lexsort(scaled.T)])
+
+    # Epochs are shuffled independently but reproducibly
+    again = [x.numpy() for x, _ in create_count_stream(counts, 500, 16, 3, range(3, 4))]
+    assert np.array_equal(np.concatenate(again), np.concatenate(batches[7:]))
+    assert not np.array_equal(np.concatenate(batches[7:]), first)
+
+
+def test_ensemble_matches_members():
+    """Training an ensemble is the same as training its members separately on the same batches."""
+    data = np.random.default_rng(0).random((64, 10)).astype(np.float32)
+    data /= data.sum(axis=1, keepdims=True)
+
+    ensemble, ensemble_encoder, _ = create_autoencoder(10, 3, ensemble_size=2)
+    members = [create_autoencoder(10, 3) for _ in range(2)]
+    kernel, bias, decoder_kernel, decoder_bias = ensemble.get_weights()
+    for k, (member, _, _) in enumerate(members):
+        member.set_weights([kernel[k], bias[k], decoder_kernel[k], decoder_bias[k]])
+
+    ensemble.fit(data, data, batch_size=16, epochs=3, shuffle=False, verbose=0)
+    for member, _, _ in members:
+        member.fit(data, data, batch_size=16, epochs=3, shuffle=False, verbose=0)
+
+    for k, (member, _, _) in enumerate(members):
+        for weights, expected in zip(ensemble.get_weights(), member.get_weights()):
+            assert np.allclose(weights[k], expected, rtol=1e-4, atol=1e-6)
+
+    latent, loss = get_scores(create_scoring_model(ensemble, ensemble_encoder), data)
+    assert latent.shape == (64, 2, 3)
+    assert loss.shape == (64, 2)
+    assert np.allclose(loss[:, 1], get_loss(members[1][0], data), rtol=1e-5)
+    assert np.allclose(get_loss(ensemble, data), loss)
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from dyspyosis.cache import DatasetCache, dataset_key
+from dyspyosis.dyspyosis import Dyspyosis
+from dyspyosis.utils import build_dataset
+
+
+def test_dataset_key():
+    data = np.arange(12).reshape(3, 4)
+
+    assert dataset_key(data, seed=0) == dataset_key(data.copy(), seed=0)
+    assert dataset_key(data, seed=0) != dataset_key(data, seed=1)
+    assert dataset_key(data, seed=0) != dataset_key(data.T.copy(), seed=0)
+    assert dataset_key(data, seed=0) != dataset_key(data.astype(float), seed=0)
+    assert dataset_key(sp.csr_matrix(data)) == dataset_key(sp.coo_matrix(data))
+
+
+def test_build_dataset(tmp_path, monkeypatch):
+    data = np.random.default_rng(0).integers(0, 100, size=(20, 8))
+    cache = DatasetCache(tmp_path)
+
+    output = cache.build_dataset(data, 50, 3, seed=1)
+    assert isinstance(output, np.memmap)
+    assert np.array_equal(output, build_dataset(data, 50, 3, seed=1))
+    assert len(os.listdir(tmp_path)) == 1
+
+    # The second call is served from the cache
+    monkeypatch.setattr("dyspyosis.cache.build_dataset", None)
+    assert np.array_equal(cache.build_dataset(data, 50, 3, seed=1), output)
+
+    monkeypatch.undo()
+    data = sp.csr_matrix(data)
+    output = cache.build_dataset(data, 50, 3, seed=1)
+    assert sp.issparse(output)
+    assert np.array_equal(
+        output.toarray(), build_dataset(data, 50, 3, seed=1).toarray()
+    )
+    assert np.array_equal(
+        cache.build_dataset(data, 50, 3, seed=1).toarray(),
+        output.toarray(),
+    )
+
+
+def test_eviction(tmp_path):
+    data = np.ones((10, 10), dtype=int)
+    cache = DatasetCache(tmp_path)
+
+    keys = [dataset_key(data, seed=i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, np.full((100, 10), i, dtype=float))
+        os.utime(tmp_path / key, (i, i))
+    entry_size = cache.size() // 3
+
+    # Using the first entry makes the second one the least recently used
+    assert cache.get(keys[0])[0, 0] == 0
+
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert keys[0] in cache and keys[1] not in cache and keys[2] in cache
+
+    # An entry larger than the cache itself is still kept
+    cache.max_bytes = 1
+    cache.put(dataset_key(data, seed=3), np.zeros((100, 10)))
+    assert os.listdir(tmp_path) == [dataset_key(data, seed=3)]
+
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_dyspyosis_cache(tmp_path):
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+
+    expected = Dyspyosis(data, rarefication_depth=1000)
+    first = Dyspyosis(data, rarefication_depth=1000, cache=tmp_path)
+    second = Dyspyosis(data, rarefication_depth=1000, cache=DatasetCache(tmp_path))
+
+    assert len(os.listdir(tmp_path)) == 1
+    assert np.array_equal(first.x_train, expected.x_train)
+    assert np.array_equal(second.x_train, expected.x_train)
+    assert np.array_equal(second.x_test, expected.x_test)
+
+    # The cached memory map is split by row positions rather than loaded in memory
+    assert isinstance(second.x_train.data, np.memmap)
+    assert second.x_train.data is second.x_test.data
+    assert second.memory_usage()[["x_train", "x_test"]].sum() == 1000 * 8
+    second.autoencoder.set_weights(expected.autoencoder.get_weights())
+    assert (
+        second.run_training(epochs=2, verbose=0)["history"]
+        == expected.run_training(epochs=2, verbose=0)["history"]
+    )
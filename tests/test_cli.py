@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dyspyosis import Dyspyosis
+from dyspyosis.cli import main
+from dyspyosis.inference import NumpyModel
+
+
+@pytest.fixture
+def model(tmp_path):
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    columns = [f"genus_{i}" for i in range(10)]
+    dyspyosis = Dyspyosis(pd.DataFrame(data, columns=columns), rarefication_depth=1000)
+    dyspyosis.run_training(epochs=2)
+    dyspyosis.export(tmp_path / "model.npz")
+
+    return NumpyModel.load(tmp_path / "model.npz")
+
+
+@pytest.fixture
+def counts():
+    counts = pd.DataFrame(
+        np.random.default_rng(1).integers(0, high=1000, size=(50, 10)),
+        index=[f"sample_{i}" for i in range(50)],
+        columns=[f"genus_{i}" for i in range(10)][::-1],
+    )
+    # A few samples below the rarefication depth
+    counts.iloc[[3, 17, 18], :] = 1
+
+    return counts
+
+
+def test_score_chunks(model, counts):
+    """Scores don't depend on how the input is split."""
+    expected = model.score_new(counts, chunk_size=8, low_depth_policy="drop")
+
+    pieces = [counts.iloc[:5], counts.iloc[5:19], counts.iloc[19:20], counts.iloc[20:]]
+    scores = list(model.score_chunks(pieces, chunk_size=8, low_depth_policy="drop"))
+
+    assert [len(s) for s in scores] == [8] * 5 + [7]
+    pd.testing.assert_frame_equal(pd.concat(scores, ignore_index=True), expected)
+
+    # Pieces without labels can't be mixed with labeled ones, in either order
+    array = counts[model.columns].to_numpy()
+    with pytest.raises(ValueError, match="labels"):
+        list(model.score_chunks([counts.iloc[:5], array[5:]], chunk_size=8))
+    with pytest.raises(ValueError, match="labels"):
+        list(model.score_chunks([array[:5], counts.iloc[5:]], chunk_size=8))
+
+
+def test_main_rejects_ensembles(capsys, tmp_path, counts):
+    """NumpyModel can't score ensembles, saving one doesn't make it loadable."""
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    Dyspyosis(data, rarefication_depth=1000, ensemble_size=2).save(tmp_path / "model")
+    counts.to_csv(tmp_path / "counts.tsv", sep="\t")
+
+    with pytest.raises(ValueError, match="ensemble"):
+        NumpyModel.load(tmp_path / "model")
+    with pytest.raises(SystemExit):
+        main(
+            [
+                str(tmp_path / "model"),
+                str(tmp_path / "counts.tsv"),
+                str(tmp_path / "scores.csv"),
+            ]
+        )
+    assert "ensemble" in capsys.readouterr().err
+    assert not (tmp_path / "scores.csv").exists()
+
+
+def test_main(tmp_path, model, counts):
+    counts.to_csv(tmp_path / "counts.tsv.gz", sep="\t")
+
+    main(
+        [
+            str(tmp_path / "model.npz"),
+            str(tmp_path / "counts.tsv.gz"),
+            str(tmp_path / "scores.csv"),
+            "--chunk-size",
+            "8",
+        ]
+    )
+
+    scores = pd.read_csv(tmp_path / "scores.csv")
+    expected = model.score_new(counts, chunk_size=8)
+
+    assert scores["label"].tolist() == counts.index.tolist()
+    assert np.allclose(scores["loss"], expected["loss"])
+    assert np.allclose(scores["L1"], expected["L1"])
+
+
+def test_main_parquet(tmp_path, model, counts):
+    pytest.importorskip("pyarrow")
+    counts.to_csv(tmp_path / "counts.csv")
+
+    main(
+        [
+            str(tmp_path / "model.npz"),
+            str(tmp_path / "counts.csv"),
+            str(tmp_path / "scores.parquet"),
+            "--chunk-size",
+            "16",
+            "--low-depth-policy",
+            "drop",
+        ]
+    )
+
+    scores = pd.read_parquet(tmp_path / "scores.parquet")
+    assert len(scores) == 47
+    expected = model.score_new(counts, chunk_size=16, low_depth_policy="drop")
+    assert np.allclose(scores["loss"], expected["loss"])
@@ -1,7 +1,11 @@
 import pytest
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 from dyspyosis import Dyspyosis
+from dyspyosis import utils
+from dyspyosis.autoencoder import get_loss
+from dyspyosis.utils import rarefy
 
 
 @pytest.fixture
@@ -111,3 +115,219 @@ def test_get_latent(monkeypatch, dyspyosis_instance):
     assert "label" not in latent.columns, (
         "DataFrame should not contain a 'label' column if no labels are provided."
     )
+
+
+def test_low_depth_policy(mock_data, mock_labels):
+    """Samples below the rarefication depth are dropped together with their labels."""
+    mock_data[:3] = 1
+    dyspyosis = Dyspyosis(
+        data=mock_data,
+        labels=mock_labels,
+        rarefication_depth=1000,
+        mode="without_replacement",
+        low_depth_policy="drop",
+    )
+
+    assert dyspyosis.data.shape[0] == 97
+    assert dyspyosis.labels == mock_labels[3:]
+    assert not dyspyosis.sample_mask[:3].any()
+    assert dyspyosis.compute_loss().shape == (97, 2)
+
+    with pytest.raises(ValueError):
+        Dyspyosis(data=mock_data, rarefication_depth=1000, low_depth_policy="error")
+
+
+def test_low_depth_warning_once(capsys, mock_data):
+    """Kept low depth samples are reported once per call, not again by every rarefaction step."""
+    mock_data[:3] = 1
+    dyspyosis = Dyspyosis(data=mock_data, rarefication_depth=1000)
+    assert capsys.readouterr().out.count("Warning") == 1
+
+    dyspyosis.score_new(mock_data, chunk_size=30)
+    assert capsys.readouterr().out.count("Warning") == 1
+
+    dyspyosis.update(mock_data[:20], epochs=1)
+    assert capsys.readouterr().out.count("Warning") == 1
+
+
+def test_n_jobs(monkeypatch, mock_data):
+    """The training data is generated in spawned processes, after TensorFlow has started, with the same result."""
+    monkeypatch.setattr(utils, "_BLOCK_ELEMENTS", 10 * 100)
+    serial = Dyspyosis(data=mock_data, rarefication_depth=1000)
+    parallel = Dyspyosis(data=mock_data, rarefication_depth=1000, n_jobs=2)
+
+    assert np.array_equal(serial.x_train, parallel.x_train)
+    assert np.array_equal(serial.x_test, parallel.x_test)
+
+
+def test_streaming(mock_data, mock_labels):
+    """Streaming mode trains on batches rarefied on the fly."""
+    dyspyosis = Dyspyosis(
+        data=mock_data,
+        labels=mock_labels,
+        rarefication_depth=1000,
+        streaming=True,
+    )
+
+    assert dyspyosis.x_train is None, "Streaming should not materialize training data"
+    assert dyspyosis.x_test.shape == mock_data.shape
+
+    dyspyosis.run_training(epochs=2, batch_size=32)
+
+    assert dyspyosis.compute_loss().shape == (100, 2)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_sparse(mock_data, mock_labels, streaming):
+    """Sparse count tables are trained and scored without densifying."""
+    mock_data[mock_data < 700] = 0
+    mock_data[:, 0] += 1000
+    dyspyosis = Dyspyosis(
+        data=sp.csr_matrix(mock_data),
+        labels=mock_labels,
+        rarefication_depth=1000,
+        streaming=streaming,
+    )
+
+    assert sp.issparse(dyspyosis.scaled_data)
+    assert sp.issparse(dyspyosis.x_test)
+
+    dyspyosis.run_training(epochs=2, batch_size=32)
+
+    assert dyspyosis.compute_loss().shape == (100, 2)
+    assert dyspyosis.get_latent().shape == (100, dyspyosis.encode_dim + 1)
+
+
+def test_memory_usage(mock_data):
+    """Training data is stored as uint16 counts, a quarter of the float64 size, without changing the scores."""
+    dyspyosis = Dyspyosis(data=mock_data, rarefication_depth=1000)
+
+    assert dyspyosis.x_train.dtype == np.uint16
+    assert dyspyosis.scaled_data.dtype == np.float32
+
+    usage = dyspyosis.memory_usage()
+    assert usage["x_train"] + usage["x_test"] == 1000 * 10 * 2
+    assert usage["total"] == usage.drop("total").sum()
+
+    # The model sees the same values as with float64 data
+    reference = rarefy(mock_data, 1000, seed=0).astype(np.float64) / 1000
+    assert np.array_equal(dyspyosis.scaled_data, reference.astype(np.float32))
+    assert np.array_equal(
+        dyspyosis.compute_loss()["loss"],
+        get_loss(dyspyosis.autoencoder, reference),
+    )
+
+
+def test_score(dyspyosis_instance):
+    """score() combines compute_loss and get_latent in one pass."""
+    scores = dyspyosis_instance.score()
+
+    assert list(scores.columns) == ["label", "loss", "L1", "L2", "L3", "L4"]
+    assert scores.shape == (100, 6)
+    assert np.allclose(scores["loss"], dyspyosis_instance.compute_loss()["loss"])
+    assert np.allclose(
+        scores[["L1", "L2", "L3", "L4"]].values,
+        dyspyosis_instance.get_latent()[["L1", "L2", "L3", "L4"]].values,
+    )
+
+    dyspyosis_instance.labels = None
+    assert "label" not in dyspyosis_instance.score().columns
+
+
+def test_score_rarefied(dyspyosis_instance):
+    """Scores are summarized over many rarefactions of each sample."""
+    scores = dyspyosis_instance.score_rarefied(repeats=20, chunk_size=300)
+
+    assert list(scores.columns) == [
+        "label",
+        "loss_mean",
+        "loss_std",
+        "loss_q5",
+        "loss_q50",
+        "loss_q95",
+    ]
+    assert scores.shape[0] == 100
+    assert scores["label"].tolist() == dyspyosis_instance.labels
+    assert np.all(scores["loss_std"] >= 0)
+    assert np.all(scores["loss_q5"] <= scores["loss_q95"])
+
+    # Reproducible for a given seed
+    again = dyspyosis_instance.score_rarefied(repeats=20, chunk_size=300)
+    assert np.array_equal(scores["loss_mean"], again["loss_mean"])
+
+    scores = dyspyosis_instance.score_rarefied(repeats=5, quantiles=(), latent=True)
+    assert "L1_mean" in scores.columns and "L4_std" in scores.columns
+
+
+def test_save_load(tmp_path, mock_data, mock_labels):
+    """A saved model is restored without training data and scores new samples identically."""
+    columns = [f"genus_{i}" for i in range(10)]
+    df = pd.DataFrame(mock_data, index=mock_labels, columns=columns)
+    dyspyosis = Dyspyosis(data=df, rarefication_depth=1000)
+    dyspyosis.run_training(epochs=2)
+
+    dyspyosis.save(tmp_path / "model")
+    loaded = Dyspyosis.load(tmp_path / "model")
+
+    assert loaded.x_train is None and loaded.data is None
+    assert loaded.columns == columns
+    assert loaded.rarefication_depth == 1000
+
+    expected = dyspyosis.score_new(df)
+    scores = loaded.score_new(df)
+    assert scores["label"].tolist() == mock_labels
+    assert np.allclose(scores["loss"], expected["loss"])
+    assert np.allclose(scores["L1"], expected["L1"])
+
+    # Columns are aligned by name, unknown features are dropped
+    shuffled = df[columns[::-1]].assign(unknown=1)
+    assert np.allclose(loaded.score_new(shuffled)["loss"], expected["loss"])
+
+    # Chunking doesn't change the output shape
+    assert loaded.score_new(df.values, columns=columns, chunk_size=30).shape == (100, 5)
+
+
+def test_score_new_missing_features(capsys, dyspyosis_instance, mock_data):
+    scores = dyspyosis_instance.score_new(mock_data)
+    assert scores.shape == (100, 5)
+
+    with pytest.raises(ValueError):
+        dyspyosis_instance.score_new(mock_data[:, :5])
+
+    dyspyosis_instance.columns = list("abcdefghij")
+    scores = dyspyosis_instance.score_new(mock_data[:, :5], columns=list("abcde"))
+    assert scores.shape == (100, 5)
+    assert "missing" in capsys.readouterr().out
+
+
+def test_ensemble(tmp_path, mock_data, mock_labels):
+    dyspyosis = Dyspyosis(
+        mock_data, labels=mock_labels, rarefication_depth=1000, ensemble_size=3
+    )
+    dyspyosis.run_training(epochs=2)
+
+    scores = dyspyosis.score()
+    assert list(scores.columns[:6]) == [
+        "label",
+        "loss",
+        "loss_std",
+        "loss_m1",
+        "loss_m2",
+        "loss_m3",
+    ]
+    assert scores.shape == (100, 6 + 3 * 4)
+    members = scores[["loss_m1", "loss_m2", "loss_m3"]]
+    assert np.allclose(scores["loss"], members.mean(axis=1))
+    assert np.allclose(dyspyosis.compute_loss()["loss"], scores["loss"])
+    latent = dyspyosis.get_latent()
+    assert list(latent.columns[:5]) == ["m1_L1", "m1_L2", "m1_L3", "m1_L4", "m2_L1"]
+    assert "m3_L4_mean" in dyspyosis.score_rarefied(repeats=3, latent=True)
+
+    dyspyosis.save(tmp_path / "model")
+    loaded = Dyspyosis.load(tmp_path / "model")
+    assert loaded.ensemble_size == 3
+    new = loaded.score_new(mock_data[:5])
+    assert np.allclose(new["loss_m2"], dyspyosis.score_new(mock_data[:5])["loss_m2"])
+
+    with pytest.raises(ValueError):
+        dyspyosis.export(tmp_path / "model.npz")
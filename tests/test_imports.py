@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import dyspyosis
+
+HEAVY_MODULES = ["tensorflow", "keras", "sklearn"]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import dyspyosis",
+        "import dyspyosis.utils",
+        "from dyspyosis.utils import rarefy, build_dataset, scale_data",
+        "from dyspyosis import Dyspyosis",
+        "from dyspyosis.inference import NumpyModel",
+        "from dyspyosis.cli import main",
+        "from dyspyosis.store import TrainingStore",
+        "from dyspyosis.runtime import configure_threads",
+        "from dyspyosis import runner; runner._init_job_worker(1, False, None, None, None, None)",
+        (
+            "import numpy as np; from dyspyosis import Dyspyosis; "
+            "Dyspyosis(np.ones((20, 5)), rarefication_depth=5, backend='numpy').run_training(2, verbose=0)"
+        ),
+    ],
+)
+def test_import_is_lightweight(statement):
+    """Importing dyspyosis for data preparation or NumPy scoring doesn't load TensorFlow."""
+    code = f"""
+import sys
+{statement}
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+assert not loaded, f"{{loaded}} imported by: {statement}"
+"""
+    # Run in a fresh interpreter, that can find the package under test
+    env = dict(os.environ, PYTHONPATH=str(Path(dyspyosis.__file__).parents[1]))
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("broken", [False, True])
+def test_missing_tensorflow(tmp_path, broken):
+    """Without TensorFlow the numpy backend works and the tensorflow backend asks for it, if TensorFlow is
+    installed but fails to import that error is raised as is."""
+    if broken:
+        (tmp_path / "tensorflow").mkdir()
+        (tmp_path / "tensorflow" / "__init__.py").write_text(
+            'raise ImportError("libtensorflow_framework.so.2: cannot open shared object file")'
+        )
+        setup, expected = "", "libtensorflow_framework"
+    else:
+        setup, expected = 'sys.modules["tensorflow"] = None', 'backend="numpy"'
+
+    code = f"""
+import sys
+{setup}
+import numpy as np
+from dyspyosis import Dyspyosis
+
+Dyspyosis(np.ones((20, 5)), rarefication_depth=5, backend="numpy").run_training(2, verbose=0)
+try:
+    Dyspyosis(np.ones((20, 5)), rarefication_depth=5)
+except ImportError as e:
+    assert {expected!r} in str(e), e
+else:
+    raise AssertionError("No ImportError")
+"""
+    path = [str(tmp_path), str(Path(dyspyosis.__file__).parents[1])]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_lazy_attributes():
+    assert dyspyosis.Dyspyosis.__name__ == "Dyspyosis"
+    assert dyspyosis.NumpyModel.__name__ == "NumpyModel"
+
+    # Including the names exported by "from dyspyosis.dyspyosis import *" before the imports became lazy
+    for name in [
+        "rarefy",
+        "build_dataset",
+        "scale_data",
+        "create_autoencoder",
+        "get_loss",
+        "get_latent",
+    ]:
+        assert name in dyspyosis.__all__
+    for name in dyspyosis.__all__:
+        assert getattr(dyspyosis, name).__name__ == name
+    assert "rarefy" in dir(dyspyosis)
+
+    with pytest.raises(AttributeError):
+        _ = dyspyosis.does_not_exist
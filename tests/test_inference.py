@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+from dyspyosis import Dyspyosis
+from dyspyosis.inference import NumpyModel
+
+
+@pytest.fixture
+def trained_instance():
+    """Creates and briefly trains an instance of Dyspyosis with mock data."""
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    columns = [f"genus_{i}" for i in range(10)]
+    dyspyosis = Dyspyosis(
+        data=pd.DataFrame(data, columns=columns), rarefication_depth=1000
+    )
+    dyspyosis.run_training(epochs=2)
+
+    return dyspyosis
+
+
+def test_matches_keras(tmp_path, trained_instance):
+    """The NumPy model reproduces the loss and latent space of the Keras model."""
+    trained_instance.export(tmp_path / "model.npz")
+    model = NumpyModel.load(tmp_path / "model.npz")
+
+    assert model.columns == trained_instance.columns
+    assert model.rarefication_depth == 1000
+
+    loss = trained_instance.compute_loss()["loss"].values
+    latent = trained_instance.get_latent().values
+
+    assert model.get_loss(trained_instance.scaled_data).dtype == np.float32
+    assert np.allclose(
+        model.get_loss(trained_instance.scaled_data, chunk_size=7),
+        loss,
+        rtol=1e-5,
+        atol=1e-7,
+    )
+    assert np.allclose(
+        model.get_latent(trained_instance.scaled_data), latent, rtol=1e-5, atol=1e-7
+    )
+
+    # Sparse input gives the same result
+    assert np.allclose(
+        model.get_loss(sp.csr_matrix(trained_instance.scaled_data)),
+        loss,
+        rtol=1e-5,
+        atol=1e-7,
+    )
+
+
+def test_score_new(tmp_path, trained_instance):
+    """Scoring new samples matches Dyspyosis.score_new, also when loading a saved directory."""
+    new = pd.DataFrame(
+        np.random.default_rng(1).integers(0, high=1000, size=(20, 10)),
+        columns=trained_instance.columns,
+    )
+    expected = trained_instance.score_new(new)
+
+    trained_instance.save(tmp_path / "model")
+    model = NumpyModel.load(tmp_path / "model")
+    scores = model.score_new(new)
+
+    assert list(scores.columns) == list(expected.columns)
+    assert np.allclose(scores["loss"], expected["loss"], rtol=1e-5, atol=1e-7)
+    assert np.allclose(scores["L2"], expected["L2"], rtol=1e-5, atol=1e-7)
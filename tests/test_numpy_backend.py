@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from dyspyosis import Dyspyosis
+from dyspyosis.numpy_backend import NumpyAutoencoder
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+
+
+def test_matches_keras():
+    from dyspyosis.autoencoder import create_autoencoder
+
+    x = np.random.default_rng(1).dirichlet(np.full(20, 0.3), size=128)
+    x = x.astype(np.float32)
+    model = NumpyAutoencoder(20, 4, seed=0)
+    reference = create_autoencoder(20, 4)[0]
+    reference.set_weights(model.get_weights())
+    initial = model.get_weights()
+
+    for step in range(100):
+        batch = x[step % 4 * 32 : (step % 4 + 1) * 32]
+        expected = float(reference.train_on_batch(batch, batch))
+        assert np.isclose(model.train_step(batch), expected, rtol=1e-5)
+
+    # Same updates, up to the order of floating point operations
+    for a, b, w in zip(model.get_weights(), reference.get_weights(), initial):
+        assert np.allclose(a - w, b - w, rtol=1e-3, atol=1e-4 * np.abs(b - w).max())
+
+    assert np.isclose(
+        model.evaluate(x[i : i + 50] for i in range(0, 128, 50)),
+        reference.evaluate(x, x, batch_size=50, verbose=0),
+        rtol=1e-5,
+    )
+
+
+def test_sparse_batches():
+    x = np.random.default_rng(1).dirichlet(np.full(20, 0.1), size=64)
+    x = x.astype(np.float32)
+    x[x < 0.01] = 0
+    dense, sparse = NumpyAutoencoder(20, seed=0), NumpyAutoencoder(20, seed=0)
+
+    for _ in range(5):
+        assert np.isclose(dense.train_step(x), sparse.train_step(sp.csr_matrix(x)))
+    for a, b in zip(dense.get_weights(), sparse.get_weights()):
+        assert np.allclose(a, b)
+
+
+def test_dyspyosis(tmp_path, data):
+    dyspyosis = Dyspyosis(data, rarefication_depth=1000, backend="numpy", seed=1)
+    report = dyspyosis.run_training(
+        epochs=5,
+        patience=10,
+        lr_schedule=lambda epoch, lr: 1.0,
+        validation_freq=2,
+        verbose=0,
+    )
+
+    assert report["epochs"] == 5
+    assert len(report["history"]["loss"]) == 5
+    assert len(report["history"]["val_loss"]) == 2
+    assert report["history"]["loss"][-1] < report["history"]["loss"][0]
+    assert report["best_epoch"] == 3
+
+    scores = dyspyosis.score()
+    assert np.allclose(scores["loss"], dyspyosis.compute_loss()["loss"])
+    assert scores.shape == (100, 5)
+
+    # Trained weights can be scored with the TensorFlow backend
+    dyspyosis.save(tmp_path / "model")
+    loaded = Dyspyosis.load(tmp_path / "model")
+    new = dyspyosis.score_new(data[:10])
+    assert np.allclose(loaded.score_new(data[:10])["loss"], new["loss"], rtol=1e-5)
+    assert np.allclose(
+        Dyspyosis.load(tmp_path / "model", backend="numpy").score_new(data[:10])[
+            "loss"
+        ],
+        new["loss"],
+    )
+
+
+def test_sparse_and_streaming(data):
+    for options in ({"streaming": True}, {}):
+        dyspyosis = Dyspyosis(
+            sp.csr_matrix(data), rarefication_depth=1000, backend="numpy", **options
+        )
+        report = dyspyosis.run_training(epochs=2, verbose=0)
+        assert np.isfinite(report["history"]["val_loss"]).all()
+
+
+def test_unsupported(data):
+    with pytest.raises(ValueError):
+        Dyspyosis(data, rarefication_depth=1000, backend="jax")
+    with pytest.raises(ValueError):
+        Dyspyosis(data, rarefication_depth=1000, backend="numpy", ensemble_size=2)
+    with pytest.raises(ValueError):
+        Dyspyosis(data, rarefication_depth=1000, backend="numpy", device="cpu")
+
+    dyspyosis = Dyspyosis(data, rarefication_depth=1000, backend="numpy")
+    with pytest.raises(ValueError):
+        dyspyosis.run_training(epochs=1, engine="xla")
+    with pytest.raises(ValueError):
+        dyspyosis.set_device("cpu")
@@ -0,0 +1,72 @@
+import io
+import json
+
+import numpy as np
+from dyspyosis import Dyspyosis
+from dyspyosis.profiling import JsonLines, Profiler, ProgressLog, Report
+
+
+def test_profiler():
+    report = Report()
+    profiler = Profiler(report)
+
+    with profiler.stage("outer", rows=10) as details:
+        with profiler.stage("inner"):
+            block = np.ones(2**20)
+        del block
+        details["extra"] = 1
+
+    inner, outer = report.records
+    assert inner["stage"] == "inner" and outer["stage"] == "outer"
+    assert outer["rows"] == 10 and outer["extra"] == 1
+    assert inner["peak_memory"] >= 8 * 2**20
+    # The allocation in the nested stage counts towards the peak of the enclosing one
+    assert outer["peak_memory"] >= inner["peak_memory"]
+    assert outer["wall_time"] >= inner["wall_time"]
+
+    summary = report.summary()
+    assert summary.loc["outer", "count"] == 1
+    assert summary.loc["outer", "rows_per_s"] > 0
+
+    # Without sinks nothing is measured
+    assert Profiler().start("stage") is None
+
+
+def test_json_lines():
+    stream = io.StringIO()
+    profiler = Profiler(JsonLines(stream), memory=False)
+
+    with profiler.stage("rarefy", rows=np.int64(5)):
+        pass
+
+    record = json.loads(stream.getvalue())
+    assert record["stage"] == "rarefy"
+    assert record["rows"] == 5
+    assert record["peak_memory"] is None
+
+
+def test_dyspyosis_stages():
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    report = Report()
+    stream = io.StringIO()
+
+    dyspyosis = Dyspyosis(
+        data,
+        rarefication_depth=1000,
+        profiler=Profiler(report, ProgressLog(every=2, stream=stream)),
+    )
+    dyspyosis.run_training(epochs=4, verbose=0)
+    dyspyosis.compute_loss()
+    dyspyosis.get_latent()
+
+    stages = report.to_frame()["stage"].tolist()
+    assert stages == ["rarefy", "build_model", "build_dataset", "split"] + [
+        "epoch"
+    ] * 4 + ["loss", "predict"]
+
+    epochs = report.to_frame().query("stage == 'epoch'")
+    assert epochs["epoch"].tolist() == [0, 1, 2, 3]
+    assert (epochs["rows"] == dyspyosis.x_train.shape[0]).all()
+    assert epochs["val_loss"].notna().all()
+
+    assert stream.getvalue().splitlines()[1].startswith("Epoch 4: loss=")
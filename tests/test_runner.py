@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dyspyosis import runner
+from dyspyosis.dyspyosis import Dyspyosis
+from dyspyosis.runner import config_grid, run_jobs
+
+
+@pytest.fixture
+def mock_data():
+    return np.random.default_rng(0).integers(0, high=1000, size=(60, 10))
+
+
+def test_config_grid():
+    configs = config_grid(encode_dim=[2, 3, 4], seed=[0, 1])
+    assert len(configs) == 6
+    assert configs[0] == {"encode_dim": 2, "seed": 0}
+
+
+def test_shared_dataset(mock_data):
+    """The dataset built by the runner is the one Dyspyosis generates itself."""
+    config = runner._resolve_configs([{"seed": 3, "rarefication_depth": 1000}])[0]
+    training_data, shm = runner._build(mock_data, config)
+
+    try:
+        expected = Dyspyosis(mock_data, rarefication_depth=1000, seed=3)
+        shared = Dyspyosis(
+            mock_data, rarefication_depth=1000, seed=3, training_data=training_data
+        )
+        assert np.array_equal(shared.x_train, expected.x_train)
+        assert np.array_equal(shared.x_test, expected.x_test)
+
+        # The split refers to the rows of the shared dataset, batches are gathered from it
+        assert shared.x_train.data is training_data
+        assert shared.memory_usage()["x_train"] == shared.x_train.rows.nbytes
+        shared.autoencoder.set_weights(expected.autoencoder.get_weights())
+        assert (
+            shared.run_training(epochs=2, verbose=0)["history"]
+            == expected.run_training(epochs=2, verbose=0)["history"]
+        )
+    finally:
+        shm.unlink()
+
+    with pytest.raises(ValueError):
+        Dyspyosis(mock_data, rarefication_depth=1000, training_data=mock_data)
+
+
+def test_run_jobs(monkeypatch, mock_data):
+    calls = []
+    build_dataset = runner.build_dataset
+
+    def counting(*args, **kwargs):
+        calls.append(args[0].shape)
+        return build_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(runner, "build_dataset", counting)
+
+    df = pd.DataFrame(mock_data, index=[f"s{i}" for i in range(60)])
+    cohorts = {"first": np.arange(20), "rest": np.arange(60) >= 20}
+    configs = config_grid(
+        encode_dim=[2, 3], cohort=["first", "rest"], rarefication_depth=[1000]
+    )
+    results = run_jobs(df, configs, cohorts=cohorts, epochs=2)
+
+    # One dataset per cohort, shared by both encode_dims
+    assert sorted(calls) == [(20, 10), (40, 10)]
+
+    assert len(results) == 4
+    assert results["encode_dim"].tolist() == [2, 2, 3, 3]
+    assert (results["epochs"] == 2).all()
+    assert all(len(h["val_loss"]) == 2 for h in results["history"])
+
+    scores = results["scores"][3]
+    assert scores.shape == (40, 5)
+    assert scores["label"].tolist() == [f"s{i}" for i in range(20, 60)]
+
+    with pytest.raises(ValueError):
+        run_jobs(df, [{"cohort": "unknown"}], cohorts=cohorts)
+    with pytest.raises(ValueError):
+        run_jobs(df, [{"epochs": 3}])
+
+
+def test_run_jobs_parallel(tmp_path, mock_data):
+    configs = config_grid(encode_dim=[2, 3], rarefication_depth=[1000])
+    results = run_jobs(
+        mock_data, configs, n_jobs=2, save_dir=tmp_path, epochs=2, batch_size=128
+    )
+
+    assert len(results) == 2
+    assert np.isfinite(results["val_loss"]).all()
+    assert [s.shape for s in results["scores"]] == [(60, 3), (60, 4)]
+
+    loaded = Dyspyosis.load(results["path"][1])
+    assert loaded.encode_dim == 3
+
+
+def test_run_jobs_numpy_backend(tmp_path, mock_data):
+    configs = config_grid(
+        encode_dim=[2, 3], rarefication_depth=[1000], backend=["numpy"]
+    )
+    results = run_jobs(mock_data, configs, n_jobs=2, save_dir=tmp_path, epochs=2)
+
+    assert results["backend"].tolist() == ["numpy", "numpy"]
+    assert np.isfinite(results["val_loss"]).all()
+    assert [s.shape for s in results["scores"]] == [(60, 3), (60, 4)]
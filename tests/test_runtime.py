@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+from dyspyosis import Dyspyosis
+from dyspyosis.runtime import (
+    available_devices,
+    configure_threads,
+    resolve_device,
+    select_device,
+    time_train_steps,
+)
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+
+
+def test_resolve_device():
+    assert resolve_device(None) is None
+    assert resolve_device("cpu") == "/device:CPU:0"
+    assert resolve_device("/CPU:0") == "/device:CPU:0"
+
+    with pytest.raises(ValueError):
+        resolve_device("gpu:99")
+
+
+def test_select_device():
+    device, timings = select_device("auto", 10, batch_size=32)
+    assert device in available_devices()
+    assert all(t > 0 for t in timings.values())
+
+    assert select_device("cpu", 10) == ("/device:CPU:0", {})
+    assert time_train_steps("cpu", 10, steps=2) > 0
+
+
+def test_set_device(data):
+    dyspyosis = Dyspyosis(data, rarefication_depth=1000, device="cpu")
+    assert dyspyosis.device == "/device:CPU:0"
+    dyspyosis.run_training(epochs=1, verbose=0)
+
+    weights = dyspyosis.autoencoder.get_weights()
+    iterations = int(dyspyosis.autoencoder.optimizer.iterations.numpy())
+    scores = dyspyosis.score()
+
+    # Moving rebuilds the model with the same weights and optimizer state
+    dyspyosis.set_device(None)
+    assert dyspyosis.device is None
+    for a, b in zip(dyspyosis.autoencoder.get_weights(), weights):
+        assert np.array_equal(a, b)
+    assert int(dyspyosis.autoencoder.optimizer.iterations.numpy()) == iterations
+    assert np.allclose(dyspyosis.score()["loss"], scores["loss"])
+
+    dyspyosis.set_device("auto", batch_size=32)
+    assert dyspyosis.device in available_devices()
+    dyspyosis.run_training(epochs=1, verbose=0)
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU affinity requires Linux"
+)
+def test_configure_threads(data):
+    cpus = os.sched_getaffinity(0)
+    Dyspyosis(data, rarefication_depth=1000)
+
+    # Thread pools are fixed once TensorFlow runs, the affinity is still applied
+    with pytest.raises(RuntimeError):
+        configure_threads(inter_op_threads=len(cpus) + 7, cpu_affinity=cpus)
+    assert os.sched_getaffinity(0) == cpus
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dyspyosis import Dyspyosis
+from dyspyosis.store import TrainingStore, validation_samples
+
+
+@pytest.fixture
+def counts():
+    counts = pd.DataFrame(
+        np.random.default_rng(0).integers(0, high=1000, size=(100, 10)),
+        index=[f"sample_{i}" for i in range(100)],
+        columns=[f"genus_{i}" for i in range(10)],
+    )
+    counts.iloc[[5, 50], :] = 1
+
+    return counts
+
+
+def test_validation_samples():
+    mask = validation_samples(np.arange(100000), 0.15, seed=0)
+    assert abs(mask.mean() - 0.15) < 0.01
+
+    assert np.array_equal(validation_samples(np.arange(50, 60), 0.15), mask[50:60])
+    other = validation_samples(np.arange(1000), 0.15, seed=1)
+    assert not np.array_equal(other, mask[:1000])
+
+
+def test_build(tmp_path, counts):
+    pieces = [counts.iloc[:30], counts.iloc[30:70, ::-1], counts.iloc[70:]]
+    store = TrainingStore.build(
+        pieces, tmp_path / "store", 1000, 4, low_depth_policy="drop"
+    )
+
+    assert store.columns == counts.columns.tolist()
+    kept = counts.drop(["sample_5", "sample_50"])
+    assert store.labels == kept.index.tolist()
+    assert store.sample_mask.sum() == 98
+    assert np.array_equal(store.counts, kept.values)
+
+    # Every rarefaction of a sample ends up in the same set
+    validation = validation_samples(np.flatnonzero(store.sample_mask), 0.15)
+    assert store.validation.shape == (4 * validation.sum(), 10)
+    assert store.train.shape == (4 * (~validation).sum(), 10)
+    assert (store.train.sum(axis=1) == 1000).all()
+
+    # The split doesn't depend on the chunks, the file gives the same store as equally sized chunks
+    counts.to_csv(tmp_path / "counts.csv")
+    from_file = TrainingStore.build(
+        tmp_path / "counts.csv",
+        tmp_path / "file",
+        1000,
+        4,
+        chunk_size=30,
+        low_depth_policy="drop",
+    )
+    from_chunks = TrainingStore.build(
+        [counts.iloc[i : i + 30] for i in range(0, 100, 30)],
+        tmp_path / "chunks",
+        1000,
+        4,
+        low_depth_policy="drop",
+    )
+    assert from_file.validation.shape == store.validation.shape
+    assert np.array_equal(from_file.train, from_chunks.train)
+    assert np.array_equal(from_file.rarefied, from_chunks.rarefied)
+
+    with pytest.raises(FileExistsError):
+        TrainingStore.build(pieces, tmp_path / "store", 1000, 4)
+    with pytest.raises(FileNotFoundError):
+        TrainingStore(tmp_path / "missing")
+
+
+def test_build_labels(tmp_path, counts):
+    """Numpy labels are stored as numbers, labels that json can't hold are rejected instead of turned into text."""
+    # An object index keeps numpy scalars, e.g. after concatenating tables with different kinds of labels
+    mixed = [np.int64(i) if i % 2 else f"s{i}" for i in range(100)]
+    store = TrainingStore.build(
+        [counts.set_axis(pd.Index(mixed, dtype=object))], tmp_path / "store", 1000, 4
+    )
+    assert store.labels == [
+        int(label) if i % 2 else label for i, label in enumerate(mixed)
+    ]
+    assert type(store.labels[1]) is int
+
+    dates = counts.set_axis(pd.date_range("2024-01-01", periods=100))
+    with pytest.raises(TypeError, match="Timestamp"):
+        TrainingStore.build([dates], tmp_path / "dates", 1000, 4)
+    assert not (tmp_path / "dates").exists()
+
+
+def test_from_chunks(tmp_path, counts):
+    counts.to_csv(tmp_path / "counts.tsv", sep="\t")
+    dyspyosis = Dyspyosis.from_chunks(
+        tmp_path / "counts.tsv",
+        tmp_path / "store",
+        rarefication_depth=1000,
+        chunk_size=40,
+    )
+
+    assert isinstance(dyspyosis.x_train, np.memmap)
+    assert dyspyosis.memory_usage()["x_train"] == 0
+
+    report = dyspyosis.run_training(epochs=2, validation_size=20)
+    assert np.isfinite(report["history"]["val_loss"]).all()
+
+    scores = dyspyosis.score()
+    assert scores["label"].tolist() == counts.index.tolist()
+
+    # A store can be reopened to train another model on it
+    other = Dyspyosis.from_store(tmp_path / "store", encode_dim=2)
+    assert np.array_equal(other.scaled_data, dyspyosis.scaled_data)
+    assert other.get_latent().shape == (100, 3)
@@ -0,0 +1,218 @@
+import numpy as np
+import pytest
+from dyspyosis import Dyspyosis
+from dyspyosis.training import ConvergenceMonitor, exponential_decay, step_decay
+
+
+@pytest.fixture
+def dyspyosis_instance():
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    return Dyspyosis(data=data, rarefication_depth=1000)
+
+
+def test_report(dyspyosis_instance):
+    report = dyspyosis_instance.run_training(epochs=3)
+
+    assert report["epochs"] == 3
+    assert report["wall_time"] > 0
+    assert not report["stopped_early"]
+    assert len(report["history"]["val_loss"]) == 3
+    assert dyspyosis_instance.training_report is report
+
+
+def test_early_stopping(dyspyosis_instance):
+    # With a huge min_delta the validation loss never improves after the first validation
+    report = dyspyosis_instance.run_training(
+        epochs=50, patience=2, min_delta=1.0, validation_freq=2
+    )
+
+    assert report["stopped_early"]
+    assert report["epochs"] == 6
+    assert report["best_epoch"] == 1
+    assert len(report["history"]["val_loss"]) == 3
+
+
+def test_restore_best_weights(dyspyosis_instance):
+    monitor = ConvergenceMonitor(patience=1)
+    monitor.set_model(dyspyosis_instance.autoencoder)
+    best = dyspyosis_instance.autoencoder.get_weights()
+
+    monitor.on_epoch_end(0, {"loss": 1.0, "val_loss": 1.0})
+    dyspyosis_instance.autoencoder.set_weights([w + 1 for w in best])
+    monitor.on_epoch_end(1, {"loss": 1.0})
+    monitor.on_epoch_end(2, {"loss": 1.0, "val_loss": 2.0})
+
+    assert dyspyosis_instance.autoencoder.stop_training
+    assert monitor.stopped_epoch == 2
+
+    monitor.restore_best()
+    for restored, expected in zip(dyspyosis_instance.autoencoder.get_weights(), best):
+        assert np.array_equal(restored, expected)
+
+
+def test_lr_schedule_and_validation_size(dyspyosis_instance):
+    dyspyosis_instance.run_training(
+        epochs=3, lr_schedule=lambda epoch, lr: 0.5 * 0.1**epoch, validation_size=0.1
+    )
+
+    lr = float(dyspyosis_instance.autoencoder.optimizer.learning_rate.numpy())
+    assert np.isclose(lr, 0.005)
+
+
+def test_schedules():
+    assert exponential_decay(0.5)(0, 1.0) == 1.0
+    assert exponential_decay(0.5)(3, 1.0) == 0.5
+    assert step_decay(0.1, every=10)(9, 1.0) == 1.0
+    assert step_decay(0.1, every=10)(10, 1.0) == 0.1
+
+
+def test_checkpoint_resume(tmp_path):
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+
+    def create(initial_weights=None):
+        dyspyosis = Dyspyosis(data=data, rarefication_depth=1000)
+        if initial_weights is not None:
+            dyspyosis.autoencoder.set_weights(initial_weights)
+        return dyspyosis
+
+    # Uninterrupted run
+    reference = create()
+    initial_weights = reference.autoencoder.get_weights()
+    reference.run_training(epochs=4, checkpoint_dir=tmp_path / "a", checkpoint_freq=2)
+
+    # Run that is interrupted after two epochs ...
+    interrupted = create(initial_weights)
+    interrupted.run_training(epochs=2, checkpoint_dir=tmp_path / "b", checkpoint_freq=2)
+    assert (tmp_path / "b" / "latest").read_text() == "epoch_000002"
+
+    # ... and resumed in a new process, with a differently initialized model
+    resumed = create()
+    report = resumed.run_training(
+        epochs=4, checkpoint_dir=tmp_path / "b", checkpoint_freq=2, resume=True
+    )
+
+    assert report["resumed_from"] == 2
+    assert report["epochs"] == 4
+    assert len(report["history"]["loss"]) == 4
+    assert report["history"]["loss"] == reference.training_report["history"]["loss"]
+    for a, b in zip(
+        resumed.autoencoder.get_weights(), reference.autoencoder.get_weights()
+    ):
+        assert np.array_equal(a, b)
+
+    # Resuming a finished run doesn't train any further
+    report = resumed.run_training(epochs=4, checkpoint_dir=tmp_path / "b", resume=True)
+    assert report["resumed_from"] == 4
+    assert report["history"]["loss"] == reference.training_report["history"]["loss"]
+
+    # Neither does resuming a run that stopped early, the best weights are restored
+    stopped = create(initial_weights)
+    expected = stopped.run_training(
+        epochs=10, patience=1, min_delta=1.0, checkpoint_dir=tmp_path / "c"
+    )
+    assert expected["stopped_early"]
+
+    resumed = create()
+    report = resumed.run_training(
+        epochs=10,
+        patience=1,
+        min_delta=1.0,
+        checkpoint_dir=tmp_path / "c",
+        resume=True,
+    )
+    assert report["stopped_early"]
+    assert report["epochs"] == expected["epochs"]
+    for a, b in zip(
+        resumed.autoencoder.get_weights(), stopped.autoencoder.get_weights()
+    ):
+        assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize("engine", ["graph", "xla"])
+def test_compiled_engine(engine):
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    reference = Dyspyosis(data=data, rarefication_depth=1000)
+    compiled = Dyspyosis(data=data, rarefication_depth=1000)
+    compiled.autoencoder.set_weights(reference.autoencoder.get_weights())
+
+    # Same batches and loss as fit, in calls of 3 steps (the last batch of an epoch is smaller)
+    expected = reference.run_training(epochs=3, batch_size=16, patience=5)
+    report = compiled.run_training(
+        epochs=3, batch_size=16, patience=5, engine=engine, steps_per_call=3
+    )
+
+    assert report["epochs"] == 3
+    for key in ("loss", "val_loss"):
+        assert np.allclose(report["history"][key], expected["history"][key], rtol=1e-4)
+    assert report["best_epoch"] == expected["best_epoch"]
+    for a, b in zip(
+        compiled.autoencoder.get_weights(), reference.autoencoder.get_weights()
+    ):
+        assert np.allclose(a, b, atol=1e-6)
+
+
+def test_compiled_engine_requires_dense_data():
+    data = np.random.default_rng(0).integers(0, high=1000, size=(100, 10))
+    dyspyosis = Dyspyosis(data=data, rarefication_depth=1000, streaming=True)
+
+    with pytest.raises(ValueError):
+        dyspyosis.run_training(epochs=1, engine="xla")
+    with pytest.raises(ValueError):
+        dyspyosis.run_training(epochs=1, engine="jax")
+
+
+def test_update(tmp_path):
+    data = np.random.default_rng(0).integers(0, high=1000, size=(120, 10))
+    labels = [f"sample_{i}" for i in range(120)]
+    dyspyosis = Dyspyosis(data=data[:100], labels=labels[:100], rarefication_depth=1000)
+    dyspyosis.run_training(epochs=3, verbose=0)
+    old_train, old_test = dyspyosis.x_train, dyspyosis.x_test
+
+    # A failed update leaves the model as it was
+    with pytest.raises(ValueError):
+        dyspyosis.update(data[100:], labels=labels[100:], epochs=1, engine="jax")
+    assert dyspyosis.x_train is old_train and dyspyosis.x_test is old_test
+    assert dyspyosis.data.shape[0] == 100
+
+    # The sample below the depth is dropped, only the new samples are expanded
+    new = data[100:].copy()
+    new[0] = 1
+    report = dyspyosis.update(
+        new,
+        labels=labels[100:],
+        epochs=2,
+        low_depth_policy="drop",
+        reference_epochs=2,
+        verbose=0,
+    )
+
+    assert report["samples"] == 19
+    assert report["rows"]["new"] == report["rows"]["replay"] == 161
+    assert report["training"]["epochs"] == 2
+    assert report["retrain"]["training"]["epochs"] == 2
+    for key in ("old", "new"):
+        assert np.isclose(
+            report["drift"][key],
+            report["loss_after"][key] - report["loss_before"][key],
+        )
+        assert np.isfinite(report["retrain"]["difference"][key])
+
+    assert dyspyosis.sample_mask.tolist() == [True] * 100 + [False] + [True] * 19
+    assert dyspyosis.labels == labels[:100] + labels[101:]
+    assert np.array_equal(dyspyosis.data[100:], data[101:])
+    assert np.array_equal(dyspyosis.x_train[: old_train.shape[0]], old_train)
+    assert dyspyosis.x_train.shape[0] == old_train.shape[0] + 161
+    assert dyspyosis.x_test.shape[0] == old_test.shape[0] + 29
+    assert dyspyosis.score()["label"].tolist() == dyspyosis.labels
+
+    with pytest.raises(ValueError):
+        dyspyosis.update(data[100:], epochs=1)
+
+    dyspyosis.save(tmp_path / "model")
+    with pytest.raises(ValueError):
+        Dyspyosis.load(tmp_path / "model").update(data[100:], epochs=1)
+
+    # Stacking would copy the whole shared dataset, models using one can't be updated
+    cached = Dyspyosis(data[:100], rarefication_depth=1000, cache=tmp_path / "cache")
+    with pytest.raises(ValueError, match="sharing"):
+        cached.update(data[100:], epochs=1)
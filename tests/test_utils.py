@@ -1,5 +1,19 @@
 import numpy as np
-from dyspyosis.utils import rarefy, scale_data, build_dataset
+import pytest
+import scipy.sparse as sp
+from dyspyosis import utils
+from dyspyosis.utils import (
+    align_columns,
+    rarefy,
+    scale_data,
+    build_dataset,
+    check_depth,
+    count_dtype,
+    drop_samples,
+    rarefied_batches,
+    shuffled_batches,
+    split_rows,
+)
 
 
 def test_rarefy(capsys):
@@ -36,6 +50,31 @@ def test_scale_data():
     )
 
 
+def test_compact_dtypes():
+    """Counts are stored as small unsigned integers, scaling gives the float64 result rounded to float32."""
+    assert count_dtype(5000) == np.uint16
+    assert count_dtype(2**16) == np.uint32
+
+    data = np.random.default_rng(0).integers(0, 1000, size=(50, 20))
+    output = build_dataset(data, 5000, iterations=4, seed=1)
+    assert output.dtype == np.uint16
+    assert rarefy(data, 100000).dtype == np.uint32
+    assert rarefy(sp.csr_matrix(data), 5000).dtype == np.uint16
+
+    # Identical to scaling the float64 counts and casting them to float32, as the model did before
+    scaled = scale_data(output, 5000)
+    assert scaled.dtype == np.float32
+    assert np.array_equal(scaled, (output.astype(np.float64) / 5000).astype(np.float32))
+
+    sparse = scale_data(sp.csr_matrix(output), 5000)
+    assert sparse.dtype == np.float32
+    assert np.array_equal(sparse.toarray(), scaled)
+
+    batches = list(shuffled_batches(output, 64, seed=2, rarefication_depth=5000))
+    order = np.random.default_rng(2).permutation(output.shape[0])
+    assert np.array_equal(np.concatenate(batches), scaled[order])
+
+
 def test_build_dataset():
     data = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
     iterations = 10
@@ -47,3 +86,237 @@ def test_build_dataset():
     # Validate output dimensions and sum per row
     assert output.shape == (iterations * data.shape[0], data.shape[1])
     assert np.all(np.sum(output, axis=1) == rarefication_depth)
+
+
+def test_rarefy_reproducible():
+    data = np.random.default_rng(1).integers(0, 100, size=(20, 8))
+
+    first = rarefy(data, rarefication_depth=50, seed=3)
+    second = rarefy(data, rarefication_depth=50, seed=3)
+    other = rarefy(data, rarefication_depth=50, seed=4)
+
+    assert np.array_equal(first, second), "Same seed should give identical output"
+    assert not np.array_equal(first, other), "Different seeds should differ"
+
+    # Features without reads can never be sampled
+    assert np.all(first[data == 0] == 0)
+
+    # Writing into a preallocated array
+    out = np.zeros(data.shape)
+    result = rarefy(data, rarefication_depth=50, seed=3, out=out)
+    assert result is out
+    assert np.array_equal(out, first)
+
+
+def test_build_dataset_reproducible():
+    data = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    first = build_dataset(data, 100, iterations=5, seed=7)
+    second = build_dataset(data, 100, iterations=5, seed=7)
+
+    assert np.array_equal(first, second), "Same seed should give identical output"
+
+    # Expected counts should approach the relative frequencies
+    output = build_dataset(data, 1000, iterations=200, seed=0)
+    observed = output.reshape(200, 3, 3).mean(axis=0)
+    expected = 1000 * data / data.sum(axis=1, keepdims=True)
+    assert np.allclose(observed, expected, rtol=0.05)
+
+
+def test_rarefy_without_replacement():
+    data = np.random.default_rng(2).integers(0, 50, size=(30, 6))
+    data[:, 0] += 100
+
+    output = rarefy(data, rarefication_depth=100, seed=1, mode="without_replacement")
+
+    assert np.all(np.sum(output, axis=1) == 100)
+    assert np.all(output <= data), "Cannot draw more reads than present"
+    assert np.array_equal(
+        output, rarefy(data, rarefication_depth=100, seed=1, mode="without_replacement")
+    )
+
+    # Rarefying to the full depth returns the original counts
+    full = np.array([[3, 0, 2], [1, 1, 3]])
+    assert np.array_equal(rarefy(full, 5, mode="without_replacement"), full)
+
+    # Samples below the depth keep all their reads
+    output = rarefy(full, 10, mode="without_replacement")
+    assert np.array_equal(output, full)
+
+    with pytest.raises(ValueError):
+        rarefy(np.array([[0.5, 0.5]]), 1, mode="without_replacement")
+
+    with pytest.raises(ValueError):
+        rarefy(full, 2, mode="bootstrap")
+
+
+def test_build_dataset_without_replacement():
+    data = np.array([[10, 20, 30], [40, 50, 60], [7, 8, 9]])
+
+    output = build_dataset(data, 20, iterations=4, seed=0, mode="without_replacement")
+
+    assert output.shape == (12, 3)
+    assert np.all(np.sum(output, axis=1) == 20)
+    assert np.all(output.reshape(4, 3, 3) <= data)
+
+
+def test_low_depth_policy(capsys):
+    data = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    assert np.array_equal(check_depth(data, 10), [True, True, True])
+    assert "Warning" in capsys.readouterr().out
+
+    assert np.array_equal(check_depth(data, 10, "drop"), [False, True, True])
+    assert np.array_equal(check_depth(data, 6, "error"), [True, True, True])
+
+    with pytest.raises(ValueError):
+        check_depth(data, 10, "error")
+
+    with pytest.raises(ValueError):
+        check_depth(data, 10, "ignore")
+
+    kept, labels = drop_samples(data, ["a", "b", "c"], check_depth(data, 10, "drop"))
+    assert np.array_equal(kept, data[1:])
+    assert labels == ["b", "c"]
+
+    output = rarefy(data, 10, low_depth_policy="drop")
+    assert output.shape == (2, 3)
+
+    output = build_dataset(data, 10, iterations=3, low_depth_policy="drop")
+    assert output.shape == (6, 3)
+
+    capsys.readouterr()
+    output = rarefy(data, 10, low_depth_policy=None)
+    assert output.shape == (3, 3)
+    assert capsys.readouterr().out == ""
+
+
+def test_build_dataset_n_jobs(monkeypatch):
+    data = np.random.default_rng(0).integers(1, 100, size=(50, 8))
+
+    # Force the dataset to be split in many shards
+    monkeypatch.setattr(utils, "_BLOCK_ELEMENTS", 8 * 16)
+
+    serial = build_dataset(data, 500, iterations=6, seed=3)
+    parallel = build_dataset(data, 500, iterations=6, seed=3, n_jobs=3)
+
+    assert np.array_equal(serial, parallel), "Output should not depend on n_jobs"
+    assert np.all(np.sum(parallel, axis=1) == 500)
+
+    parallel = build_dataset(
+        data, 200, iterations=6, seed=3, mode="without_replacement", n_jobs=2
+    )
+    serial = build_dataset(data, 200, iterations=6, seed=3, mode="without_replacement")
+    assert np.array_equal(serial, parallel)
+
+
+def test_rarefied_batches():
+    data = np.random.default_rng(0).integers(1, 100, size=(10, 5))
+
+    batches = rarefied_batches(data, 200, batch_size=4, seed=1)
+    first_pass = [next(batches) for _ in range(3)]
+
+    assert [b.shape for b in first_pass] == [(4, 5), (4, 5), (2, 5)]
+    assert all(b.dtype == np.float32 for b in first_pass)
+    assert np.allclose(np.concatenate(first_pass).sum(axis=1), 1.0)
+
+    # The stream is endless and reproducible
+    assert next(batches).shape == (4, 5)
+    again = rarefied_batches(data, 200, batch_size=4, seed=1)
+    assert np.array_equal(next(again), first_pass[0])
+
+
+def test_rarefy_sparse():
+    dense = np.random.default_rng(0).integers(0, 100, size=(40, 30))
+    dense[dense < 80] = 0
+    dense[:, 0] += 50
+    data = sp.csr_matrix(dense)
+
+    for mode in ["with_replacement", "without_replacement"]:
+        output = rarefy(data, rarefication_depth=40, seed=2, mode=mode)
+
+        assert sp.issparse(output), "Sparse input should give sparse output"
+        assert output.shape == data.shape
+        assert np.all(np.asarray(output.sum(axis=1)).ravel() == 40)
+        assert np.all(output.toarray()[dense == 0] == 0)
+
+        again = rarefy(data, rarefication_depth=40, seed=2, mode=mode)
+        assert (output != again).nnz == 0, "Same seed should give identical output"
+
+    output = rarefy(data, 40, mode="without_replacement").toarray()
+    assert np.all(output <= dense)
+
+    # Sparse rarefaction follows the same distribution as the dense one
+    expanded = build_dataset(data, 1000, iterations=100, seed=0)
+    observed = expanded.toarray().reshape(100, 40, 30).mean(axis=0)
+    expected = 1000 * dense / dense.sum(axis=1, keepdims=True)
+    assert np.allclose(observed, expected, atol=0.1 * 1000 / 2)
+
+
+def test_build_dataset_sparse(monkeypatch):
+    dense = np.random.default_rng(0).integers(0, 10, size=(30, 20))
+    dense[dense < 6] = 0
+    dense[:, 0] += 20
+    data = sp.csr_matrix(dense)
+
+    monkeypatch.setattr(utils, "_BLOCK_ELEMENTS", 40)
+
+    serial = build_dataset(data, 20, iterations=4, seed=1)
+    parallel = build_dataset(data, 20, iterations=4, seed=1, n_jobs=2)
+
+    assert sp.issparse(serial)
+    assert serial.shape == (120, 20)
+    assert (serial != parallel).nnz == 0, "Output should not depend on n_jobs"
+
+    scaled = scale_data(serial, 20)
+    assert sp.issparse(scaled)
+    assert np.allclose(np.asarray(scaled.sum(axis=1)).ravel(), 1.0)
+
+
+def test_align_columns():
+    data = np.array([[1, 2, 3], [4, 5, 6]])
+
+    output, missing = align_columns(data, ["a", "b", "c"], ["c", "x", "a"])
+    assert np.array_equal(output, [[3, 0, 1], [6, 0, 4]])
+    assert missing == ["x"]
+
+    output, missing = align_columns(
+        sp.csr_matrix(data), ["a", "b", "c"], ["c", "x", "a"]
+    )
+    assert sp.issparse(output)
+    assert np.array_equal(output.toarray(), [[3, 0, 1], [6, 0, 4]])
+
+    with pytest.raises(ValueError):
+        align_columns(data, ["a", "a", "c"], ["a"])
+
+
+def test_split_rows():
+    data = np.random.default_rng(0).integers(0, 100, size=(101, 3))
+
+    # The rows sklearn's train_test_split(data, test_size=0.15, random_state=3) returns
+    # fmt: off
+    train_rows = [
+        82, 23, 59, 45, 93, 12, 8, 4, 80, 87, 17, 83, 47, 50, 30, 5, 13, 31, 89, 11, 58, 86,
+        32, 40, 16, 27, 35, 36, 70, 91, 64, 77, 75, 46, 53, 71, 67, 61, 18, 92, 57, 96, 54,
+        55, 28, 52, 85, 79, 90, 49, 88, 37, 48, 33, 43, 7, 62, 100, 29, 69, 51, 1, 60, 63,
+        2, 66, 22, 81, 26, 14, 39, 44, 20, 38, 95, 10, 41, 74, 19, 21, 0, 72, 56, 3, 24,
+    ]
+    # fmt: on
+    test_rows = [94, 68, 6, 65, 73, 84, 99, 42, 25, 15, 78, 9, 97, 98, 34, 76]
+
+    for x in (data, sp.csr_matrix(data)):
+        train, test = split_rows(x, 0.15, seed=3)
+        for subset, rows in zip((train, test), (train_rows, test_rows)):
+            assert type(subset) is type(x)
+            assert np.array_equal(sp.csr_matrix(subset).toarray(), data[rows])
+
+
+def test_split_rows_without_copy():
+    data = np.random.default_rng(0).integers(0, 100, size=(101, 3))
+    train, test = split_rows(data, 0.15, seed=3, copy=False)
+
+    assert train.data is data and test.data is data
+    assert train.shape == (85, 3) and len(test) == 16
+    for subset, expected in zip((train, test), split_rows(data, 0.15, seed=3)):
+        assert np.array_equal(subset, expected)
+        assert np.array_equal(subset[[4, 0, 2]], expected[[4, 0, 2]])